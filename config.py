@@ -1 +1,5 @@
 DEBUG=True
+# memory budget of the in-process cache of repo responses
+REPO_CACHE_BYTES=256*1024*1024
+# processes running background imports
+IMPORT_WORKERS=1
@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+
+
+def fileKey(path):
+    """Changes whenever the file at path is rewritten or replaced"""
+    stat = path.stat()
+    return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+
+class RepoCache:
+    """Serialized responses by repo name, least recently used evicted first
+    once their total size goes over the memory budget (in bytes).
+
+    An entry is only valid for the key (see fileKey) of the file it was built from.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict()  # (key: repo name, value: (file key, bytes))
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, name, path, build):
+        """The response of repo name, built from path by build(path) if not cached"""
+        key = fileKey(path)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and entry[0] == key:
+                self.entries.move_to_end(name)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        response = build(path)
+        self.put(name, key, response)
+        return response
+
+    def put(self, name, key, response):
+        with self.lock:
+            previous = self.entries.pop(name, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            if len(response) > self.budget:
+                return  # would evict everything else
+            self.entries[name] = (key, response)
+            self.size += len(response)
+            while self.size > self.budget:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+class RepoCatalog:
+    """The imported repos in the data directory, with their data file's size & mtime.
+    Only rescanned when the directory changes (files added, removed or replaced)."""
+
+    def __init__(self, dirPath, suffixes):
+        self.dirPath = dirPath
+        self.suffixes = suffixes  # in order of preference
+        self.key = None
+        self.repos = OrderedDict()  # (key: repo name, value: {path, size, mtime})
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        key = fileKey(self.dirPath)
+        with self.lock:
+            if key == self.key:
+                self.hits += 1
+                return self.repos
+            self.misses += 1
+        repos = dict()
+        for suffix in reversed(self.suffixes):
+            for path in self.dirPath.glob('*' + suffix):
+                stat = path.stat()
+                repos[path.stem] = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime}
+        repos = OrderedDict(sorted(repos.items()))
+        with self.lock:
+            self.key, self.repos = key, repos
+        return repos
+
+    def names(self):
+        return list(self.refresh().keys())
+
+    def path(self, name):
+        """Path of the repo's preferred data file"""
+        return self.refresh()[name]['path']
+
+    def stats(self):
+        with self.lock:
+            return {'repos': len(self.repos), 'hits': self.hits, 'misses': self.misses}
+
+
+class OpenFiles:
+    """Files kept open (e.g. memory mapped) by repo name, reopened when they change.
+    If given, close(opened) is called on those replaced by a reopened file."""
+
+    def __init__(self, opener, close=None):
+        self.opener = opener
+        self.close = close
+        self.files = dict()  # (key: repo name, value: (file key, opened file))
+        self.lock = threading.Lock()
+
+    def get(self, name, path):
+        key = fileKey(path)
+        with self.lock:
+            entry = self.files.get(name)
+            if entry is not None and entry[0] == key:
+                return entry[1]
+        opened = self.opener(path)
+        with self.lock:
+            previous = self.files.get(name)
+            self.files[name] = (key, opened)
+        if previous is not None and self.close is not None:
+            self.close(previous[1])
+        return opened
@@ -0,0 +1,128 @@
+import json
+import os
+
+
+class Stream:
+    """A JSON array whose elements are produced one by one while encoding"""
+
+    def __init__(self, elements):
+        self.elements = elements
+
+
+class Object:
+    """A JSON object given as (key, value) pairs, values possibly Streams"""
+
+    def __init__(self, items):
+        self.items = items
+
+
+class Analysis:
+    """The result of analyzing a repo: its commits as columns
+    (a table.CommitTable, latest commit first) and the rest of the response"""
+
+    def __init__(self, commits, author_names, author_emails, summary):
+        self.commits = commits
+        self.author_names = author_names  # main name of each author id in commits.authors
+        self.author_emails = author_emails  # main email of each author id in commits.authors
+        # authors, low_commit_authors, time_extent, line_stats,
+        # filestats_line_stats & files_with_max_commits of the response
+        self.summary = summary
+
+    def commit_descriptions(self, start=0, stop=None):
+        """Dict representations of the commits in [start, stop)"""
+        commits = self.commits.slice(start, stop)
+        return commits.descriptions(self.author_names, self.author_emails)
+
+    def response_dict(self):
+        """Returns the dict that is served (and stored) as JSON"""
+        return response_dict(self.commit_descriptions(), self.summary)
+
+    def response_items(self):
+        """(key, value) pairs of response_dict(), with the per commit arrays as Streams"""
+        return [
+            ('commits', Stream(self.commits.iter_descriptions(self.author_names, self.author_emails))),
+            ('authors', self.summary['authors']),
+            ('low_commit_authors', self.summary['low_commit_authors']),
+            ('time_extent', self.summary['time_extent']),
+            ('times', Stream(self.commits.iter_time_strings())),
+            ('line_stats', self.summary['line_stats']),
+            ('filestats_line_stats', self.summary['filestats_line_stats']),
+            ('files_with_max_commits', self.summary['files_with_max_commits'])
+        ]
+
+    def iter_json(self, indent=None, envelope=None):
+        """Yields the JSON of response_dict() in pieces, the same text json.dumps
+        gives, without holding all of the commits' dicts at once.
+        With an envelope key the response is wrapped as {envelope: response}."""
+        response = Object(self.response_items())
+        if envelope is not None:
+            response = Object([(envelope, response)])
+        return iterencode(response, indent, 0)
+
+
+def response_dict(commit_descriptions, summary):
+    return {
+        'commits': commit_descriptions,
+        'authors': summary['authors'],
+        'low_commit_authors': summary['low_commit_authors'],
+        'time_extent': summary['time_extent'],
+        'times': [commit['time'] for commit in reversed(commit_descriptions)],
+        'line_stats': summary['line_stats'],
+        'filestats_line_stats': summary['filestats_line_stats'],
+        'files_with_max_commits': summary['files_with_max_commits']
+    }
+
+
+def iterencode(value, indent, level):
+    if isinstance(value, Stream):
+        return iterencode_array(value.elements, indent, level)
+    if isinstance(value, Object):
+        return iterencode_object(value.items, indent, level)
+    text = json.dumps(value, indent=indent)
+    if indent is not None and level:
+        text = text.replace('\n', '\n' + ' ' * (indent * level))
+    return iter([text])
+
+
+def iterencode_array(elements, indent, level):
+    """Encodes like json.dumps for a list, reading the elements from an iterator"""
+    separator, opening, closing = item_layout(indent, level)
+    first = True
+    for element in elements:
+        yield ('[' + opening) if first else separator
+        first = False
+        yield from iterencode(element, indent, level + 1)
+    yield '[]' if first else (closing + ']')
+
+
+def iterencode_object(items, indent, level):
+    """Encodes the (key, value) pairs like json.dumps for a dict"""
+    separator, opening, closing = item_layout(indent, level)
+    if not items:
+        yield '{}'
+        return
+    yield '{' + opening
+    for i, (key, value) in enumerate(items):
+        if i:
+            yield separator
+        yield json.dumps(key) + ': '
+        yield from iterencode(value, indent, level + 1)
+    yield closing + '}'
+
+
+def item_layout(indent, level):
+    """(separator, text after the opening bracket, text before the closing one)"""
+    if indent is None:
+        return ', ', '', ''
+    inner = '\n' + ' ' * (indent * (level + 1))
+    return ',' + inner, inner, '\n' + ' ' * (indent * level)
+
+
+def write_json(path, pieces):
+    """Sink: writes the pieces of text to a temporary file next to path, then
+    renames it into place, so that readers only ever see a complete file"""
+    tmpPath = str(path) + '.tmp'
+    with open(tmpPath, 'w') as f:
+        for piece in pieces:
+            f.write(piece)
+    os.replace(tmpPath, str(path))
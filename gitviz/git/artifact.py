@@ -0,0 +1,242 @@
+"""Compact binary form of an analyzed repo, stored as gitviz/data/<repo>.gvz
+
+Layout (little endian):
+    header      magic, format version, number of sections, number of commits
+    sections    (name, offset, length) for each section
+    data        each section, aligned to 8 bytes
+
+Commit columns are arrays of COLUMN_TYPES, latest commit first. String tables
+(messages, author names & emails) are a uint64 count, count+1 uint64 offsets,
+then the UTF-8 bytes. The rest of the response is a JSON 'summary'.
+A time index (the commit epochs sorted, and the commit indices in that order)
+allows binary searching commits by time. The 'rollups' section holds the
+pre-aggregated histograms & author rhythms, as JSON, and 'meta' what the
+import recorded about itself (e.g. the HEAD that was analyzed), as JSON.
+The directory tree (see dirtree.py) is stored as its dir_* arrays and the
+'dir_names' string table. Imports of several refs store their names
+('ref_names') and which of them reach each commit ('ref_bits', a row of
+bytes per commit, bit i of the row for ref i, see refs.py). The line
+ownership of the top files, now and at checkpoints, is the JSON 'ownership'.
+The file is memory mapped when read, so columns are sliced without parsing.
+"""
+import json
+import mmap
+import os
+import pathlib
+import struct
+
+import numpy as np
+
+from . import analysis
+from . import dirtree
+from . import rollups
+from . import table
+
+MAGIC = b'GVZ\x00'
+VERSION = 1
+
+HEADER = struct.Struct('<4sIIQ')
+SECTION = struct.Struct('<16sQQ')
+ALIGNMENT = 8
+
+COLUMN_TYPES = {
+    'epochs': np.dtype('<i8'),
+    'offsets': np.dtype('<i2'),
+    'insertions': np.dtype('<i4'),
+    'deletions': np.dtype('<i4'),
+    'parents': np.dtype('<i1'),
+    'authors': np.dtype('<i4'),
+    'messages': np.dtype('<i4'),
+    'time_epochs': np.dtype('<i8'),
+    'time_order': np.dtype('<i4'),
+}
+
+
+def artifactPath(reponame):
+    return pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(reponame + '.gvz')
+
+
+def string_table_bytes(strings):
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    if encoded:
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return struct.pack('<Q', len(encoded)) + offsets.tobytes() + b''.join(encoded)
+
+
+def write(path, result, meta=None, dirs=None, membership=None, owners=None):
+    """Writes the analysis.Analysis result to path, along with the meta dict,
+    the dirtree.DirTree dirs, the membership (ref names, refs.packed() bits)
+    and the ownership.snapshots() owners"""
+    commits = result.commits
+    # author ids of the analysis are sparse (merged authors), make them dense
+    author_ids, dense_authors = np.unique(commits.authors, return_inverse=True)
+    time_order = np.argsort(commits.epochs, kind='mergesort')
+    sections = [(name, np.ascontiguousarray(getattr(commits, name), dtype=COLUMN_TYPES[name]).tobytes())
+                for name in ['epochs', 'offsets', 'insertions', 'deletions', 'parents', 'messages']]
+    sections.append(('authors', dense_authors.astype(COLUMN_TYPES['authors']).tobytes()))
+    sections.append(('time_epochs', commits.epochs[time_order].astype(COLUMN_TYPES['time_epochs']).tobytes()))
+    sections.append(('time_order', time_order.astype(COLUMN_TYPES['time_order']).tobytes()))
+    sections.append(('shas', commits.shas.tobytes()))
+    sections.append(('message_table', string_table_bytes(commits.message_table.strings)))
+    sections.append(('author_names', string_table_bytes(result.author_names[i] for i in author_ids.tolist())))
+    sections.append(('author_emails', string_table_bytes(result.author_emails[i] for i in author_ids.tolist())))
+    sections.append(('summary', json.dumps(result.summary).encode('utf-8')))
+    sections.append(('rollups', json.dumps(rollups.rollups(commits, result.author_names,
+                                                             result.author_emails)).encode('utf-8')))
+    sections.append(('meta', json.dumps(meta or {}).encode('utf-8')))
+    if dirs is not None:
+        for name, dtype in dirtree.ARRAY_TYPES.items():
+            sections.append((name, np.ascontiguousarray(dirs.arrays[name], dtype=dtype).tobytes()))
+        sections.append(('dir_names', string_table_bytes(dirs.names)))
+    if owners is not None:
+        sections.append(('ownership', json.dumps(owners).encode('utf-8')))
+    if membership is not None:
+        names, bits = membership
+        sections.append(('ref_names', string_table_bytes(names)))
+        sections.append(('ref_bits', np.ascontiguousarray(bits, dtype=np.uint8).tobytes()))
+
+    offset = aligned(HEADER.size + SECTION.size * len(sections))
+    tmpPath = str(path) + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sections), len(commits)))
+        for name, data in sections:
+            f.write(SECTION.pack(name.encode('ascii'), offset, len(data)))
+            offset = aligned(offset + len(data))
+        for name, data in sections:
+            f.seek(aligned(f.tell()))
+            f.write(data)
+    os.replace(tmpPath, str(path))
+
+
+def aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class StringSection:
+    """A string table, decoded lazily from the mapped file"""
+
+    def __init__(self, buffer, offset):
+        count = struct.unpack_from('<Q', buffer, offset)[0]
+        self.offsets = np.frombuffer(buffer, dtype='<u8', count=count + 1, offset=offset + 8)
+        self.data_offset = offset + 8 * (count + 2)
+        self.buffer = buffer
+
+    def __getitem__(self, i):
+        start = self.data_offset + int(self.offsets[i])
+        stop = self.data_offset + int(self.offsets[i + 1])
+        return self.buffer[start:stop].decode('utf-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def strings(self):
+        return [self[i] for i in range(len(self))]
+
+
+class Artifact:
+    """A .gvz file, memory mapped"""
+
+    def __init__(self, path):
+        with open(str(path), 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, section_count, self.count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} artifact'.format(path, VERSION))
+        self.sections = dict()  # (key: name, value: (offset, length))
+        for i in range(section_count):
+            name, offset, length = SECTION.unpack_from(self.buffer, HEADER.size + i * SECTION.size)
+            self.sections[name.rstrip(b'\x00').decode('ascii')] = (offset, length)
+
+    def column(self, name):
+        """The commit column, as an array backed by the mapped file"""
+        offset, _ = self.sections[name]
+        return np.frombuffer(self.buffer, dtype=COLUMN_TYPES[name], count=self.count, offset=offset)
+
+    def time_index(self):
+        """(epochs in ascending order, indices of the commits in that order)"""
+        if 'time_order' in self.sections:
+            return self.column('time_epochs'), self.column('time_order')
+        # written before the index was added
+        epochs = self.column('epochs')
+        time_order = np.argsort(epochs, kind='mergesort')
+        return epochs[time_order], time_order
+
+    def shas(self):
+        offset, length = self.sections['shas']
+        width = length // self.count if self.count else 1
+        return np.frombuffer(self.buffer, dtype='S{}'.format(width), count=self.count, offset=offset)
+
+    def array(self, name, dtype):
+        """A section of any length, as an array backed by the mapped file"""
+        offset, length = self.sections[name]
+        return np.frombuffer(self.buffer, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    def string_table(self, name):
+        offset, _ = self.sections[name]
+        return StringSection(self.buffer, offset)
+
+    def json_section(self, name):
+        offset, length = self.sections[name]
+        return json.loads(self.buffer[offset:offset + length].decode('utf-8'))
+
+    def summary(self):
+        return self.json_section('summary')
+
+    def rollups(self):
+        if 'rollups' in self.sections:
+            return self.json_section('rollups')
+        # written before rollups were added
+        return rollups.rollups(self.commits(),
+                               self.string_table('author_names'),
+                               self.string_table('author_emails'))
+
+    def meta(self):
+        if 'meta' in self.sections:
+            return self.json_section('meta')
+        return {}
+
+    def refs(self):
+        """(ref names, bits: a row of bytes per commit) of a multi-ref import, None otherwise"""
+        if 'ref_names' not in self.sections:
+            return None
+        offset, length = self.sections['ref_bits']
+        width = length // self.count if self.count else 1
+        bits = np.frombuffer(self.buffer, dtype=np.uint8, count=self.count * width, offset=offset)
+        return self.string_table('ref_names'), bits.reshape(self.count, width)
+
+    def ownership(self):
+        """The ownership.snapshots() of the top files, None if written without"""
+        if 'ownership' in self.sections:
+            return self.json_section('ownership')
+        return None
+
+    def dirtree(self):
+        """The dirtree.DirTree, None if written without it"""
+        if 'dir_names' not in self.sections:
+            return None
+        return dirtree.DirTree(self.string_table('dir_names'),
+                               {name: self.array(name, dtype) for name, dtype in dirtree.ARRAY_TYPES.items()})
+
+    def commits(self):
+        """The table.CommitTable of all commits, latest first, without copying"""
+        return table.CommitTable(self.shas(), self.column('epochs'), self.column('offsets'),
+                                 self.column('insertions'), self.column('deletions'),
+                                 self.column('parents'), self.column('authors'),
+                                 self.column('messages'), self.string_table('message_table'))
+
+    def analysis(self):
+        """The analysis.Analysis stored in the file"""
+        return analysis.Analysis(self.commits(),
+                                 self.string_table('author_names'),
+                                 self.string_table('author_emails'),
+                                 self.summary())
+
+    def response_dict(self):
+        return self.analysis().response_dict()
+
+
+def write_json(path, jsonPath):
+    """Writes the JSON of the artifact at path, for compatibility"""
+    analysis.write_json(jsonPath, Artifact(path).analysis().iter_json(indent=2))
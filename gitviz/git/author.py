@@ -1,3 +1,6 @@
+import heapq
+import math
+import re
 from enum import Enum
 
 class AuthorsInfo:
@@ -13,25 +16,6 @@ class AuthorsInfo:
         self.emails = [email]
         self.commit_indices = [commit_index]
 
-    def is_commit_author(self, commitAuthorName, commitAuthorEmail):
-        has_email = commitAuthorEmail in self.emails
-        has_name = commitAuthorName in self.names
-        return has_email or has_name
-
-    def add_commit_author(self, commit, index):
-        author = commit.author
-        has_email = author.email in self.emails
-        has_name = author.name in self.names
-        if has_email or has_name:
-            # only add if needed
-            if not has_email:
-                self.emails.append(author.email)
-            if not has_name:
-                self.names.append(author.name)
-            self.commit_indices.append(index)
-            return True
-        return False
-
     def description(self):
         """Returns a dict representation"""
         return {
@@ -42,15 +26,141 @@ class AuthorsInfo:
             'commits': self.commit_indices
         }
 
-def add_author(authors_info, commit, index):
-    for info in authors_info:
-        if info.add_commit_author(commit, index):
-            # if found, update & return
-            return info
-    # if not found, add it
-    new_info = AuthorsInfo(commit.author.name, commit.author.email, index)
-    authors_info.append(new_info)
-    return new_info
+def normalized_name(name):
+    return ' '.join(name.split()).casefold()
+
+def normalized_email(email):
+    return email.strip().lower()
+
+class AuthorIndex:
+    """Author identities looked up by normalized name and by email.
+
+    Identities sharing a name or an email are the same author; this is
+    transitive, so two authors are merged (union-find) as soon as a commit
+    bridges them. If a Mailmap is given, it is applied first.
+    """
+    def __init__(self, mailmap=None):
+        self.mailmap = mailmap
+        self.parents = []  # union-find parent of each author id
+        self.infos = []  # AuthorsInfo of each author id; only valid for roots
+        self.by_name = {}  # (key: normalized name, value: author id)
+        self.by_email = {}  # (key: normalized email, value: author id)
+
+    def find(self, author_id):
+        parents = self.parents
+        while parents[author_id] != author_id:
+            parents[author_id] = parents[parents[author_id]]  # path halving
+            author_id = parents[author_id]
+        return author_id
+
+    def union(self, first_id, second_id):
+        """Merges the two authors; the earlier one keeps its main name & email"""
+        first_id, second_id = self.find(first_id), self.find(second_id)
+        if first_id == second_id:
+            return first_id
+        if second_id < first_id:
+            first_id, second_id = second_id, first_id
+        self.parents[second_id] = first_id
+        kept, merged = self.infos[first_id], self.infos[second_id]
+        kept.names.extend(n for n in merged.names if n not in kept.names)
+        kept.emails.extend(e for e in merged.emails if e not in kept.emails)
+        kept.commit_indices = list(heapq.merge(kept.commit_indices, merged.commit_indices))
+        self.infos[second_id] = None
+        return first_id
+
+    def resolve(self, name, email):
+        if self.mailmap is not None:
+            return self.mailmap.resolve(name, email)
+        return name, email
+
+    def _ids(self, name, email):
+        """The author ids known for the (already resolved) name & email, or None"""
+        name_key, email_key = normalized_name(name), normalized_email(email)
+        name_id = self.by_name.get(name_key) if name_key else None
+        email_id = self.by_email.get(email_key) if email_key else None
+        return name_key, email_key, name_id, email_id
+
+    def add(self, name, email, index):
+        """Attribute commit index to the author (name, email). Returns its AuthorsInfo"""
+        name, email = self.resolve(name, email)
+        name_key, email_key, name_id, email_id = self._ids(name, email)
+        if name_id is None and email_id is None:
+            author_id = len(self.parents)
+            self.parents.append(author_id)
+            self.infos.append(AuthorsInfo(name, email, index))
+        else:
+            if name_id is not None and email_id is not None:
+                author_id = self.union(name_id, email_id)
+            else:
+                author_id = self.find(name_id if name_id is not None else email_id)
+            info = self.infos[author_id]
+            # only add if needed
+            if name_id is None and name_key:
+                info.names.append(name)
+            if email_id is None and email_key:
+                info.emails.append(email)
+            info.commit_indices.append(index)
+        if name_key:
+            self.by_name.setdefault(name_key, author_id)
+        if email_key:
+            self.by_email.setdefault(email_key, author_id)
+        return self.infos[author_id]
+
+    def author_id(self, name, email):
+        """The id of the author (name, email) in infos, or None"""
+        name, email = self.resolve(name, email)
+        _, _, name_id, email_id = self._ids(name, email)
+        author_id = name_id if name_id is not None else email_id
+        if author_id is None:
+            return None
+        return self.find(author_id)
+
+    def lookup(self, name, email):
+        """The AuthorsInfo for (name, email), or None"""
+        author_id = self.author_id(name, email)
+        return self.infos[author_id] if author_id is not None else None
+
+    def authors(self):
+        """All authors, in the order they were first seen"""
+        return [info for info in self.infos if info is not None]
+
+class Mailmap:
+    """Maps commit identities to canonical ones, as given by a .mailmap file"""
+    def __init__(self):
+        self.by_email = {}  # (key: commit email, value: (proper name, proper email))
+        self.by_name_email = {}  # (key: (commit name, commit email), value: (proper name, proper email))
+
+    @classmethod
+    def from_text(cls, text):
+        mailmap = cls()
+        for line in text.splitlines():
+            line = line.split('#', 1)[0]
+            parts = re.findall(r'([^<]*)<([^>]*)>', line)
+            if len(parts) == 1:
+                # Proper Name <commit@email>
+                (proper_name, commit_email), = parts
+                proper_email, commit_name = None, ''
+            elif len(parts) == 2:
+                # [Proper Name] <proper@email> [Commit Name] <commit@email>
+                (proper_name, proper_email), (commit_name, commit_email) = parts
+            else:
+                continue
+            proper = (proper_name.strip() or None, proper_email)
+            commit_name = normalized_name(commit_name)
+            if commit_name:
+                mailmap.by_name_email[(commit_name, normalized_email(commit_email))] = proper
+            else:
+                mailmap.by_email[normalized_email(commit_email)] = proper
+        return mailmap
+
+    def resolve(self, name, email):
+        """The canonical (name, email) of a commit identity"""
+        email_key = normalized_email(email)
+        proper = self.by_name_email.get((normalized_name(name), email_key)) or self.by_email.get(email_key)
+        if proper is None:
+            return name, email
+        proper_name, proper_email = proper
+        return proper_name or name, proper_email or email
 
 class LowCommitAuthorsStrategy(Enum):
     BY_LOW_COMMITTERS_COUNT = 1 # lower x committers are separated from main (high commit) authors
@@ -0,0 +1,202 @@
+"""Imports many repositories at once, optionally again and again
+
+    python -m gitviz.git.batch /path/to/mirrors
+    python -m gitviz.git.batch --manifest repos.txt --workers 4 --every 60
+    python -m gitviz.git.batch --last-days 365 --sample 0.1 /path/to/linux
+
+Repos are given as directories containing repos, or listed in a manifest
+(one path per line, # for comments). They are imported in parallel processes,
+skipping those whose HEAD (and import mode, see modes.py) are the ones their
+artifact was made from. Each run
+writes a JSON report (duration & commit count of each repo) to
+gitviz/data/reports/.
+"""
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pygit2
+
+from . import artifact
+from . import formatters
+from . import git
+from . import modes
+
+IMPORTED = 'imported'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+
+
+def reportsDirPath():
+    return pathlib.Path.cwd().joinpath('gitviz/data/reports/')
+
+
+def isRepo(path):
+    """Is path a working copy, or a bare repo (like mirrors)?"""
+    return path.joinpath('.git').exists() or (path.joinpath('HEAD').is_file() and
+                                              path.joinpath('objects').is_dir())
+
+
+def discover(dirPath):
+    """The repos directly inside dirPath (or dirPath itself, if it is one)"""
+    dirPath = pathlib.Path(dirPath)
+    if isRepo(dirPath):
+        return [str(dirPath)]
+    return [str(path) for path in sorted(dirPath.iterdir()) if path.is_dir() and isRepo(path)]
+
+
+def read_manifest(manifestPath):
+    """The repo paths listed in the manifest, relative ones being relative to it"""
+    manifestPath = pathlib.Path(manifestPath)
+    paths = []
+    for line in manifestPath.read_text().splitlines():
+        line = line.split('#')[0].strip()
+        if line:
+            paths.append(str(manifestPath.parent.joinpath(os.path.expanduser(line))))
+    return paths
+
+
+def repo_paths(dirs, manifest=None):
+    """Absolute paths of the repos to import, without duplicates, in order"""
+    paths = []
+    for dirPath in dirs:
+        paths.extend(discover(dirPath))
+    if manifest:
+        paths.extend(read_manifest(manifest))
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+
+def imported_meta(reponame):
+    """What the repo's artifact recorded of its import (HEAD sha, mode...), {} if unknown"""
+    path = artifact.artifactPath(reponame)
+    if not path.exists():
+        return {}
+    try:
+        return artifact.Artifact(path).meta()
+    except ValueError:
+        return {}  # an older format
+
+
+def import_one(repopath, full=False, profile=False, mode=None):
+    """Imports one repo, in a worker process. Returns its entry of the report."""
+    reponame = repopath.split('/')[-1]
+    entry = {'repo': reponame, 'path': repopath}
+    start_time = time.time()
+    try:
+        mode = mode or modes.ImportMode()
+        head = str(git.head_of(pygit2.Repository(repopath), mode)[0])
+        entry['head'] = head
+        meta = imported_meta(reponame)
+        if not full and meta.get('head') == head and meta.get('mode', {'kind': modes.FULL}) == mode.description():
+            entry['status'] = UNCHANGED
+        else:
+            result = git.importRepo(repopath, full=full, profile=profile, mode=mode)
+            entry['status'] = IMPORTED
+            entry['commits'] = len(result.commits)
+    except Exception as err:
+        entry['status'] = FAILED
+        entry['error'] = '{}: {}'.format(type(err).__name__, err)
+    entry['duration'] = time.time() - start_time
+    return entry
+
+
+def run(paths, workers=1, full=False, profile=False, mode=None):
+    """Imports the repos at paths, returning the run's report"""
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        repos = list(executor.map(import_one, paths, [full] * len(paths), [profile] * len(paths),
+                                  [mode] * len(paths)))
+    counts = {status: sum(1 for repo in repos if repo['status'] == status)
+              for status in [IMPORTED, UNCHANGED, FAILED]}
+    return {
+        'started': started,
+        'duration': time.time() - started,
+        'workers': workers,
+        'mode': (mode or modes.ImportMode()).description(),
+        'counts': counts,
+        'repos': repos
+    }
+
+
+def write_report(report, reportPath=None):
+    if reportPath is None:
+        reportsDirPath().mkdir(parents=True, exist_ok=True)
+        stamp = datetime.datetime.utcfromtimestamp(report['started']).strftime('%Y%m%dT%H%M%SZ')
+        reportPath = reportsDirPath().joinpath('batch-{}.json'.format(stamp))
+    pathlib.Path(reportPath).write_text(json.dumps(report, indent=2))
+    return reportPath
+
+
+def print_report(report):
+    for repo in report['repos']:
+        print('-- {status:9} {repo:30} {duration:8.1f}s {commits}'.format(
+            status=repo['status'], repo=repo['repo'], duration=repo['duration'],
+            commits=repo.get('commits', repo.get('error', ''))))
+    print('-- {imported} imported, {unchanged} unchanged, {failed} failed'.format(**report['counts']),
+          'in {:.1f}s'.format(report['duration']))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog='python -m gitviz.git.batch',
+                                     description='Imports git repositories into gitviz/data/')
+    parser.add_argument('dirs', nargs='*', metavar='DIR',
+                        help='a repo, or a directory of repos')
+    parser.add_argument('--manifest', help='file listing repo paths, one per line')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='repos imported at once (default: one per CPU)')
+    parser.add_argument('--full', action='store_true',
+                        help='rebuild every repo from scratch, even if unchanged')
+    parser.add_argument('--every', type=float, metavar='MINUTES',
+                        help='run again every MINUTES, until interrupted')
+    parser.add_argument('--profile', action='store_true',
+                        help='save a cProfile of each import to gitviz/data/profiles/')
+    parser.add_argument('--report', help='where to write the report of a single run')
+    bounds = parser.add_argument_group('bounded & sampled imports', 'analyze only part of each history')
+    bounds.add_argument('--since', type=formatters.parse_time, metavar='DATE',
+                        help='oldest commit time analyzed (ISO date, or epoch)')
+    bounds.add_argument('--until', type=formatters.parse_time, metavar='DATE',
+                        help='commits from then on are left out (ISO date, or epoch)')
+    bounds.add_argument('--last-days', type=int, metavar='N', help='only the N days before HEAD')
+    bounds.add_argument('--max-commits', type=int, metavar='N', help='only the latest N commits')
+    bounds.add_argument('--sample', type=float, metavar='FRACTION',
+                        help='keep this fraction of the commits of each month')
+    bounds.add_argument('--refs', nargs='+', metavar='PATTERN',
+                        help='walk these refs together instead of HEAD, e.g. "refs/heads/*" "v*"')
+    options = parser.parse_args(args)
+    if not options.dirs and not options.manifest:
+        parser.error('give repo directories or a --manifest')
+    try:
+        options.mode = modes.ImportMode(since=options.since, until=options.until, max_commits=options.max_commits,
+                                        last_days=options.last_days, sample=options.sample, refs=options.refs)
+    except ValueError as err:
+        parser.error(str(err))
+    return options
+
+
+def main(args=None):
+    """Command line entry point, returns the exit status"""
+    options = parse_args(args)
+    while True:
+        # rediscovered each run, for mirrors added meanwhile
+        paths = repo_paths(options.dirs, options.manifest)
+        report = run(paths, workers=options.workers, full=options.full, profile=options.profile,
+                     mode=options.mode)
+        reportPath = write_report(report, options.report if options.every is None else None)
+        print_report(report)
+        print('-- report: {}'.format(reportPath))
+        if options.every is None:
+            return 1 if report['counts'][FAILED] else 0
+        next_run = report['started'] + options.every * 60
+        try:
+            time.sleep(max(0, next_run - time.time()))
+        except KeyboardInterrupt:
+            return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,267 @@
+"""Benchmarks of the analysis on synthetic repos (see synthetic.py)
+
+    python -m gitviz.git.bench                      # time every scale, check outputs
+    python -m gitviz.git.bench --scales small --update-baseline
+
+Each benchmark is timed separately at each scale, and the results written as
+JSON. Against a baseline (results of an earlier run) a benchmark slower by
+more than the threshold fails the run. So does any output-equivalence check:
+serial vs parallel diff stats, incremental vs full imports, batched file logs
+and the file index vs a plain git log of each file, cached vs computed diff stats, and
+the streamed JSON vs json.dumps. One check is against the original implementation:
+the analysis of a fixed synthetic repo vs digests of what it gave (see
+bench_reference.json).
+"""
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import pygit2
+
+from . import artifact
+from . import diffstats
+from . import filestats
+from . import fileindex
+from . import git
+from . import importstate
+from . import renamegraph
+from . import statcache
+from . import synthetic
+
+SCALES = [
+    synthetic.Spec('small', commits=200, files=40, authors=5),
+    synthetic.Spec('medium', commits=2000, files=200, authors=30),
+    synthetic.Spec('large', commits=10000, files=1000, authors=100),
+]
+
+BASELINE_PATH = pathlib.Path(__file__).parent.joinpath('bench_baseline.json')
+# spec, head and digests of the original git.analyze() output on the repo of spec
+REFERENCE_PATH = pathlib.Path(__file__).parent.joinpath('bench_reference.json')
+# the response keys whose values are the same as the original's; files_with_max_commits
+# & filestats_line_stats are not, as file stats now follow renames and keep the latest commit
+REFERENCE_KEYS = ['commits', 'times', 'authors', 'low_commit_authors', 'time_extent', 'line_stats']
+# slower than the baseline by more than this fraction is a regression
+THRESHOLD = 0.25
+# timings under this (in seconds) are too noisy to compare
+NOISE_FLOOR = 0.05
+
+
+def timed(function, repeat):
+    """Best time of `repeat` calls to function, and its last result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def detect_renames(repopath):
+    """Rename detection alone, over every commit's diff"""
+    repo = pygit2.Repository(repopath)
+    options = renamegraph.RenameOptions()
+    renames = 0
+    for commit in fileindex.walk_all_refs(repo):
+        if len(commit.parents) == 1:
+            renames += len(renamegraph.find_renames(repo.diff(commit.parents[0], commit), options))
+    return renames
+
+
+def benchmarks(repopath):
+    """(name, function) of each benchmark on the repo"""
+    top_file = fileindex.build(pygit2.Repository(repopath)).top_files(1, include=filestats.shouldIncludePath)[0]
+    return [
+        ('analyze', lambda: git.analyze(repopath)),
+        ('maxfilestats', lambda: filestats.maxfilestats(repopath, 15)),
+        ('commits_for_filestat', lambda: filestats.commits_for_filestat(top_file, repopath)),
+        ('rename_detection', lambda: detect_renames(repopath)),
+    ]
+
+
+def time_scale(spec, workdir, repeat):
+    """The timings of each benchmark at the spec's scale"""
+    repopath = os.path.join(workdir, spec.name)
+    start = time.perf_counter()
+    synthetic.generate(repopath, spec)
+    generated = time.perf_counter() - start
+    timings = dict()
+    for name, function in benchmarks(repopath):
+        timings[name], _ = timed(function, repeat)
+        print('-- {:8} {:22} {:8.3f}s'.format(spec.name, name, timings[name]))
+    return {
+        'spec': spec.description(),
+        'generate': generated,
+        'timings': timings,
+        'commits_per_second': spec.commits / timings['analyze']
+    }
+
+
+def logged_shas(repopath, file):
+    """Shas of the non-merge commits that changed file, newest first, from a plain git log"""
+    output = subprocess.check_output(['git', '-C', repopath, 'log', '--all', '--full-history', '--no-merges',
+                                      '--format=%H', '--', file])
+    return output.decode('ascii').split()
+
+
+def digests(response):
+    """sha256 of the canonical JSON of each REFERENCE_KEYS value of a get_repo response"""
+    return {key: hashlib.sha256(json.dumps(response[key], sort_keys=True).encode('utf-8')).hexdigest()
+            for key in REFERENCE_KEYS}
+
+
+def matches_reference(path=REFERENCE_PATH):
+    """Does the analysis of the reference repo give what the original implementation did?"""
+    reference = json.loads(pathlib.Path(path).read_text())
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = synthetic.generate(os.path.join(tmp, 'reference'), synthetic.Spec(**reference['spec']))
+        if repo.head != reference['head']:
+            print('-- the reference repo generated differently: {}'.format(repo.head))
+            return False
+        response = json.loads(git.analyze(repo.path))
+    found = digests(response)
+    for key in REFERENCE_KEYS:
+        if found[key] != reference['digests'][key]:
+            print('-- {} differs from the reference'.format(key))
+    return found == reference['digests']
+
+
+def check_equivalence(repo):
+    """Names of the equivalence checks that failed on the synthetic.SyntheticRepo"""
+    repopath = repo.path
+    failed = []
+
+    def check(name, same):
+        print('-- {:40} {}'.format(name, 'ok' if same else 'FAILED'))
+        if not same:
+            failed.append(name)
+
+    serial = git.analyze_repo(repopath)
+    full_json = ''.join(serial.iter_json(indent=2))
+    check('original implementation', matches_reference())
+    check('parallel diff stats', git.analyze(repopath, workers=2) == full_json)
+    check('streamed JSON', full_json == json.dumps(serial.response_dict(), indent=2))
+    check('streamed envelope', ''.join(serial.iter_json(envelope='data')) ==
+          json.dumps({'data': serial.response_dict()}))
+
+    state = importstate.ImportState()
+    repo.set_head(repo.midpoint)
+    try:
+        git.analyze(repopath, state)
+    finally:
+        repo.set_head(repo.head)
+    check('incremental import', git.analyze(repopath, state) == full_json)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with statcache.StatCache(os.path.join(tmp, 'diffstats.sqlite')) as cache:
+            filled = git.analyze(repopath, cache=cache)
+            cache.flush()
+            check('diff stat cache', filled == full_json and git.analyze(repopath, cache=cache) == full_json)
+            check('diff stat cache, in parallel', git.analyze(repopath, workers=2, cache=cache) == full_json)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'repo.gvz')
+        artifact.write(path, serial)
+        check('artifact round trip', artifact.Artifact(path).response_dict() == serial.response_dict())
+
+    pyrepo = pygit2.Repository(repopath)
+    index = fileindex.build(pyrepo)
+    files = index.top_files(20)
+    batched = filestats.commits_for_filestats(files, repopath, batchSize=7)
+    same_batched, same_index = True, True
+    for file in files:
+        shas = logged_shas(repopath, file)
+        same_batched = same_batched and [detail['sha'] for detail in batched[file]] == shas
+        same_index = same_index and [str(detail['commit'].id) for detail in index.details(pyrepo, file)] == shas
+    check('batched file logs', same_batched)
+    check('file index vs git log', same_index)
+
+    graph = renamegraph.RenameGraph()
+    fileindex.build(pyrepo, graph)
+    check('rename chains detected', any(len(graph.earlier_names(path)) > 1 for path in graph.renamed_from))
+
+    shas = [str(commit.id) for commit in fileindex.walk_all_refs(pyrepo) if len(commit.parents) < 2]
+    check('chunked diff stats', list(diffstats.file_stats(repopath, shas, 2, chunk_size=5)) ==
+          [diffstats.commit_file_stats(pyrepo, pyrepo.get(sha)) for sha in shas])
+    return failed
+
+
+def regressions(results, baseline, threshold=THRESHOLD):
+    """(scale, benchmark, baseline time, time) of each benchmark slower than
+    the baseline by more than threshold"""
+    found = []
+    for scale, result in results['scales'].items():
+        base = baseline.get('scales', {}).get(scale)
+        if base is None:
+            continue
+        for name, elapsed in result['timings'].items():
+            before = base['timings'].get(name)
+            if before is None or max(before, elapsed) < NOISE_FLOOR:
+                continue
+            if elapsed > before * (1 + threshold):
+                found.append((scale, name, before, elapsed))
+    return found
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog='python -m gitviz.git.bench',
+                                     description='Benchmarks the analysis on synthetic repos')
+    parser.add_argument('--scales', nargs='+', choices=[spec.name for spec in SCALES],
+                        default=[spec.name for spec in SCALES])
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each benchmark (the best is kept)')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the results')
+    parser.add_argument('--baseline', default=str(BASELINE_PATH), help='results to compare with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='fraction slower than the baseline that fails the run')
+    parser.add_argument('--update-baseline', action='store_true', help='save the results as the baseline')
+    parser.add_argument('--skip-checks', action='store_true', help='only time, without equivalence checks')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Command line entry point, returns the exit status"""
+    options = parse_args(args)
+    results = {
+        'python': platform.python_version(),
+        'pygit2': pygit2.__version__,
+        'machine': platform.machine(),
+        'started': time.time(),
+        'scales': dict(),
+        'failed_checks': []
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for spec in SCALES:
+            if spec.name not in options.scales:
+                continue
+            results['scales'][spec.name] = time_scale(spec, workdir, options.repeat)
+        if not options.skip_checks:
+            # on a small repo of its own, so that checks don't depend on the scales run
+            spec = synthetic.Spec('check', commits=120, files=30, authors=6, merge_every=10, rename_every=7)
+            repo = synthetic.generate(os.path.join(workdir, spec.name), spec)
+            results['failed_checks'] = check_equivalence(repo)
+
+    pathlib.Path(options.output).write_text(json.dumps(results, indent=2))
+    print('-- results: {}'.format(options.output))
+    status = 1 if results['failed_checks'] else 0
+
+    baselinePath = pathlib.Path(options.baseline)
+    if options.update_baseline:
+        baselinePath.write_text(json.dumps(results, indent=2))
+        print('-- baseline updated: {}'.format(baselinePath))
+    elif baselinePath.exists():
+        for scale, name, before, elapsed in regressions(results, json.loads(baselinePath.read_text()),
+                                                         options.threshold):
+            print('-- REGRESSION {} {}: {:.3f}s -> {:.3f}s'.format(scale, name, before, elapsed))
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
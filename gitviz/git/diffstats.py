@@ -0,0 +1,112 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pygit2
+
+from . import metrics
+from . import renamegraph
+from . import reposession
+from . import statcache
+
+# chunks in flight per worker, so that slow chunks (big diffs) even out
+CHUNKS_PER_WORKER = 4
+# commits diffed per task
+CHUNK_SIZE = 64
+
+# the reposession.RepoSession of each worker process, and its rename settings
+_worker_session = None
+_worker_rename_options = None
+
+
+def commit_file_stats(repo, commit: pygit2.Commit, rename_options=None):
+    """(insertions, deletions, files, renames) of commit against its first parent,
+    where files is a list of [path, insertions, deletions]
+    and renames a list of [old path, new path].
+
+    The original commit counts no insertions or deletions overall,
+    but its files are reported as added.
+    Renames are only detected if rename_options are provided; the line
+    stats are taken before that, so renamed files count as added & deleted.
+    """
+    with metrics.timer('diffstats.diff'):
+        if len(commit.parents) == 0:
+            diff = commit.tree.diff_to_tree(swap=True)
+        else:
+            diff = repo.diff(commit.parents[0], commit)
+        ins, dels = 0, 0
+        files = []
+        for patch in diff:
+            _, file_ins, file_dels = patch.line_stats
+            files.append([patch.delta.new_file.path, file_ins, file_dels])
+            ins += file_ins
+            dels += file_dels
+    renames = []
+    if rename_options is not None and len(commit.parents) > 0:
+        with metrics.timer('diffstats.renames'):
+            renames = renamegraph.find_renames(diff, rename_options)
+    if len(commit.parents) == 0:
+        return 0, 0, files, renames
+    return ins, dels, files, renames
+
+
+def cached_commit_file_stats(repo, commit, rename_options=None, cache=None):
+    """commit_file_stats(), from the statcache.StatCache if it has them"""
+    if cache is None:
+        return commit_file_stats(repo, commit, rename_options)
+    key = statcache.key(commit, rename_options)
+    stats = cache.get(key)
+    if stats is None:
+        stats = commit_file_stats(repo, commit, rename_options)
+        cache.put(key, stats)
+    return stats
+
+
+def _init_worker(repopath, rename_options):
+    global _worker_session, _worker_rename_options
+    _worker_session = reposession.RepoSession(repopath)
+    _worker_rename_options = rename_options
+
+
+def _chunk_file_stats(shas):
+    """The stats of the commits, and what the worker timed doing so (see metrics.difference)"""
+    before = metrics.registry.snapshot()
+    stats = [commit_file_stats(_worker_session.repo, commit, _worker_rename_options)
+             for commit in _worker_session.get_many(shas)]
+    return stats, metrics.difference(before, metrics.registry.snapshot())
+
+
+def _chunk_result(future):
+    stats, (seconds, counters) = future.result()
+    metrics.merge(seconds, counters)
+    return stats
+
+
+def chunked(items, size):
+    """Lists of up to size items from the iterable"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def file_stats(repopath, shas, workers, rename_options=None, chunk_size=CHUNK_SIZE):
+    """Yields commit_file_stats() for each sha of the iterable, in order.
+
+    The shas are read chunk_size at a time and diffed in `workers` processes,
+    each with its own pygit2.Repository. At most CHUNKS_PER_WORKER chunks
+    per worker are in flight, so the shas can come from a lazy walk.
+    """
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(repopath, rename_options)) as executor:
+        for chunk in chunked(shas, chunk_size):
+            pending.append(executor.submit(_chunk_file_stats, chunk))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield from _chunk_result(pending.popleft())
+        while pending:
+            yield from _chunk_result(pending.popleft())
@@ -0,0 +1,174 @@
+"""Commits, churn and authors of every directory, as a prefix tree
+
+Built from the commit records of an import (the per-file line stats of
+every commit, so no other walk of the repo is needed). The tree is stored
+in the artifact as arrays, breadth first, with the children of each
+directory contiguous and sorted by name: a directory is found by binary
+searching each component of its path, without scanning the others.
+
+A commit counts once for each directory it changed something in (at any
+depth below it); its insertions & deletions count for every directory
+above the files.
+"""
+import posixpath
+from collections import Counter, defaultdict
+
+import numpy as np
+
+ARRAY_TYPES = {
+    'dir_parents': np.dtype('<i4'),
+    'dir_first_child': np.dtype('<i4'),
+    'dir_child_counts': np.dtype('<i4'),
+    'dir_commits': np.dtype('<i4'),
+    'dir_insertions': np.dtype('<i8'),
+    'dir_deletions': np.dtype('<i8'),
+    # authors of directory i are auth_ids[auth_offsets[i]:auth_offsets[i + 1]],
+    # most commits first, with their commit counts in auth_commits
+    'dir_auth_offsets': np.dtype('<i8'),
+    'dir_auth_ids': np.dtype('<i4'),
+    'dir_auth_commits': np.dtype('<i4'),
+}
+
+
+class DirTree:
+    def __init__(self, names, arrays):
+        self.names = names  # name of each directory ('' for the root)
+        self.arrays = arrays  # (key: name in ARRAY_TYPES, value: array)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_analysis(cls, records, result):
+        """Tree of the records, with the author ids of the artifact of the
+        analysis.Analysis result"""
+        _, dense_authors = np.unique(result.commits.authors, return_inverse=True)
+        shas = [sha.decode('ascii') for sha in result.commits.shas.tolist()]
+        return cls.build(records, dict(zip(shas, dense_authors.tolist())))
+
+    @classmethod
+    def build(cls, records, commit_authors):
+        """Tree of the included records. commit_authors gives the author id of each sha."""
+        stats = defaultdict(lambda: [0, 0, 0, Counter()])  # (key: directory, value: [commits, ins, dels, authors])
+        for record in records:
+            author_id = commit_authors.get(record['sha'])
+            if author_id is None:
+                continue  # a merge
+            # lines changed directly in each directory, then added to those above
+            changed = defaultdict(lambda: [0, 0])
+            for file, insertions, deletions in record['files']:
+                lines = changed[posixpath.dirname(file)]
+                lines[0] += insertions
+                lines[1] += deletions
+            touched = dict()  # (key: directory, value: [ins, dels] at any depth below)
+            for directory, (insertions, deletions) in changed.items():
+                while True:
+                    lines = touched.setdefault(directory, [0, 0])
+                    lines[0] += insertions
+                    lines[1] += deletions
+                    if not directory:
+                        break
+                    directory = posixpath.dirname(directory)
+            for directory, (insertions, deletions) in touched.items():
+                directory_stats = stats[directory]
+                directory_stats[0] += 1
+                directory_stats[1] += insertions
+                directory_stats[2] += deletions
+                directory_stats[3][author_id] += 1
+        stats['']  # the root, even without commits
+
+        children = defaultdict(list)
+        for directory in stats:
+            if directory:
+                children[posixpath.dirname(directory)].append(directory)
+        order = ['']  # breadth first, children sorted by name
+        parents = [-1]
+        first_child = []
+        child_counts = []
+        i = 0
+        while i < len(order):
+            below = sorted(children[order[i]], key=posixpath.basename)
+            first_child.append(len(order))
+            child_counts.append(len(below))
+            order.extend(below)
+            parents.extend([i] * len(below))
+            i += 1
+
+        author_offsets = [0]
+        author_ids, author_commits = [], []
+        for directory in order:
+            for author_id, commits in sorted(stats[directory][3].items(), key=lambda item: (-item[1], item[0])):
+                author_ids.append(author_id)
+                author_commits.append(commits)
+            author_offsets.append(len(author_ids))
+        values = {
+            'dir_parents': parents,
+            'dir_first_child': first_child,
+            'dir_child_counts': child_counts,
+            'dir_commits': [stats[directory][0] for directory in order],
+            'dir_insertions': [stats[directory][1] for directory in order],
+            'dir_deletions': [stats[directory][2] for directory in order],
+            'dir_auth_offsets': author_offsets,
+            'dir_auth_ids': author_ids,
+            'dir_auth_commits': author_commits,
+        }
+        arrays = {name: np.array(values[name], dtype=dtype) for name, dtype in ARRAY_TYPES.items()}
+        return cls([posixpath.basename(directory) for directory in order], arrays)
+
+    def child(self, i, name):
+        """Index of directory i's child called name, None if there is none"""
+        lo = int(self.arrays['dir_first_child'][i])
+        end = hi = lo + int(self.arrays['dir_child_counts'][i])
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.names[mid] < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < end and self.names[lo] == name:
+            return lo
+        return None
+
+    def find(self, prefix):
+        """Index of the directory at path prefix ('' or '/' for the root), None if unknown"""
+        i = 0
+        for name in prefix.strip('/').split('/'):
+            if not name:
+                continue
+            i = self.child(i, name)
+            if i is None:
+                return None
+        return i
+
+    def summary(self, i, author_names, author_emails, authors=10):
+        """Stats of directory i, with its top authors"""
+        start = int(self.arrays['dir_auth_offsets'][i])
+        stop = int(self.arrays['dir_auth_offsets'][i + 1])
+        top = range(start, min(stop, start + authors))
+        return {
+            'name': self.names[i],
+            'commits': int(self.arrays['dir_commits'][i]),
+            'insertions': int(self.arrays['dir_insertions'][i]),
+            'deletions': int(self.arrays['dir_deletions'][i]),
+            'author_count': stop - start,
+            'authors': [{
+                'name': author_names[int(self.arrays['dir_auth_ids'][j])],
+                'email': author_emails[int(self.arrays['dir_auth_ids'][j])],
+                'commits': int(self.arrays['dir_auth_commits'][j])
+            } for j in top]
+        }
+
+    def query(self, prefix, author_names, author_emails, authors=10):
+        """The directory at prefix and its subdirectories (most commits first),
+        None if there is no such directory"""
+        i = self.find(prefix)
+        if i is None:
+            return None
+        result = self.summary(i, author_names, author_emails, authors)
+        result['path'] = prefix.strip('/')
+        first = int(self.arrays['dir_first_child'][i])
+        children = [self.summary(j, author_names, author_emails, authors=0)
+                    for j in range(first, first + int(self.arrays['dir_child_counts'][i]))]
+        children.sort(key=lambda child: child['commits'], reverse=True)
+        result['directories'] = children
+        return result
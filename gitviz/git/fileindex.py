@@ -0,0 +1,75 @@
+import heapq
+from collections import defaultdict
+
+import pygit2
+
+from . import diffstats
+from . import renamegraph
+
+
+class FileChangeIndex:
+    """For each file path, the commits that changed it with their line stats.
+    Changes are kept in walk order, i.e. newest commit first."""
+
+    def __init__(self):
+        self.changes = defaultdict(list)  # (key: path, value: [(sha, insertions, deletions)])
+
+    def add(self, sha, files):
+        """Add the [path, insertions, deletions] changes of commit sha"""
+        for path, ins, dels in files:
+            self.changes[path].append((sha, ins, dels))
+
+    @classmethod
+    def from_records(cls, records):
+        """Index built from the commit records of git.analyze()"""
+        index = cls()
+        for record in records:
+            if 'files' in record:
+                index.add(record['sha'], record['files'])
+        return index
+
+    def top_files(self, count, include=None):
+        """The count paths with most commits, most first.
+        If provided, include(path) filters the candidates."""
+        candidates = (path for path in self.changes if include is None or include(path))
+        # nlargest keeps a heap bounded by count
+        return heapq.nlargest(count, candidates, key=lambda path: len(self.changes[path]))
+
+    def details(self, repo, path):
+        """Commit details for path, in the form returned by filestats.commits_for_filestat.
+        repo is a pygit2.Repository or, to share looked up commits, a reposession.RepoSession."""
+        return [{
+            'insertions': ins,
+            'deletions': dels,
+            'file': path,
+            'commit': repo.get(sha)
+        } for sha, ins, dels in self.changes.get(path, [])]
+
+
+def walk_all_refs(repo):
+    """Walks the commits reachable from HEAD or any reference, newest first"""
+    walker = repo.walk(repo.head.target, pygit2.GIT_SORT_TIME)
+    for name in repo.listall_references():
+        try:
+            commit = repo.lookup_reference(name).peel(pygit2.Commit)
+        except (ValueError, KeyError, pygit2.GitError):
+            continue  # not pointing to a commit
+        walker.push(commit.id)
+    return walker
+
+
+def build(repo, graph=None, rename_options=None, cache=None):
+    """Builds the index with a single tree-diff walk over the history.
+    If a renamegraph.RenameGraph is given, the renames are added to it.
+    Diffs found in the statcache.StatCache cache are not recomputed."""
+    index = FileChangeIndex()
+    if graph is not None and rename_options is None:
+        rename_options = renamegraph.RenameOptions()
+    for commit in walk_all_refs(repo):
+        if len(commit.parents) > 1:
+            continue  # merges carry no changes of their own
+        _, _, files, renames = diffstats.cached_commit_file_stats(repo, commit, rename_options, cache)
+        index.add(str(commit.id), files)
+        if graph is not None:
+            graph.add(str(commit.id), renames)
+    return index
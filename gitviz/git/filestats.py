@@ -1,35 +1,36 @@
 import os
-from subprocess import check_output, STDOUT
+from subprocess import CalledProcessError
 import stat
 import pathlib
-import pygit2
 import re
 from enum import Enum
+from . import fileindex
 from . import formatters
+from . import metrics
+from . import renamegraph
+from . import reposession
 
 
-def shell_output(command):
-    """Returns the shell output of the string command"""
-    return check_output(command, shell=True).decode('utf-8', 'ignore')
+def maxfilestats(reponame, maxFileCount, index=None, graph=None, rename_options=None, cache=None):
+    """Returns commit stats for files with most commits.
 
+    @param reponame the repo's path, or its reposession.RepoSession
+    @param index a fileindex.FileChangeIndex of the repo's history
+    @param graph a renamegraph.RenameGraph of the repo's history
+    If either is not provided, both are built with a single walk,
+    detecting renames with rename_options (and the diff stats in cache, a
+    statcache.StatCache, if given).
+    """
+    session = reposession.of(reponame)
+    if index is None or graph is None:
+        graph = renamegraph.RenameGraph()
+        index = fileindex.build(session.repo, graph, rename_options, cache)
 
-def maxfilestats(reponame, maxFileCount):
-    """Returns commit stats for files with most commits"""
-    maxCommitFilesCommand = "cd {}; git rev-list --objects --all | awk '$2' |\
-    sort -k2 | uniq -cf1 | sort -rn".format(reponame)
-    result_string = shell_output(maxCommitFilesCommand)
-
-    # each line is of the form "[num_commits] [sha] [file/folder path]"
-    stat_lines = str.split(result_string, sep="\n")
     topstats = dict()  # (key: file, value: [{insertions, deletions, commit}])
-    for filestat in stat_lines:
-        # For later: should instead check if the file extension is
-        # of one of the languages defined for this repo in GitHub API
-        if shouldIncludeStatObject(filestat) is True:
-            file = pathFromItemLine(filestat)
-            topstats[file] = commits_for_filestat(file, reponame)
-        if len(topstats) >= maxFileCount:
-            break
+    # For later: should instead check if the file extension is
+    # of one of the languages defined for this repo in GitHub API
+    for file in index.top_files(maxFileCount, include=shouldIncludePath):
+        topstats[file] = index.details(session, file)
 
     # for files whose stats are included in renames;
     # will be removed from topstats later
@@ -40,7 +41,7 @@ def maxfilestats(reponame, maxFileCount):
         if file in topstats:  # if we already have the commits
             return topstats[file]
         else:
-            return commits_for_filestat(file, reponame)
+            return index.details(session, file)
 
     def extend_stats(to_file, to_stats, from_file, from_stats, direction):
         """Add the stats from from_file to those of to_file"""
@@ -80,24 +81,20 @@ def maxfilestats(reponame, maxFileCount):
         renamed_to_file = None
 
         if direction == WalkDirection.BACK_IN_TIME:
-            renamed_from_file = fileRenamedFromAnother(filepath,
-                                                       earliest_commit,
-                                                       reponame)
+            renamed_from_file = graph.renamed_from_in(filepath,
+                                                      str(earliest_commit.id))
             if not renamed_from_file:
                 return None, None
         elif direction == WalkDirection.FORWARD_IN_TIME:
-            renamed_to_file = fileRenamedToAnother(filepath,
-                                                   last_commit,
-                                                   reponame)
+            renamed_to_file = graph.renamed_to_in(filepath,
+                                                  str(last_commit.id))
             if not renamed_to_file:
                 return None, None
         else:
-            renamed_from_file = fileRenamedFromAnother(filepath,
-                                                       earliest_commit,
-                                                       reponame)
-            renamed_to_file = fileRenamedToAnother(filepath,
-                                                   last_commit,
-                                                   reponame)
+            renamed_from_file = graph.renamed_from_in(filepath,
+                                                      str(earliest_commit.id))
+            renamed_to_file = graph.renamed_to_in(filepath,
+                                                  str(last_commit.id))
 
         if renamed_from_file:
             # don't take the first commit as it will be
@@ -154,48 +151,88 @@ def maxfilestats(reponame, maxFileCount):
     return topstats
 
 def commits_for_filestat(filepath, reponame):
-    repo = pygit2.Repository(reponame)
-    # do full history search to include deleted files
-    commits_command = "cd {}; git log --stat --summary --all --full-history -- \"{}\"".format(reponame, filepath)
-    commit_log_lines = shell_output(commits_command).split('\n')
-    stats = []
-    current_commit = None
-    current_renamed_from_file_file = None
-    # commit_log_lines from `log --stat` is in the long log form, so we iterate
-    # to parse the stat
-    for line in commit_log_lines:
-        # wait until we are under a commit
-        if current_commit:
-            stats_match = stat_from_long_log(line)
-            # is the current line a stat line?
-            if stats_match:
-                stats_match['file'] = filepath
-                stats_match['commit'] = repo.get(current_commit)
-                stats.append(stats_match)
-                current_commit = None
-        else:
-            current_commit = commit_from_long_log(line)
-
+    """Commit stats for a single file, newest first, with pygit2 commits"""
+    session = reposession.of(reponame)
+    stats = commits_for_filestats([filepath], session)[filepath]
+    commits = session.get_many(stat['sha'] for stat in stats)
+    return [{
+        'insertions': stat['insertions'],
+        'deletions': stat['deletions'],
+        'file': stat['file'],
+        'commit': commit
+    } for stat, commit in zip(stats, commits)]
+
+def commits_for_filestats(filepaths, reponame, batchSize=500):
+    """Commit stats for many files at once.
+
+    Returns a dict with the file path as key and a list of
+    {insertions, deletions, file, sha} as value, newest first.
+    A single `git log --numstat -z` per batch of paths is parsed as it streams.
+    """
+    session = reposession.of(reponame)
+    stats = {filepath: [] for filepath in filepaths}
+    for start in range(0, len(filepaths), batchSize):
+        batch = filepaths[start:start + batchSize]
+        # do full history search to include deleted files
+        command = ['--literal-pathspecs', 'log', '-z', '--numstat',
+                   '--no-renames', '--format=tformat:%H', '--all', '--full-history', '--'] + batch
+        with metrics.timer('subprocess'), session.popen_git(*command) as process:
+            for sha, file, insertions, deletions in parse_numstat(iter_chunks(process.stdout)):
+                if file in stats:
+                    stats[file].append({
+                        'insertions': insertions,
+                        'deletions': deletions,
+                        'file': file,
+                        'sha': sha
+                    })
+        if process.returncode != 0:
+            raise CalledProcessError(process.returncode, ['git'] + command)
     return stats
 
+def iter_chunks(stream, size=1 << 16):
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+def parse_numstat(chunks):
+    """Yields (sha, file, insertions, deletions) from the byte chunks of
+    `git log -z --numstat --format=tformat:%H` output"""
+    sha = None
+    remainder = b''
+    for chunk in chunks:
+        tokens = (remainder + chunk).split(b'\0')
+        remainder = tokens.pop()  # incomplete until the next \0
+        for token in tokens:
+            token = token.decode('utf-8', 'ignore').lstrip('\n')
+            if not token:
+                continue
+            parts = token.split('\t', 2)
+            if len(parts) < 3:
+                sha = token  # a commit line
+                continue
+            insertions, deletions, file = parts
+            # binary files have '-' for line counts
+            yield (sha, file,
+                   int(insertions) if insertions != '-' else 0,
+                   int(deletions) if deletions != '-' else 0)
 
 # -- Helpers
 
-def fileRenamedInCommit(filepath, commit, reponame, to=True):
+def fileRenamedInCommit(filepath, commit, reponame, to=True, rename_options=None):
     """
     If to    => what was filepath renamed *to*,
     If false => what was filepath renamed *from*
     """
-    if isFirstCommit(commit.oid, reponame): return None
-    commitId = str(commit.oid)
-    res = shell_output('cd {}; git config diff.renameLimit 999999; git diff --name-status {} {}~'.format(reponame, commitId, commitId)).split('\n')
-    for line in res:
-        rename_match = re.search("^R([0-9]+)\t(.*)\t(.*)", line)
-        if rename_match and len(rename_match.groups()) == 3:
-            if to and rename_match.group(3) == filepath:
-                return rename_match.group(2)
-            elif (not to) and rename_match.group(2) == filepath:
-                return rename_match.group(3)
+    if len(commit.parents) == 0: return None
+    diff = reposession.of(reponame).repo.diff(commit.parents[0], commit)
+    renames = renamegraph.find_renames(diff, rename_options or renamegraph.RenameOptions())
+    for old_path, new_path in renames:
+        if to and old_path == filepath:
+            return new_path
+        elif (not to) and new_path == filepath:
+            return old_path
 
 def fileRenamedToAnother(filepath, commit, reponame):
     """
@@ -213,34 +250,12 @@ def isFirstCommit(commitSha, reponame):
     """
     Does the SHA belong to the first commit in the repo?
     """
-    repo = pygit2.Repository(reponame)
-    commit = repo.get(commitSha)
-    return len(commit.parents) == 0
-
-def pathFromItemLine(filestat):
-    """Get the path from a filestat"""
-    # join since the split will split into mode, sha, and file path components separated by spaces
-    return " ".join(filestat.split()[2:])
-
-def shouldIncludeStatObject(filestat):
-    """Currently: is it a file, and is it one of the known source file extension"""
-    if not isStatObjectAFile(filestat): return False
-    itempath = pathFromItemLine(filestat)
-    extension = pathlib.Path(itempath).suffix.split('.')[1] # suffix gives '.py'
-    if extension in known_extensions:
-        return True
-    else:
-        return False
-
-def isStatObjectAFile(filestat):
-    itemsplit = filestat.split()
-    if len(itemsplit) < 3: return False
-    itempath = pathFromItemLine(filestat)
-    extension_split = pathlib.Path(itempath).suffix.split('.')
-    if len(extension_split) == 2:
-        return True
-    else:
-        return False
+    return reposession.of(reponame).is_first_commit(commitSha)
+
+def shouldIncludePath(path):
+    """Currently: is it one of the known source file extension"""
+    suffix = pathlib.Path(path).suffix # suffix gives '.py'
+    return suffix[1:] in known_extensions
 
 known_extensions = [
     "m", "cc", "cpp", "mm", "h", "c", "swift",
@@ -250,24 +265,6 @@ known_extensions = [
     "md", "rst", "yml", "erb", "scss"
 ]
 
-def stat_from_long_log(line):
-    stat_line_match = re.search(r"^\s+1 file changed, (([0-9]+) insertion(s)?\(\+\))?(, )?(([0-9]+) deletion(s)?\(\-\))?$", line)
-    if not stat_line_match: return None
-    if len(stat_line_match.groups()) == 7:
-        res = {}
-        insertions, deletions = stat_line_match.group(2), stat_line_match.group(6)
-        if insertions: res['insertions'] = int(insertions)
-        if deletions: res['deletions'] = int(deletions)
-        return res
-    else: return None
-
-def commit_from_long_log(line):
-    commit_line_match = re.search(r'^(commit) ([a-f0-9]+)$', line)
-    if not commit_line_match: return None
-    if len(commit_line_match.groups()) == 2:
-        return commit_line_match.group(2)
-    return None
-
 # ---
 
 def shouldSkipFileFromStats(reponame, resline):
@@ -275,14 +272,16 @@ def shouldSkipFileFromStats(reponame, resline):
     itemsplit = resline.split()
     if len(itemsplit) != 3: return True
     itempath = itemsplit[2]
-    path = os.path.join(reponame, itempath)
+    session = reposession.of(reponame)
+    path = os.path.join(session.path, itempath)
     if os.path.exists(path):
         mode = os.stat(path)[stat.ST_MODE]
         return stat.S_ISDIR(mode)
     else:
-        deleted_find_command = "cd {}; git log --diff-filter=D --summary | grep {}".format(reponame, itempath)
         try:
-            deleted_find_result = check_output(deleted_find_command, stderr=STDOUT, shell=True)
+            summary = session.git('log', '--diff-filter=D', '--summary').decode('utf-8', 'ignore')
+            # ' delete mode <mode> <path>' of the first deletion mentioning the path
+            deleted_find_result = next(line for line in summary.splitlines() if itempath in line)
             delete_mode = deleted_find_result.split()[2]
             deleted_mode_is_dir = delete_mode == "040000"
             return deleted_mode_is_dir
@@ -1,5 +1,6 @@
 import pygit2
 from datetime import datetime, timezone, timedelta
+from dateutil import parser as dateparser
 
 def time_from_commit(commit: pygit2.Commit):
     tzinfo = timezone(timedelta(minutes=commit.author.offset))
@@ -7,5 +8,19 @@ def time_from_commit(commit: pygit2.Commit):
     return dt
 
 def time_string_from_commit(commit: pygit2.Commit):
-    
     return time_from_commit(commit).isoformat()
+
+def time_string(epoch, offset):
+    """ISO time string for seconds since the epoch, at an offset in minutes"""
+    tzinfo = timezone(timedelta(minutes=offset))
+    return datetime.fromtimestamp(float(epoch), tzinfo).isoformat()
+
+def parse_time(value):
+    """Seconds since the epoch, from seconds or a date (UTC unless it has an offset).
+    Raises ValueError (or OverflowError) if value is neither."""
+    if value.lstrip('-').isdigit():
+        return int(value)
+    time = dateparser.parse(value)
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return int(time.timestamp())
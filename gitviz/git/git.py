@@ -1,138 +1,440 @@
 import sys
 import pygit2
 import json
-import math
 import time
 import os
 import pathlib
-from bisect import insort_left
-from datetime import datetime, timezone, timedelta
+import hashlib
+import heapq
+from collections import deque
 
+from . import analysis
+from . import artifact
 from . import author
+from . import diffstats
+from . import dirtree
 from . import filestats
-from . import formatters
+from . import importstate
+from . import metrics
+from . import modes
+from . import ownership
+from . import payload
+from . import refs
+from . import renamegraph
+from . import repodb
+from . import reposession
+from . import statcache
+from . import table
+from . import wire
 
-def localDayMinutes(commit_time):
-    return 60*commit_time.hour+commit_time.minute # minutes elasped in the day at commit time
+def importRepo(repopath, full=False, workers=None, rename_options=None, progress=None, profile=False,
+               use_cache=True, mode=None):
+    """Analyzes the repo and writes its JSON, artifact (with the directory
+    tree, see dirtree), database (see repodb) and get_repo response to gitviz/data/.
 
+    The intermediate state is saved alongside, so that the next import
+    only walks commits added since. Pass `full` to rebuild from scratch,
+    and `workers` to compute diff stats in that many processes.
+    rename_options (a renamegraph.RenameOptions) tune rename detection.
+    progress(stage, done, total) is called as the import goes, from every stage
+    ('loading', those of analyze_repo(), 'ownership', then 'writing' before
+    each output); it can raise to abandon the import until the first
+    'writing', before anything is written.
+    Unless use_cache is false, diff stats are looked up in (and added to)
+    the statcache shared by all repos, so only unseen commits are diffed.
+    The time taken by each stage is logged (see metrics.ImportRun); with
+    `profile` a cProfile of the import is saved as well.
+    A modes.ImportMode bounds or samples the commits analyzed, or walks several
+    refs (then the artifact has which refs reach each commit); the artifact
+    records it.
+    Returns the analysis.Analysis.
+    """
+    reponame = repopath.split('/')[-1]
+    cachedPath = pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(reponame + '.json')
 
-def localWeekMinutes(commit_time: datetime.date, shouldPrint = False):
-    weekday = commit_time.weekday()
-    minutes_before_today = weekday * (60*24)
-    minutes_today = localDayMinutes(commit_time)
-    result = minutes_today + minutes_before_today
-    if shouldPrint:
-        print('weekday: {}, minutes_before_today: {}, minutes_today: {}'.format(weekday, minutes_before_today, minutes_today))
+    def report(stage):
+        if progress is not None:
+            progress(stage, None, None)
+
+    with metrics.ImportRun(reponame, profile=profile):
+        report('loading')
+        with metrics.timer('import.load_state'):
+            state = importstate.empty(reponame) if full else importstate.load(reponame)
+        with reposession.RepoSession(repopath) as session:
+            if use_cache:
+                with statcache.StatCache(statcache.cachePath()) as cache:
+                    result = analyze_repo(session, state, workers=workers, rename_options=rename_options,
+                                          progress=progress, cache=cache, mode=mode)
+            else:
+                result = analyze_repo(session, state, workers=workers, rename_options=rename_options,
+                                      progress=progress, mode=mode)
+            # line ownership of the files with most commits, continued from the last import's
+            report('ownership')
+            with metrics.timer('import.ownership'):
+                graph = renamegraph.RenameGraph.from_records(state.iter_records(files=False))
+                state.ownership = ownership.update(session, state.filestats, graph, state.ownership)
+                owners = ownership.snapshots(state.ownership, result)
+        report('writing')
+        with metrics.timer('import.dirtree'):
+            dirs = dirtree.DirTree.from_analysis(state.iter_records(), result)
+        membership = None
+        if state.tips is not None:
+            shas = [sha.decode('ascii') for sha in result.commits.shas.tolist()]
+            membership = (state.tips, refs.packed(state.iter_records(files=False), shas, len(state.tips)))
+        report('writing')
+        with metrics.timer('import.write.artifact'):
+            artifact.write(artifact.artifactPath(reponame), result,
+                           meta={'head': state.head, 'path': repopath, 'imported': time.time(),
+                                 'mode': state.mode}, dirs=dirs, membership=membership, owners=owners)
+        # sinks: the commits are encoded one chunk at a time, into temporary files
+        report('writing')
+        with metrics.timer('import.write.json'):
+            analysis.write_json(cachedPath, result.iter_json(indent=2))
+        report('writing')
+        with metrics.timer('import.write.db'):
+            repodb.write(repodb.dbPath(reponame), state.iter_records(), result)
+        # what get_repo serves, as is and precompressed
+        report('writing')
+        with metrics.timer('import.write.payload'):
+            payload.write(reponame, result.iter_json(envelope='data'))
+            payload.write(reponame, wire.iter_json(result, envelope='data'), schema=wire.SCHEMA)
+        report('writing')
+        with metrics.timer('import.write.state'):
+            importstate.save(reponame, state)
+        state.close()
     return result
 
-def importRepo(repopath):
-    reponame = repopath.split('/')[-1]
-    cachedPath = pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(reponame + '.json')
-    repoJson = analyze(repopath)
-    cachedPath.write_text(repoJson)
+def analyze(reponame, state=None, workers=None, rename_options=None, cache=None, mode=None):
+    """Returns the JSON for the repo at path reponame. See analyze_repo()"""
+    result = analyze_repo(reponame, state, workers=workers, rename_options=rename_options, cache=cache,
+                          mode=mode)
+    return ''.join(result.iter_json(indent=2))
 
-def analyze(reponame):
-    repo = pygit2.init_repository(reponame)
-    count = 0
-    authors = []
-    times = []
-    commits = []
-    insertions = []
-    deletions = []
+def analyze_repo(reponame, state=None, workers=None, rename_options=None, progress=None, cache=None,
+                 mode=None):
+    """Returns the analysis.Analysis of the repo at path reponame (or of the
+    reposession.RepoSession reponame, shared by every stage of the import).
+
+    If a previous ImportState is given, only the commits since its head are
+    walked and merged into it; the state is updated in place. The records
+    stream to its recordstore.RecordStore, and are read back from it by each
+    stage, so they are never all in memory.
+    With more than one worker, the per-commit diff stats are computed in
+    a process pool; the output is the same as for a serial run.
+    With a statcache.StatCache only the commits it doesn't have are diffed.
+    A bounded or sampled modes.ImportMode stops the walk early and analyzes
+    only the commits it keeps; such imports are rebuilt each time (from the
+    statcache, mostly), as their window moves with HEAD.
+    progress(stage, done, total) is told of the 'counting', 'walking' (with
+    the commits walked, out of total), 'filestats' and 'aggregating' stages.
+    """
+    session = reposession.of(reponame)
+    repo = session.repo
+    state = state if state is not None else importstate.ImportState()
+    rename_options = rename_options or renamegraph.RenameOptions()
+    mode = mode or modes.ImportMode()
     start_time = time.time()
 
-    def commit_info_from_commit(commit: pygit2.Commit, trackTime = True):
-        """Internal method to convert a Commit to its dict representation"""
-        if should_include(commit) == False: return
-        author_info: AuthorsInfo = author.add_author(authors, commit, count)
-        commit_time = formatters.time_from_commit(commit)
-        commit_info = {
-            'message': commit.message.split('\n')[0],
-            'name': author_info.name(),
-            'sha': str(commit.oid),
-            'email': author_info.email(),
-            'time': commit_time.isoformat(),
-            'local_day_minutes': localDayMinutes(commit_time),
-            'local_weekday_minutes': localWeekMinutes(commit_time)
-        }
-        ins, dels = 0, 0  # defaults if there are no parents (original commit)
-        if len(commit.parents) > 0:
-            stats = repo.diff(commit.parents[0], commit).stats
-            ins = stats.insertions
-            dels = stats.deletions
-            insertions.append(ins)
-            deletions.append(dels)
-        commit_info['insertions'] = ins
-        commit_info['deletions'] = dels
-        if trackTime:
-            insort_left(times, commit_time.isoformat())
-            if count == 1:
-                initial_time = commit_time
-        return commit_info
-
-    # Process all commits
-    for commit in repo.walk(repo.head.target, pygit2.GIT_SORT_TIME):
-        count += 1
-        commit_info = commit_info_from_commit(commit)
-        if commit_info is None:
-            continue
-        commits.append(commit_info)
-        # if commit length needs to be trimmed...
-        # max_days = 288
-        # days_delta = (initial_time - commit_time).days
-        # if days_delta > max_days:
-        #     break
+    head_time = repo[repo.head.target].commit_time
+    head, tips = head_of(repo, mode)
+    same_mode = state.mode == mode.description()
+    incremental = same_mode and (mode.is_incremental() or state.head == str(head))
+    previous_head = state.head if incremental and is_ancestor(repo, state.head, head) else None
+    if previous_head is not None and previous_head != str(head) and not mergeable(repo, state, head, previous_head):
+        print('-- commit times out of order, rebuilding')
+        previous_head = None
+    if previous_head is None:
+        if not state.is_empty() and not same_mode:
+            print('-- import mode changed, rebuilding')
+        elif not state.is_empty() and mode.is_full():
+            print('-- history rewritten since last import, rebuilding')
+        state.replace_records(None)
+        state.filestats = None
+
+    if previous_head != str(head):
+        # walk -> filter -> enrich, each stage a generator pulling from the previous one
+        total = None
+        if progress:
+            progress('counting', None, None)
+            with metrics.timer('import.count'):
+                total = sum(1 for _ in mode.select(walk_tips(repo, head, previous_head, tips), head_time, time_sorted=tips is None))
+        pairs = filter_commits(mode.select(walk_tips(repo, head, previous_head, tips), head_time, time_sorted=tips is None))
+        misses = dict()
+        if cache is not None:
+            pairs = cached(pairs, cache, rename_options, misses)
+        if workers and workers > 1:
+            records = enrich_parallel(session.path, (record for _, record in pairs), workers, rename_options)
+        else:
+            records = enrich(repo, pairs, rename_options)
+        if cache is not None:
+            records = stored(records, cache, misses)
+        if progress:
+            records = tracked(records, progress, total)
+        # the records go to disk as they come, merged into those of the state
+        with metrics.timer('import.walk'):
+            previous_count = len(state.records) if state.records is not None else 0
+            store = state.new_records()
+            new_count = store.write(merge_records(records, state.iter_records()), str(head)) - previous_count
+            state.replace_records(store)
+        metrics.count('import.commits', new_count)
+        print('-- {} new commits'.format(new_count))
+        # files with most commits, from the per file stats of the records (the store indexes them)
+        if progress:
+            progress('filestats', None, None)
+        with metrics.timer('import.filestats'):
+            graph = renamegraph.RenameGraph.from_records(state.iter_records(files=False))
+            maxfilecommits = filestats.maxfilestats(session, 15, state.records, graph) # dict with key as filename, and value is commit detail
+            state.filestats = serialized_filestats(maxfilecommits)
+    state.head = str(head)
+    state.mode = mode.description()
+    state.tips = tip_names(tips) if tips is not None else None
+
+    if progress:
+        progress('aggregating', None, None)
+    with metrics.timer('import.aggregate'):
+        result = analysis_from_records(state.iter_records(files=False), state.filestats, read_mailmap(repo))
+
+    # log the time taken to analyze
+    end_time = time.time()
+    print('-- Time to analyze {}: {}'.format(session.path.rstrip('/').split('/')[-1], (end_time-start_time)))
+    if session is not reponame:
+        session.close()
+    return result
+
+def mergeable(repo, state, head, previous_head):
+    """Can the walk of the commits since previous_head be merged by commit time
+    (see merge_records()) into the state's records, giving the order of a full walk?
+    Only if no commit, of either, has a parent with a later commit time."""
+    if state.records is None or not state.records.in_time_order():
+        return False
+    return not any(parent.commit_time > commit.commit_time
+                   for commit in walk(repo, head, hide=previous_head) for parent in commit.parents)
+
+def is_ancestor(repo, sha, head):
+    """Is the commit sha (possibly None) head or one of its ancestors?"""
+    if sha is None:
+        return False
+    try:
+        oid = pygit2.Oid(hex=sha)
+        return oid == head or repo.merge_base(oid, head) == oid
+    except (KeyError, ValueError, pygit2.GitError):
+        # the old head is gone from the repo
+        return False
+
+def walk(repo, head, hide=None):
+    """Walk stage: the commits reachable from head (but not from hide), latest first"""
+    walker = repo.walk(head, pygit2.GIT_SORT_TIME)
+    if hide:
+        walker.hide(pygit2.Oid(hex=hide))
+    return iter(walker)
+
+def walk_tips(repo, head, hide, tips=None):
+    """Walk stage: (commit, ref bitset) pairs of the commits of walk(), or, given
+    refs.resolve() tips, of all of theirs (each commit once, see refs.py).
+    The bitset is None without tips."""
+    if tips is None:
+        return ((commit, None) for commit in walk(repo, head, hide=hide))
+    return refs.memberships(refs.walk(repo, tips), tips)
+
+def head_of(repo, mode):
+    """(head, tips) of what the modes.ImportMode walks: HEAD and None, or, when it walks
+    refs, a made up oid standing for all of their tips (by name & commit) and the
+    refs.resolve() tips"""
+    if mode.refs is None:
+        return repo.head.target, None
+    tips = refs.resolve(repo, mode.refs)
+    if not tips:
+        raise ValueError('no ref matches {}'.format(', '.join(mode.refs)))
+    key = ' '.join('{}:{}'.format(name, oid) for name, oid in tips)
+    return pygit2.Oid(hex=hashlib.sha1(key.encode('utf-8')).hexdigest()), tips
+
+def tip_names(tips):
+    return [name for name, _ in tips]
+
+def filter_commits(pairs):
+    """Filter stage: yields (commit, record) for each (commit, ref bitset) pair.
+    Merges are kept as bare records: they are not described, but they count
+    in the authors' commit indices."""
+    for commit, bits in pairs:
+        record = record_from_commit(commit)
+        if bits is not None:
+            record['refs'] = bits
+        yield commit, record
+
+def cached(pairs, cache, rename_options, misses):
+    """Cache stage: adds the diff stats found in the statcache.StatCache to the
+    records of included commits. The keys of those not found are put in
+    misses, by sha, for stored()."""
+    for commit, record in pairs:
+        if 'epoch' in record:
+            key = statcache.key(commit, rename_options)
+            stats = cache.get(key)
+            if stats is not None:
+                add_file_stats(record, stats)
+            else:
+                misses[record['sha']] = key
+        yield commit, record
+
+def stored(records, cache, misses):
+    """Store stage: caches the diff stats computed for the misses of cached()"""
+    for record in records:
+        key = misses.pop(record['sha'], None)
+        if key is not None:
+            cache.put(key, (record['insertions'], record['deletions'], record['files'],
+                            record.get('renames', [])))
+        yield record
+
+def needs_stats(record):
+    return 'epoch' in record and 'files' not in record
+
+def enrich(repo, pairs, rename_options=None):
+    """Enrich stage: yields the records of the (commit, record) pairs, with the
+    diff stats of included commits"""
+    for commit, record in pairs:
+        if needs_stats(record):
+            add_file_stats(record, diffstats.commit_file_stats(repo, commit, rename_options))
+        yield record
+
+def enrich_parallel(reponame, records, workers, rename_options=None):
+    """Enrich stage, with the diffs in a process pool. Only the records
+    whose stats are in flight are held."""
+    waiting = deque()
+    def shas():
+        for record in records:
+            waiting.append(record)
+            if needs_stats(record):
+                yield record['sha']
+    for stats in diffstats.file_stats(reponame, shas(), workers, rename_options):
+        while not needs_stats(waiting[0]):
+            yield waiting.popleft()
+        record = waiting.popleft()
+        add_file_stats(record, stats)
+        yield record
+    yield from waiting
+
+def tracked(records, progress, total, every=100):
+    """Passes the records through, telling progress how many were walked"""
+    count = 0
+    for count, record in enumerate(records, 1):
+        if count % every == 0:
+            progress('walking', count, total)
+        yield record
+    progress('walking', count, total)
+
+def record_from_commit(commit: pygit2.Commit):
+    """A commit's dict representation, with its raw author identity.
+    The line stats (overall, and per file) and renames are added by enrich()"""
+    record = {
+        'sha': str(commit.oid),
+        'commit_time': commit.commit_time,
+        'parents': len(commit.parents)
+    }
+    if should_include(commit) == False: return record
+    record.update({
+        'message': commit.message.split('\n')[0],
+        'name': commit.author.name,
+        'email': commit.author.email,
+        'epoch': commit.author.time,
+        'offset': commit.author.offset
+    })
+    return record
+
+def add_file_stats(record, stats):
+    ins, dels, files, renames = stats
+    metrics.count('import.included')
+    metrics.count('import.files_changed', len(files))
+    metrics.count('import.renames', len(renames))
+    record['insertions'] = ins
+    record['deletions'] = dels
+    record['files'] = files
+    if renames:
+        record['renames'] = renames
+
+def merge_records(new_records, records):
+    """Merges two walks into one, in the order a single time-sorted walk would give
+    if both are in commit time order (see mergeable()). Both are iterated lazily."""
+    return heapq.merge(new_records, records, key=lambda record: -record['commit_time'])
+
+def serialized_filestats(maxfilecommits):
+    """Replaces the pygit2 commits in maxfilestats() details by their shas"""
+    result = dict()
+    seen = set()  # renames can share a detail between files
+    for file, commitDetails in maxfilecommits.items():
+        details = []
+        for original in commitDetails:
+            detail = dict(original)
+            if id(original) in seen:
+                detail['shared'] = True
+            seen.add(id(original))
+            pygitCommit = detail.pop('commit')
+            # probably a coding error in maxfilestats(), but sometimes this could be a dict instead
+            if not type(pygitCommit) is dict:
+                detail['sha'] = str(pygitCommit.oid)
+            else:
+                detail['sha'] = pygitCommit['sha']
+            details.append(detail)
+        result[file] = details
+    return result
+
+def read_mailmap(repo):
+    """The author.Mailmap from the .mailmap at HEAD, if there is one"""
+    try:
+        blob = repo[repo.head.peel().tree['.mailmap'].id]
+    except KeyError:
+        return None
+    return author.Mailmap.from_text(blob.data.decode('utf-8', 'ignore'))
+
+def analysis_from_records(records, maxfilecommits, mailmap=None):
+    """Builds the Analysis from commit records (an iterable, read once) and serialized file stats"""
+    authors = author.AuthorIndex(mailmap)
+
+    # one pass: the table's author ids are resolved once all identities are added,
+    # as a later commit can merge two authors
+    builder = table.CommitTableBuilder()
+    for count, record in enumerate(records, start=1):
+        if 'epoch' in record:
+            authors.add(record['name'], record['email'], count)
+            builder.add(record)
+    commits = builder.build(authors)
+    has_parents = commits.parents > 0
+
     # sort commits and authors
-    sorted_commits = sorted(commits, key=lambda commit: commit['time'], reverse=True)
-    sorted_authors = sorted(authors, key=lambda author: len(author.commit_indices))
+    sorted_commits = commits.take(commits.time_order())
+    sorted_commit_authors = sorted_commits.authors.tolist()
+    sorted_authors = sorted(authors.authors(), key=lambda author: len(author.commit_indices))
     # split up authors into high committers, and a group of small committers
     strategy = author.LowCommitAuthorsStrategy.BY_LOW_COMMITTERS_COUNT
     (author_desc, low_commit_author_desc) = author.split_authors(sorted_commits, sorted_authors, strategy)
 
-    # files with most commits
-    maxfilecommits = filestats.maxfilestats(reponame, 15) # dict with key as filename, and value is commit detail
     maxfileJSONlist = []
 
     # like insertions, deletions; but for file stats
     # these are not for a commit, but for the given file in a commit
     file_insertions, file_deletions = [], []
 
-    def commit_index(sha):
-        for idx, commit in enumerate(sorted_commits):
-            if commit['sha'] == sha:
-                return idx
+    commit_indices = {sha.decode('ascii'): idx for idx, sha in enumerate(sorted_commits.shas.tolist())}
 
     for file in maxfilecommits:
-        commitDetails = maxfilecommits[file]
+        commitDetails = [dict(detail) for detail in maxfilecommits[file]]
         detailsToRemove = []  # these commit details could not be JSONified (merge commit probably)
         fileAuthors = set()
-        # keys are insertions, deletions, commit
+        # keys are insertions, deletions, sha
         for idx, detail in enumerate(commitDetails):
-            if 'commit_index' in detail:
-                print('skipping!')
+            index = commit_indices.get(detail['sha'])
+            if index is not None and detail.pop('shared', False):
+                # already counted under another file
+                del detail['sha']
+                detail['commit_index'] = index
                 continue
-            pygitCommit = detail['commit']
-            # probably a coding error in maxfilestats(), but sometimes this could be a dict instead
-            if not type(pygitCommit) is dict:
-                sha = str(pygitCommit.oid)
-            else:
-                sha = pygitCommit['sha']
-            index = commit_index(sha)
-            if index:
-                del detail['commit']
-                commit = sorted_commits[index]
+            if index is not None:
+                del detail['sha']
                 detail['commit_index'] = index
                 if 'insertions' in detail:
                     file_insertions.append(detail['insertions'])
                 if 'deletions' in detail:
                     file_deletions.append(detail['deletions'])
 
-                authorEmail = commit['email']
-                authorName = commit['name']
-                matching_authors = [author for author in authors if author.is_commit_author(authorName, authorEmail)]
-
-                if len(matching_authors) > 0:
-                    fileAuthors.add(matching_authors[0])
+                fileAuthors.add(authors.infos[sorted_commit_authors[index]])
             else:
                 detailsToRemove.append(idx)
         commitDetails = [detail for idx, detail in enumerate(commitDetails) if idx not in detailsToRemove]
@@ -144,32 +446,22 @@ def analyze(reponame):
         })
         print('{}\'s authors: {}'.format(file, [a.name() for a in fileAuthors]))
 
-    response_dict = {
-        'commits': sorted_commits,
+    author_names = [info.name() if info else None for info in authors.infos]
+    author_emails = [info.email() if info else None for info in authors.infos]
+    return analysis.Analysis(sorted_commits, author_names, author_emails, {
         'authors': author_desc,
         'low_commit_authors': low_commit_author_desc,
-        'time_extent': [times[0], times[len(times)-1]],
-        'times': times,
-        'line_stats': percentile_stat_info(insertions, deletions),
-        'filestats_line_stats': percentile_stat_info(file_insertions, file_deletions),
+        'time_extent': time_extent(sorted_commits),
+        'line_stats': table.percentile_stat_info(commits.insertions[has_parents], commits.deletions[has_parents]),
+        'filestats_line_stats': table.percentile_stat_info(file_insertions, file_deletions),
         'files_with_max_commits': maxfileJSONlist
-    }
-    response_json = json.dumps(response_dict, indent=2)
-
-    # log the time taken to analyze
-    end_time = time.time()
-    print('-- Time to analyze {}: {}'.format(reponame.split('/')[-1], (end_time-start_time)))
-    return response_json
-
-def percentile_stat_info(insertions, deletions):
-    values = insertions + deletions
-    sorted_values = sorted(values)
-    percentile = 0.99
-    percentile_index = math.floor(float(len(sorted_values) * percentile))
-    if percentile_index > len(sorted_values)-4: percentile_index -= 1
-    percentile_value = sorted_values[percentile_index]
-    return {'min': min(sorted_values), 'max': max(sorted_values), 'percentile_value': percentile_value }
+    })
 
+def time_extent(commits):
+    """[oldest, latest] time strings of the commits (a CommitTable, latest first), or None if there are none"""
+    if len(commits) == 0:
+        return None
+    return [commits.time_string(len(commits)-1), commits.time_string(0)]
 
 def should_include(commit):
     """Currently, excludes merge commits"""
@@ -177,4 +469,5 @@ def should_include(commit):
         return False
 
 if __name__ == '__main__':
-    analyze(sys.argv[1])
+    from . import batch
+    sys.exit(batch.main(sys.argv[1:]))
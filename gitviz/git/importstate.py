@@ -0,0 +1,110 @@
+import gzip
+import json
+import os
+import pathlib
+import sqlite3
+
+from . import recordstore
+
+# 5: the records are kept in a recordstore.RecordStore of their own
+STATE_VERSION = 5
+
+
+class ImportState:
+    """Intermediate results of an import, kept next to the repo's JSON
+    so that a re-import only has to walk the commits added since.
+    The commit records are in a recordstore.RecordStore, at records_path
+    (or in a temporary file, without one)."""
+
+    def __init__(self, head=None, records=None, filestats=None, mode=None, tips=None, ownership=None,
+                 records_path=None):
+        self.head = head  # sha of the HEAD that was analyzed
+        self.records = records  # recordstore.RecordStore of the commit records, in walk order, or None
+        self.records_path = records_path
+        self.filestats = filestats  # {file: [{insertions, deletions, file, sha}]}
+        self.mode = mode if mode is not None else {'kind': 'full'}  # modes.ImportMode description
+        self.tips = tips  # names of the refs walked (bit i of a record's 'refs' is tips[i]), None for HEAD
+        self.ownership = ownership if ownership is not None else {}  # {file: ownership.walk() entry}
+
+    def is_empty(self):
+        return self.head is None
+
+    def iter_records(self, files=True):
+        """The commit records, see recordstore.RecordStore.records"""
+        return self.records.records(files) if self.records is not None else iter([])
+
+    def new_records(self):
+        """An empty recordstore.RecordStore, to be written then passed to replace_records()"""
+        path = self.records_path
+        return recordstore.RecordStore.create(path.with_name(path.name + '.tmp') if path is not None else None)
+
+    def replace_records(self, store):
+        """Makes store (or no records, if None) the records of the state, closing the previous ones"""
+        if self.records is not None:
+            self.records.close()
+        if store is not None and self.records_path is not None:
+            store.move(self.records_path)
+        self.records = store
+
+    def close(self):
+        if self.records is not None:
+            self.records.close()
+
+    def description(self):
+        """Returns a dict representation"""
+        return {
+            'version': STATE_VERSION,
+            'head': self.head,
+            'filestats': self.filestats,
+            'mode': self.mode,
+            'tips': self.tips,
+            'ownership': self.ownership
+        }
+
+    @classmethod
+    def from_description(cls, description, records=None, records_path=None):
+        """The state of a description() whose records are the recordstore.RecordStore
+        records (empty if they are missing or of another head)"""
+        if description.get('version') != STATE_VERSION or records is None or records.head != description['head']:
+            if records is not None:
+                records.close()
+            return cls(records_path=records_path)
+        return cls(description['head'], records, description['filestats'], description.get('mode'),
+                   description.get('tips'), description.get('ownership'), records_path)
+
+
+def statePath(reponame):
+    return pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(reponame + '.state.gz')
+
+
+def recordsPath(reponame):
+    return pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(reponame + '.records.sqlite')
+
+
+def empty(reponame):
+    """An empty ImportState for reponame, to import it from scratch"""
+    return ImportState(records_path=recordsPath(reponame))
+
+
+def load(reponame):
+    """Returns the saved ImportState for reponame, or an empty one"""
+    path = statePath(reponame)
+    records_path = recordsPath(reponame)
+    if not path.exists() or not records_path.exists():
+        return empty(reponame)
+    try:
+        with gzip.open(str(path), 'rt', encoding='utf-8') as f:
+            description = json.load(f)
+        return ImportState.from_description(description, recordstore.RecordStore(records_path), records_path)
+    except (OSError, ValueError, KeyError, sqlite3.Error) as err:
+        print('-- ignoring unreadable import state for {}: {}'.format(reponame, err))
+        return empty(reponame)
+
+
+def save(reponame, state):
+    """Saves the state (its records are already in place, see ImportState.replace_records)"""
+    path = statePath(reponame)
+    tmpPath = path.with_name(path.name + '.tmp')
+    with gzip.open(str(tmpPath), 'wt', encoding='utf-8') as f:
+        json.dump(state.description(), f)
+    os.replace(str(tmpPath), str(path))
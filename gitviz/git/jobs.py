@@ -0,0 +1,266 @@
+"""Background imports: a persistent job table, and a local pool of workers running them
+
+Jobs are rows of a SQLite database in gitviz/data/, so that every server
+process (and the workers) sees the same jobs. There is at most one queued
+or running job per repo path: asking again for the same path gives the
+existing job. An import only replaces the repo's files once it is done (each
+is renamed into place), so the previous data is served until then.
+
+A running job records the pid of its worker (on this machine); once that
+process is gone without finishing the job, e.g. as its server was
+restarted, the job is failed as 'lost'. A queued job records its owner, the
+server process whose pool is to run it: it waits for as long as the jobs
+before it take, unless its owner is gone, when it is lost as well (and
+asking for the repo again queues a new job).
+"""
+import os
+import pathlib
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+CANCELLING = 'cancelling'
+CANCELLED = 'cancelled'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE = (QUEUED, RUNNING, CANCELLING)
+
+# a running job of a worker that did not record its pid (jobs started before
+# workers did) without any progress for this long is considered lost
+STALE_SECONDS = 15 * 60
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    repo TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    walked INTEGER,
+    total INTEGER,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    updated REAL NOT NULL,
+    finished REAL,
+    pid INTEGER,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_repo_status ON jobs (repo, status);
+'''
+
+COLUMNS = ['id', 'repo', 'path', 'status', 'stage', 'walked', 'total', 'error',
+           'created', 'started', 'updated', 'finished', 'pid', 'owner']
+
+# tells this process from an earlier one that had the same pid, e.g. a
+# restarted server in a container
+PROCESS_TOKEN = uuid.uuid4().hex
+
+
+class Cancelled(Exception):
+    pass
+
+
+def jobsPath():
+    return pathlib.Path.cwd().joinpath('gitviz/data/').joinpath('jobs.sqlite')
+
+
+def reponame(repopath):
+    return repopath.rstrip('/').split('/')[-1]
+
+
+def alive(pid):
+    """Is there a process pid (on this machine)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # someone else's
+    return True
+
+
+def owner():
+    """The owner of the jobs this process queues"""
+    return '{}:{}'.format(os.getpid(), PROCESS_TOKEN)
+
+
+def owner_alive(owner):
+    """Is the process of owner() (None for jobs queued before owners were recorded) still there"""
+    if owner is None:
+        return False
+    pid, token = owner.split(':')
+    if int(pid) == os.getpid():
+        return token == PROCESS_TOKEN
+    return alive(int(pid))
+
+
+def description(row, now=None):
+    """Dict representation of a job row, with its ETA (in seconds) while walking"""
+    job = dict(zip(COLUMNS, row))
+    job['eta'] = None
+    if job['status'] == RUNNING and job['stage'] == 'walking' and job['walked'] and job['total']:
+        elapsed = (now or time.time()) - job['started']
+        job['eta'] = elapsed / job['walked'] * (job['total'] - job['walked'])
+    return job
+
+
+class JobTable:
+    """The jobs stored in the SQLite database at path"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(jobs)')]
+            if 'pid' not in columns:  # created before jobs recorded their worker
+                connection.execute('ALTER TABLE jobs ADD COLUMN pid INTEGER')
+            if 'owner' not in columns:  # created before queued jobs recorded their owner
+                connection.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_path_status ON jobs (path, status)')
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return Transaction(connection)
+
+    def enqueue(self, repopath):
+        """(job, created): the active job importing repopath, or a new queued one,
+        owned by this process"""
+        repopath = os.path.normpath(repopath)
+        repo = reponame(repopath)
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            self._expire(connection, now)
+            row = connection.execute('SELECT * FROM jobs WHERE path = ? AND status IN (?, ?, ?)',
+                                     (repopath,) + ACTIVE).fetchone()
+            if row is not None:
+                return description(row, now), False
+            cursor = connection.execute(
+                'INSERT INTO jobs (repo, path, status, created, updated, owner) VALUES (?, ?, ?, ?, ?, ?)',
+                (repo, repopath, QUEUED, now, now, owner()))
+            row = connection.execute('SELECT * FROM jobs WHERE id = ?', (cursor.lastrowid,)).fetchone()
+            return description(row, now), True
+
+    def _expire(self, connection, now):
+        """Fails the running jobs whose worker is gone, and the queued ones whose owner is"""
+        rows = connection.execute('SELECT id, pid, updated FROM jobs WHERE status IN (?, ?)',
+                                  (RUNNING, CANCELLING)).fetchall()
+        lost = [job_id for job_id, pid, updated in rows
+                if (not alive(pid) if pid is not None else updated < now - STALE_SECONDS)]
+        rows = connection.execute('SELECT id, owner FROM jobs WHERE status = ?', (QUEUED,)).fetchall()
+        lost += [job_id for job_id, job_owner in rows if not owner_alive(job_owner)]
+        for job_id in lost:
+            connection.execute('UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?',
+                               (FAILED, 'lost', now, job_id))
+
+    def get(self, job_id):
+        with self.connect() as connection:
+            row = connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return description(row) if row is not None else None
+
+    def recent(self, count=50):
+        with self.connect() as connection:
+            rows = connection.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (count,)).fetchall()
+        return [description(row) for row in rows]
+
+    def start(self, job_id):
+        """Marks a queued job running in this process. False if it was cancelled meanwhile."""
+        now = time.time()
+        with self.connect() as connection:
+            cursor = connection.execute('UPDATE jobs SET status = ?, started = ?, updated = ?, pid = ? '
+                                        'WHERE id = ? AND status = ?',
+                                        (RUNNING, now, now, os.getpid(), job_id, QUEUED))
+            return cursor.rowcount == 1
+
+    def progress(self, job_id, stage, walked, total):
+        """Records the progress of a running job; raises Cancelled if it is being
+        cancelled, unless it is writing (an import is not left half written)"""
+        with self.connect() as connection:
+            connection.execute('UPDATE jobs SET stage = ?, walked = COALESCE(?, walked), '
+                               'total = COALESCE(?, total), updated = ? WHERE id = ?',
+                               (stage, walked, total, time.time(), job_id))
+            status = connection.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+        if status == CANCELLING and stage != 'writing':
+            raise Cancelled()
+
+    def finish(self, job_id, status, error=None):
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute('UPDATE jobs SET status = ?, error = ?, updated = ?, finished = ? WHERE id = ?',
+                               (status, error, now, now, job_id))
+
+    def cancel(self, job_id):
+        """Cancels a queued job, or asks a running one to stop at its next progress.
+        Returns the job, None if there is no such job."""
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('UPDATE jobs SET status = ?, updated = ?, finished = ? WHERE id = ? AND status = ?',
+                               (CANCELLED, now, now, job_id, QUEUED))
+            connection.execute('UPDATE jobs SET status = ?, updated = ? WHERE id = ? AND status = ?',
+                               (CANCELLING, now, job_id, RUNNING))
+        return self.get(job_id)
+
+
+class Transaction:
+    """A connection, closed when leaving the with block (committing what was begun)"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.connection.in_transaction:
+                self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.connection.close()
+
+
+def run(tablePath, job_id, repopath):
+    """Runs an import job, in a worker process"""
+    # the web process only needs the job table
+    from . import git
+
+    table = JobTable(tablePath)
+    if not table.start(job_id):
+        return CANCELLED
+    print('-- job {}: importing {}'.format(job_id, repopath))
+    try:
+        git.importRepo(repopath, progress=lambda stage, walked, total:
+                       table.progress(job_id, stage, walked, total))
+    except Cancelled:
+        table.finish(job_id, CANCELLED)
+        return CANCELLED
+    except Exception as err:
+        table.finish(job_id, FAILED, '{}: {}'.format(type(err).__name__, err))
+        return FAILED
+    table.finish(job_id, DONE)
+    return DONE
+
+
+class JobQueue:
+    """Enqueues imports in the job table, and runs them in a pool of worker processes"""
+
+    def __init__(self, table, workers):
+        self.table = table
+        self.workers = workers
+        self.executor = None
+
+    def submit(self, repopath):
+        """(job, created), see JobTable.enqueue. A job queued by a server that is
+        gone (never to run it) is lost, so a new one is created and run here."""
+        repopath = os.path.abspath(repopath)
+        job, created = self.table.enqueue(repopath)
+        if created:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            self.executor.submit(run, self.table.path, job['id'], repopath)
+        return job, created
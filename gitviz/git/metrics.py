@@ -0,0 +1,156 @@
+"""Timers and counters of imports and requests
+
+Code is timed with `with metrics.timer(name):` and counted with
+metrics.count(name). Both go to the process wide registry (served by
+/metrics). An ImportRun also logs what one import took, stage by stage, as
+a JSON line of gitviz/data/imports.log.jsonl.
+"""
+import cProfile
+import json
+import pathlib
+import threading
+import time
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Timer:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def description(self):
+        return {'count': self.count, 'total': self.total, 'max': self.max}
+
+
+class Registry:
+    def __init__(self):
+        self.timers = defaultdict(Timer)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.timers[name].add(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'timers': {name: timer.description() for name, timer in self.timers.items()},
+                'counters': dict(self.counters)
+            }
+
+
+registry = Registry()
+
+
+def timer(name):
+    return registry.timer(name)
+
+
+def count(name, n=1):
+    registry.count(name, n)
+
+
+def merge(seconds, counters):
+    """Adds a difference() (e.g. from a worker process) to the registry"""
+    for name, elapsed in seconds.items():
+        registry.record(name, elapsed)
+    for name, value in counters.items():
+        registry.count(name, value)
+
+
+def difference(before, after):
+    """What was timed & counted between two snapshots: (seconds by timer, counters)"""
+    seconds = dict()
+    for name, timer in after['timers'].items():
+        elapsed = timer['total'] - before['timers'].get(name, {}).get('total', 0.0)
+        if elapsed or timer['count'] != before['timers'].get(name, {}).get('count', 0):
+            seconds[name] = elapsed
+    counters = {name: value - before['counters'].get(name, 0)
+                for name, value in after['counters'].items()
+                if value != before['counters'].get(name, 0)}
+    return seconds, counters
+
+
+def dataDirPath():
+    return pathlib.Path.cwd().joinpath('gitviz/data/')
+
+
+def importLogPath():
+    return dataDirPath().joinpath('imports.log.jsonl')
+
+
+def recent_imports(count=20):
+    """The last count entries of the import log, latest first"""
+    try:
+        lines = importLogPath().read_text().splitlines()
+    except FileNotFoundError:
+        return []
+    return [json.loads(line) for line in reversed(lines[-count:]) if line]
+
+
+class ImportRun:
+    """Measures one import, as a with block. Imports are expected to run one at a
+    time per process (as jobs & batch imports do), since the stages are the
+    difference of the registry's timers before and after.
+    With profile, a cProfile of the import is saved to gitviz/data/profiles/."""
+
+    def __init__(self, reponame, profile=False):
+        self.reponame = reponame
+        self.profiler = cProfile.Profile() if profile else None
+
+    def __enter__(self):
+        self.started = time.time()
+        self.before = registry.snapshot()
+        if self.profiler:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profiler:
+            self.profiler.disable()
+        duration = time.time() - self.started
+        stages, counters = difference(self.before, registry.snapshot())
+        walked = counters.get('import.commits', 0)
+        entry = {
+            'repo': self.reponame,
+            'started': self.started,
+            'duration': duration,
+            'status': 'ok' if exc_type is None else 'failed',
+            'stages': stages,
+            'counters': counters,
+            'commits_per_second': walked / stages['import.walk'] if stages.get('import.walk') else None
+        }
+        if exc_type is not None:
+            entry['error'] = ''.join(traceback.format_exception_only(exc_type, exc)).strip()
+        if self.profiler:
+            profilesPath = dataDirPath().joinpath('profiles')
+            profilesPath.mkdir(parents=True, exist_ok=True)
+            profilePath = profilesPath.joinpath('{}-{}.prof'.format(self.reponame, int(self.started)))
+            self.profiler.dump_stats(str(profilePath))
+            entry['profile'] = str(profilePath)
+        registry.record('import', duration)
+        with open(str(importLogPath()), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.entry = entry
+        return False
@@ -0,0 +1,119 @@
+"""Bounded & sampled imports, for histories too large to analyze in full
+
+An ImportMode limits the commits walked: to a [since, until) window of commit
+times, to the last N days before HEAD's commit, or to the latest N commits.
+The walk is sorted by commit time, so it stops at the first commit older
+than the window (or once enough commits were taken) instead of reading the
+rest of the history. A sampled mode also keeps only a fraction of the
+commits, stratified by month: the first commit of every month is kept, then
+every 1/sample-th, so that overview charts still cover the whole span.
+
+A mode can also walk several refs at once instead of HEAD (see refs.py).
+
+The statistics of an analysis (percentiles, author splits, file stats) are
+those of the commits it kept. Artifacts record the mode they were made with.
+"""
+import datetime
+import math
+from collections import Counter
+
+DAY = 24 * 60 * 60
+
+FULL = 'full'
+BOUNDED = 'bounded'
+SAMPLED = 'sampled'
+
+
+def stratum(commit_time):
+    """The month of a commit time, (year, month) in UTC"""
+    day = datetime.datetime.fromtimestamp(commit_time, datetime.timezone.utc)
+    return day.year, day.month
+
+
+class ImportMode:
+    def __init__(self, since=None, until=None, max_commits=None, last_days=None, sample=None, refs=None):
+        self.since = since  # epoch of the oldest commit time kept
+        self.until = until  # epoch past the newest commit time kept
+        self.max_commits = max_commits  # non-merge commits kept, latest first
+        self.last_days = last_days  # days before HEAD's commit time kept
+        self.sample = sample  # fraction of the commits of each month kept, in (0, 1]
+        self.refs = refs  # patterns of the refs walked (see refs.resolve), None for HEAD only
+        if sample is not None and not 0 < sample <= 1:
+            raise ValueError('sample is a fraction in (0, 1], not {}'.format(sample))
+        if max_commits is not None and max_commits < 1:
+            raise ValueError('max_commits must be positive, not {}'.format(max_commits))
+
+    def kind(self):
+        if self.sample is not None and self.sample < 1:
+            return SAMPLED
+        if any(bound is not None for bound in [self.since, self.until, self.max_commits, self.last_days]):
+            return BOUNDED
+        return FULL
+
+    def is_full(self):
+        return self.kind() == FULL
+
+    def is_incremental(self):
+        """Can an import add the commits since the last one to it? Bounded or sampled
+        imports depend on where HEAD is, multi-ref ones on where every ref is."""
+        return self.is_full() and self.refs is None
+
+    def description(self):
+        """Returns a dict representation, as recorded in artifacts and import states"""
+        description = {'kind': self.kind()}
+        for name in ['since', 'until', 'max_commits', 'last_days', 'sample', 'refs']:
+            if getattr(self, name) is not None:
+                description[name] = getattr(self, name)
+        return description
+
+    @classmethod
+    def from_description(cls, description):
+        description = dict(description or {})
+        description.pop('kind', None)
+        return cls(**description)
+
+    def oldest(self, head_time):
+        """The oldest commit time kept, given HEAD's, None if unbounded"""
+        bounds = []
+        if self.since is not None:
+            bounds.append(self.since)
+        if self.last_days is not None:
+            bounds.append(head_time - self.last_days * DAY)
+        return max(bounds) if bounds else None
+
+    def select(self, pairs, head_time, time_sorted=True):
+        """Yields the (commit, value) pairs (of a walk latest first) whose commits the
+        mode keeps. If the walk is sorted by time, it stops at the first commit
+        older than the window; otherwise (e.g. the topological walk of refs.walk())
+        an older commit can come before newer ones, so it goes on to the end."""
+        if self.is_full():
+            yield from pairs
+            return
+        oldest = self.oldest(head_time)
+        sampled = self.kind() == SAMPLED
+        taken = 0
+        seen = Counter()  # (key: stratum, value: commits seen in it)
+        for commit, value in pairs:
+            if oldest is not None and commit.commit_time < oldest:
+                if time_sorted:
+                    break
+                continue
+            if self.until is not None and commit.commit_time >= self.until:
+                continue
+            merge = len(commit.parents) > 1
+            if sampled:
+                if merge:
+                    continue  # only counted in the authors' commit indices, so left out with the rest
+                month = stratum(commit.commit_time)
+                seen[month] += 1
+                if not self.takes(seen[month]):
+                    continue
+            yield commit, value
+            if not merge:
+                taken += 1
+                if self.max_commits is not None and taken >= self.max_commits:
+                    break
+
+    def takes(self, n):
+        """Is the nth commit of a stratum (from 1) in the sample? The first always is."""
+        return n == 1 or math.floor((n - 1) * self.sample) != math.floor((n - 2) * self.sample)
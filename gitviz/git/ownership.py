@@ -0,0 +1,229 @@
+"""Who owns the lines of the files with most commits, and how that changed
+
+Rather than a blame of each file at each commit, each file's history (as
+resolved by filestats.maxfilestats, renames included) is walked forward
+once: each version is diffed against the previous one, lines added by the
+diff's hunks are owned by that commit, and the others keep their owner.
+Ownership is held as runs: [line count, sha of the owning commit].
+
+Every CHECKPOINT_EVERY versions, a snapshot of the lines owned by each
+commit is kept; the artifact gets them (by author, see snapshots()) along
+with the ownership at the last version. What a file's walk ended with is
+kept in the import state, with the oid of the blob it describes: a file
+whose blob is the same on re-import costs nothing, and one with new
+versions only has those diffed.
+"""
+from collections import Counter
+
+import numpy as np
+
+from . import metrics
+
+CHECKPOINT_EVERY = 20
+
+
+def append(runs, count, owner):
+    if count <= 0:
+        return
+    if runs and runs[-1][1] == owner:
+        runs[-1][0] += count
+    else:
+        runs.append([count, owner])
+
+
+class RunReader:
+    """Reads lines from runs, in order"""
+
+    def __init__(self, runs):
+        self.runs = runs
+        self.i = 0
+        self.offset = 0  # lines of runs[i] read
+
+    def take(self, count, into=None):
+        """Reads count lines (or what remains), appending their runs to into if given"""
+        while count > 0 and self.i < len(self.runs):
+            length, owner = self.runs[self.i]
+            n = min(count, length - self.offset)
+            if into is not None:
+                append(into, n, owner)
+            self.offset += n
+            count -= n
+            if self.offset == length:
+                self.i += 1
+                self.offset = 0
+
+    def rest(self, into):
+        if self.i < len(self.runs):
+            append(into, self.runs[self.i][0] - self.offset, self.runs[self.i][1])
+            for length, owner in self.runs[self.i + 1:]:
+                append(into, length, owner)
+        self.i = len(self.runs)
+
+
+def apply(runs, hunks, owner):
+    """The runs after the hunks of a diff, added lines owned by owner.
+    hunks are (old start, old lines, [(origin, count)]) as in a unified diff,
+    origin being ' ' (context), '-' (deleted) or '+' (added)."""
+    reader = RunReader(runs)
+    result = []
+    consumed = 0  # lines of the old version read
+    for old_start, old_lines, lines in hunks:
+        # a hunk that only adds lines starts after its old start
+        first = old_start - 1 if old_lines else old_start
+        reader.take(first - consumed, result)
+        consumed = first
+        for origin, count in lines:
+            if origin == ' ':
+                reader.take(count, result)
+                consumed += count
+            elif origin == '-':
+                reader.take(count)
+                consumed += count
+            elif origin == '+':
+                append(result, count, owner)
+    reader.rest(result)
+    return result
+
+
+def line_count(data):
+    return data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+
+
+def hunks_of(patch):
+    """apply() hunks of a pygit2.Patch"""
+    hunks = []
+    for hunk in patch.hunks:
+        lines = []
+        for line in hunk.lines:
+            if line.origin in ' -+':
+                if lines and lines[-1][0] == line.origin:
+                    lines[-1][1] += 1
+                else:
+                    lines.append([line.origin, 1])
+        hunks.append((hunk.old_start, hunk.old_lines, lines))
+    return hunks
+
+
+def owners(runs):
+    """Lines owned by each sha"""
+    counts = Counter()
+    for count, owner in runs:
+        counts[owner] += count
+    return dict(counts)
+
+
+class FileHistory:
+    """A file's versions, oldest first: (sha, path) of each commit that changed it"""
+
+    def __init__(self, file, shas, graph):
+        self.file = file
+        names = [file] + graph.earlier_names(file)
+        self.versions = []
+        path = names[-1]
+        for sha in shas:
+            renamed = graph.renamed_to_in(path, sha)
+            if renamed:
+                path = renamed
+            self.versions.append((sha, path))
+        self.names = names
+
+    @classmethod
+    def from_filestats(cls, file, details, graph):
+        """History of one file of the serialized maxfilestats() details (newest first)"""
+        shas = list(dict.fromkeys(detail['sha'] for detail in reversed(details)))
+        return cls(file, shas, graph)
+
+
+def blob_at(session, sha, path, names):
+    """The file's blob at commit sha (at path, or under another of its names), None if absent"""
+    tree = session.get(sha).tree
+    for name in [path] + [name for name in names if name != path]:
+        try:
+            entry = tree[name]
+        except KeyError:
+            continue
+        return session.repo[entry.id]
+    return None
+
+
+def walk(session, history, entry=None):
+    """Ownership of the file through its history, continuing from the entry
+    (what the last walk ended with) if it is part of that history.
+    Returns the new entry: {sha, blob, versions, runs, checkpoints}."""
+    shas = [sha for sha, _ in history.versions]
+    start = 0
+    if entry is not None and entry['sha'] in shas:
+        start = shas.index(entry['sha']) + 1
+        if start == len(shas):
+            metrics.count('ownership.unchanged')
+            return entry
+        runs, checkpoints, versions = entry['runs'], list(entry['checkpoints']), entry['versions']
+        blob_id = entry['blob']
+        previous = session.repo[blob_id] if blob_id else None
+    else:
+        runs, checkpoints, previous, versions, blob_id = [], [], None, 0, None
+
+    for sha, path in history.versions[start:]:
+        blob = blob_at(session, sha, path, history.names)
+        versions += 1
+        if blob is None:
+            runs, previous, blob_id = [], None, None  # deleted here
+        elif blob.is_binary:
+            return None
+        elif previous is None:
+            runs, previous, blob_id = [], blob, str(blob.id)
+            append(runs, line_count(blob.data), sha)
+        elif blob.id != previous.id:
+            with metrics.timer('ownership.diff'):
+                runs = apply(runs, hunks_of(previous.diff(blob)), sha)
+            previous, blob_id = blob, str(blob.id)
+        metrics.count('ownership.versions')
+        if versions % CHECKPOINT_EVERY == 0:
+            checkpoints.append({'sha': sha, 'owners': owners(runs)})
+    return {'sha': shas[-1], 'blob': blob_id, 'versions': versions, 'runs': runs, 'checkpoints': checkpoints}
+
+
+def update(session, filestats, graph, entries):
+    """The entries ({file: walk() entry}) of the filestats files, continued from
+    the previous entries (e.g. of the import state)"""
+    updated = dict()
+    for file, details in (filestats or {}).items():
+        history = FileHistory.from_filestats(file, details, graph)
+        if not history.versions:
+            continue
+        entry = walk(session, history, entries.get(file))
+        if entry is not None:
+            updated[file] = entry
+    return updated
+
+
+def author_lines(owned, commit_authors):
+    """[[author id, lines], ...] of the {sha: lines}, most lines first"""
+    counts = Counter()
+    for sha, lines in owned.items():
+        author_id = commit_authors.get(sha)
+        if author_id is not None:
+            counts[author_id] += lines
+    return [[author_id, lines] for author_id, lines in
+            sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+
+
+def snapshots(entries, result):
+    """What the artifact keeps of the entries, with the author ids & commit indices
+    of the analysis.Analysis result: for each file, its lines and their
+    authors now, and at each checkpoint"""
+    _, dense_authors = np.unique(result.commits.authors, return_inverse=True)
+    shas = [sha.decode('ascii') for sha in result.commits.shas.tolist()]
+    commit_indices = {sha: i for i, sha in enumerate(shas)}
+    commit_authors = dict(zip(shas, dense_authors.tolist()))
+    files = dict()
+    for file, entry in entries.items():
+        files[file] = {
+            'lines': sum(count for count, _ in entry['runs']),
+            'authors': author_lines(owners(entry['runs']), commit_authors),
+            'checkpoints': [{
+                'commit_index': commit_indices.get(checkpoint['sha']),
+                'authors': author_lines(checkpoint['owners'], commit_authors)
+            } for checkpoint in entry['checkpoints']]
+        }
+    return files
@@ -0,0 +1,61 @@
+import gzip
+import os
+import pathlib
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is precompressed
+    brotli = None
+
+# (Content-Encoding, file suffix), in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def envelopePath(reponame, encoding=None, schema=1):
+    """Path of the get_repo response for reponame in schema (see wire.py),
+    optionally compressed with encoding"""
+    name = reponame + ('.envelope' if schema == 1 else '.v{}.envelope'.format(schema))
+    path = pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(name)
+    suffix = dict(ENCODINGS).get(encoding, '')
+    return path.with_name(path.name + suffix)
+
+
+# bytes read at a time when compressing
+BLOCK_SIZE = 1 << 20
+
+
+def write_compressed(source, path, encoding):
+    """Compresses the file at source into path, a block at a time.
+    Returns False if the encoding isn't available."""
+    if encoding == 'br' and brotli is None:
+        return False
+    tmpPath = str(path) + '.tmp'
+    with open(str(source), 'rb') as f, open(tmpPath, 'wb') as out:
+        if encoding == 'gzip':
+            # no timestamp, so that the same body always gives the same file
+            with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9, mtime=0) as compressor:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                    compressor.write(block)
+        else:
+            compressor = brotli.Compressor()
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                out.write(compressor.process(block))
+            out.write(compressor.finish())
+    os.replace(tmpPath, str(path))
+    return True
+
+
+def write(reponame, pieces, schema=1):
+    """Writes the response body in schema, given as pieces of text, and its
+    precompressed forms. The uncompressed envelope is moved into place last,
+    as it marks all of them ready."""
+    path = envelopePath(reponame, schema=schema)
+    tmpPath = str(path) + '.tmp'
+    with open(tmpPath, 'w', encoding='utf-8') as f:
+        for piece in pieces:
+            f.write(piece)
+    for encoding, _ in ENCODINGS:
+        compressedPath = envelopePath(reponame, encoding, schema)
+        if not write_compressed(tmpPath, compressedPath, encoding) and compressedPath.exists():
+            compressedPath.unlink()  # would be stale
+    os.replace(tmpPath, str(path))
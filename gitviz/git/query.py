@@ -0,0 +1,67 @@
+import numpy as np
+
+from . import table
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+
+def window_bounds(stored, start, end):
+    """Positions [lo, hi) in the artifact's time index of the commits in [start, end)"""
+    epochs, _ = stored.time_index()
+    lo = int(np.searchsorted(epochs, start, side='left'))
+    hi = int(np.searchsorted(epochs, end, side='left'))
+    return lo, hi
+
+
+def commits_in_window(stored, start, end, cursor=None, limit=DEFAULT_LIMIT):
+    """Commits of the artifact.Artifact stored with author time in [start, end)
+    (seconds since the epoch), oldest first, at most limit (1 to MAX_LIMIT) of them
+    from cursor.
+
+    The result also has the authors of those commits, the line stats of the
+    whole window, and the cursor of the next page (None on the last page).
+    Each commit has its 'index' in the full, latest first, list of commits.
+    """
+    _, time_order = stored.time_index()
+    lo, hi = window_bounds(stored, start, end)
+    first = lo if cursor is None else min(max(lo, cursor), hi)
+    # a page has at least one commit, so that next_cursor moves forward
+    last = min(hi, first + max(1, min(limit, MAX_LIMIT)))
+
+    all_commits = stored.commits()
+    author_names = stored.string_table('author_names')
+    author_emails = stored.string_table('author_emails')
+    indices = np.asarray(time_order[first:last], dtype=np.int64)
+    page = all_commits.take(indices)
+    commits = page.descriptions(author_names, author_emails)
+    for commit, index in zip(commits, indices.tolist()):
+        commit['index'] = index
+
+    author_ids, counts = np.unique(page.authors, return_counts=True)
+    authors = [{
+        'name': author_names[author_id],
+        'email': author_emails[author_id],
+        'commits': count
+    } for author_id, count in zip(author_ids.tolist(), counts.tolist())]
+    authors.sort(key=lambda author: author['commits'], reverse=True)
+
+    return {
+        'start': start,
+        'end': end,
+        'total': hi - lo,
+        'commits': commits,
+        'authors': authors,
+        'line_stats': window_line_stats(all_commits, time_order[lo:hi]),
+        'next_cursor': last if last < hi else None
+    }
+
+
+def window_line_stats(commits, indices):
+    """percentile_stat_info of the commits at indices, or None if none have parents"""
+    indices = np.asarray(indices, dtype=np.int64)
+    has_parents = commits.parents[indices] > 0
+    if not has_parents.any():
+        return None
+    return table.percentile_stat_info(commits.insertions[indices][has_parents],
+                                      commits.deletions[indices][has_parents])
@@ -0,0 +1,190 @@
+"""The commit records of an import, kept on disk rather than in memory
+
+The walk yields a record per commit (see git.filter_commits() & enrich()),
+with the per-file line stats and renames of included commits. Everything
+after the walk reads them again: the file index, the rename graph, the
+commit table, the directory tree and the database. So they are written to a
+SQLite file as they stream past, in walk order, and read back one at a time:
+peak memory is bounded by what is built from them, not by the history.
+
+A record's own fields are stored as JSON, its 'files' and 'renames' in
+tables of their own, which also answer the queries of a
+fileindex.FileChangeIndex (top_files & details) without loading them.
+The file is what the next import continues from (see importstate).
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import weakref
+
+SCHEMA = '''
+CREATE TABLE commits (seq INTEGER PRIMARY KEY, sha TEXT NOT NULL, record TEXT NOT NULL);
+CREATE TABLE changes (seq INTEGER NOT NULL, path TEXT NOT NULL, insertions INTEGER NOT NULL,
+                      deletions INTEGER NOT NULL);
+CREATE TABLE renames (seq INTEGER NOT NULL, old_path TEXT NOT NULL, new_path TEXT NOT NULL);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+'''
+
+# created once the records are written, which is faster than maintaining them
+INDEXES = '''
+CREATE INDEX changes_path ON changes (path, seq);
+'''
+
+# rows inserted at once
+BATCH_SIZE = 10000
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def grouped(rows):
+    """Yields (seq, [row without its seq]) of rows ordered by seq"""
+    seq, group = None, []
+    for row in rows:
+        if row[0] != seq:
+            if group:
+                yield seq, group
+            seq, group = row[0], []
+        group.append(list(row[1:]))
+    if group:
+        yield seq, group
+
+
+class RecordStore:
+    """The records in the SQLite file at path. Without a path, in a temporary
+    file, removed once the store is closed (or collected)."""
+
+    def __init__(self, path=None):
+        if path is None:
+            descriptor, path = tempfile.mkstemp(suffix='.records.sqlite')
+            os.close(descriptor)
+            self._removal = weakref.finalize(self, remove, path)
+        else:
+            self._removal = None
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path)
+
+    @classmethod
+    def create(cls, path=None):
+        """A new, empty store at path (replacing what is there), or a temporary one"""
+        if path is not None:
+            remove(str(path))
+        store = cls(path)
+        store.connection.executescript(SCHEMA)
+        return store
+
+    def write(self, records, head):
+        """Stores the records (an iterable of record dicts, in walk order) and the
+        head they are the history of. Returns how many were stored."""
+        commit_rows, change_rows, rename_rows = [], [], []
+        count = 0
+        in_time_order, previous_time = True, None
+
+        def flush():
+            self.connection.executemany('INSERT INTO commits VALUES (?, ?, ?)', commit_rows)
+            self.connection.executemany('INSERT INTO changes VALUES (?, ?, ?, ?)', change_rows)
+            self.connection.executemany('INSERT INTO renames VALUES (?, ?, ?)', rename_rows)
+            del commit_rows[:], change_rows[:], rename_rows[:]
+
+        for seq, record in enumerate(records):
+            fields = {key: value for key, value in record.items() if key not in ('files', 'renames')}
+            commit_rows.append((seq, record['sha'], json.dumps(fields)))
+            for file, insertions, deletions in record.get('files', []):
+                change_rows.append((seq, file, insertions, deletions))
+            for old_path, new_path in record.get('renames', []):
+                rename_rows.append((seq, old_path, new_path))
+            if previous_time is not None and record['commit_time'] > previous_time:
+                in_time_order = False
+            previous_time = record['commit_time']
+            count += 1
+            if len(commit_rows) >= BATCH_SIZE:
+                flush()
+        flush()
+        self.connection.executescript(INDEXES)
+        self.connection.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                    [('head', head), ('in_time_order', str(int(in_time_order)))])
+        self.connection.commit()
+        return count
+
+    @property
+    def head(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'head'").fetchone()
+        return row[0] if row is not None else None
+
+    def in_time_order(self):
+        """Were the records written latest commit time first? They are not when
+        some commit has a parent with a later commit time (its author's clock was
+        ahead): a time-sorted walk only gets to the parent after the child."""
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'in_time_order'").fetchone()
+        return row is not None and row[0] == '1'
+
+    def records(self, files=True):
+        """Yields the records in walk order, with their 'files' (unless files is
+        false) and 'renames', as they were written"""
+        commits = self.connection.execute('SELECT seq, record FROM commits ORDER BY seq')
+        # each table is read along with the commits, rather than queried per commit
+        changes = grouped(self.connection.cursor().execute(
+            'SELECT seq, path, insertions, deletions FROM changes ORDER BY seq, rowid')) if files else iter([])
+        renames = grouped(self.connection.cursor().execute(
+            'SELECT seq, old_path, new_path FROM renames ORDER BY seq, rowid'))
+        next_changes, next_renames = next(changes, None), next(renames, None)
+        for seq, fields in commits:
+            record = json.loads(fields)
+            if files and 'insertions' in record:
+                record['files'] = []
+                if next_changes is not None and next_changes[0] == seq:
+                    record['files'] = next_changes[1]
+                    next_changes = next(changes, None)
+            if next_renames is not None and next_renames[0] == seq:
+                record['renames'] = next_renames[1]
+                next_renames = next(renames, None)
+            yield record
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM commits').fetchone()[0]
+
+    # the queries of a fileindex.FileChangeIndex
+
+    def top_files(self, count, include=None):
+        """The count paths with most commits, most first (then in the order they
+        were first changed in the walk). If provided, include(path) filters the candidates."""
+        top = []
+        for path, in self.connection.execute('SELECT path FROM changes GROUP BY path '
+                                             'ORDER BY COUNT(*) DESC, MIN(rowid)'):
+            if len(top) == count:
+                break
+            if include is None or include(path):
+                top.append(path)
+        return top
+
+    def details(self, repo, path):
+        """Commit details for path, see fileindex.FileChangeIndex.details"""
+        rows = self.connection.execute('SELECT commits.sha, changes.insertions, changes.deletions '
+                                       'FROM changes JOIN commits ON commits.seq = changes.seq '
+                                       'WHERE changes.path = ? ORDER BY changes.seq', (path,)).fetchall()
+        return [{
+            'insertions': ins,
+            'deletions': dels,
+            'file': path,
+            'commit': repo.get(sha)
+        } for sha, ins, dels in rows]
+
+    def move(self, path):
+        """Moves the store's file to path (replacing what is there)"""
+        self.connection.close()
+        os.replace(self.path, str(path))
+        if self._removal is not None:
+            self._removal.detach()
+            self._removal = None
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path)
+
+    def close(self):
+        self.connection.close()
+        if self._removal is not None:
+            self._removal()
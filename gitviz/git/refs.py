@@ -0,0 +1,102 @@
+"""Analysis of several refs (branches, tags) in one walk
+
+The tips of every ref matched are pushed to a single revision walk, so a
+commit shared by several refs is visited, and diffed, once. Which refs
+reach each commit is tracked as the walk goes: children come before their
+parents (the walk is topological), so a commit's membership is complete
+when it is visited, and is passed on to its parents then.
+
+Memberships are bitsets, bit i standing for the ith ref. The artifact
+stores them packed, one row of bytes per commit.
+"""
+import base64
+import fnmatch
+from collections import defaultdict
+
+import numpy as np
+import pygit2
+
+ALL_BRANCHES = 'refs/heads/*'
+ALL_TAGS = 'refs/tags/*'
+# prefixes a pattern may leave out
+SHORTHANDS = ['refs/heads/', 'refs/tags/', 'refs/remotes/']
+
+
+def matches(name, pattern):
+    """Does the ref name match the (fnmatch) pattern, in full or without its prefix?"""
+    if fnmatch.fnmatchcase(name, pattern):
+        return True
+    return any(name.startswith(prefix) and fnmatch.fnmatchcase(name[len(prefix):], pattern)
+               for prefix in SHORTHANDS)
+
+
+def resolve(repo, patterns):
+    """(name, commit oid) of the refs matching any of the patterns, in the order of
+    the patterns then by name. 'HEAD' is HEAD; refs not pointing to a commit are left out."""
+    names = sorted(repo.listall_references())
+    tips = dict()
+    for pattern in patterns:
+        if pattern == 'HEAD':
+            tips.setdefault('HEAD', repo.head.target)
+            continue
+        for name in names:
+            if name in tips or not matches(name, pattern):
+                continue
+            try:
+                tips[name] = repo.lookup_reference(name).peel(pygit2.Commit).id
+            except (ValueError, KeyError, pygit2.GitError):
+                continue  # not pointing to a commit
+    return list(tips.items())
+
+
+def walk(repo, tips):
+    """Walk stage: the commits reachable from any of the tips, each once,
+    children before parents and otherwise latest first"""
+    walker = repo.walk(tips[0][1], pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_TIME)
+    for _, oid in tips[1:]:
+        walker.push(oid)
+    return iter(walker)
+
+
+def memberships(commits, tips):
+    """Membership stage: yields (commit, bitset of the tips that reach it), for the
+    commits of walk(). Only the bitsets of the commits still to come are held."""
+    pending = defaultdict(int)  # (key: oid, value: bitset)
+    for i, (_, oid) in enumerate(tips):
+        pending[oid] |= 1 << i
+    for commit in commits:
+        bits = pending.pop(commit.id, 0)
+        for parent_id in commit.parent_ids:
+            pending[parent_id] |= bits
+        yield commit, bits
+
+
+def packed(records, shas, count):
+    """The bitsets of the records' commits ('refs' of each record) as a
+    (len(shas), bytes per bitset) uint8 array, in the order of shas"""
+    width = max(1, (count + 7) // 8)
+    rows = {record['sha']: record.get('refs', 0) for record in records}
+    bits = np.zeros((len(shas), width), dtype=np.uint8)
+    for i, sha in enumerate(shas):
+        bits[i] = np.frombuffer(rows.get(sha, 0).to_bytes(width, 'little'), dtype=np.uint8)
+    return bits
+
+
+def ref_column(bits, i):
+    """Which commits ref i reaches, as a boolean array, from packed() bitsets"""
+    return (bits[:, i // 8] >> (i % 8)) & 1 == 1
+
+
+def descriptions(names, bits):
+    """For each ref, its name, commit count, and which commits (in the order of the
+    rows of bits) it reaches: bit j of the base64 'commits_bits' is commit j, most
+    significant first"""
+    result = []
+    for i, name in enumerate(names):
+        reached = ref_column(bits, i)
+        result.append({
+            'name': name,
+            'commits': int(reached.sum()),
+            'commits_bits': base64.b64encode(np.packbits(reached).tobytes()).decode('ascii')
+        })
+    return result
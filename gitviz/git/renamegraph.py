@@ -0,0 +1,75 @@
+from collections import defaultdict
+
+import pygit2
+
+
+class RenameOptions:
+    """Similarity detection settings, passed to libgit2 for each diff
+    (never written to the repository's config)"""
+
+    def __init__(self, threshold=50, limit=1000):
+        self.threshold = threshold  # % of similarity for an add/delete pair to be a rename
+        self.limit = limit  # max number of files considered for detection in a commit
+
+
+def find_renames(diff, options):
+    """Returns [old path, new path] for each rename detected in diff.
+    Note: the diff's deltas are modified by the detection."""
+    statuses = set(delta.status for delta in diff.deltas)
+    if pygit2.GIT_DELTA_ADDED not in statuses or pygit2.GIT_DELTA_DELETED not in statuses:
+        return []  # nothing can pair up
+    diff.find_similar(flags=pygit2.GIT_DIFF_FIND_RENAMES,
+                      rename_threshold=options.threshold,
+                      rename_limit=options.limit)
+    return [[delta.old_file.path, delta.new_file.path]
+            for delta in diff.deltas if delta.status == pygit2.GIT_DELTA_RENAMED]
+
+
+class RenameGraph:
+    """old path -> new path edges, each with the commit that made the rename"""
+
+    def __init__(self):
+        self.renamed_to = defaultdict(dict)  # (key: old path, value: {sha: new path})
+        self.renamed_from = defaultdict(dict)  # (key: new path, value: {sha: old path})
+
+    def add(self, sha, renames):
+        for old_path, new_path in renames:
+            self.renamed_to[old_path][sha] = new_path
+            self.renamed_from[new_path][sha] = old_path
+
+    @classmethod
+    def from_records(cls, records):
+        """Graph built from the commit records of git.analyze()"""
+        graph = cls()
+        for record in records:
+            if 'renames' in record:
+                graph.add(record['sha'], record['renames'])
+        return graph
+
+    def renamed_to_in(self, path, sha):
+        """What path was renamed to in commit sha, if it was"""
+        return self.renamed_to.get(path, {}).get(sha)
+
+    def renamed_from_in(self, path, sha):
+        """What path was renamed from in commit sha, if it was"""
+        return self.renamed_from.get(path, {}).get(sha)
+
+    def earlier_names(self, path):
+        """The names path had before, most recent first"""
+        return self._chain(path, self.renamed_from)
+
+    def later_names(self, path):
+        """The names path was renamed to, in order"""
+        return self._chain(path, self.renamed_to)
+
+    def _chain(self, path, edges):
+        names = []
+        seen = {path}
+        while path in edges:
+            # if renamed more than once (e.g. on different branches), any will do
+            path = next(iter(edges[path].values()))
+            if path in seen:
+                break  # renamed back and forth
+            seen.add(path)
+            names.append(path)
+        return names
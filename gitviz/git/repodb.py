@@ -0,0 +1,279 @@
+"""Per-repo SQLite database of commits, file changes, authors and renames
+
+Written at import as gitviz/data/<repo>.sqlite (to a temporary file, then
+renamed into place), so that any file's or author's history, and the top files
+or authors of any time window, can be queried without walking the repo again.
+
+Commit ids are their index in the analysis (latest first, as in the artifact),
+author ids the dense ids of the artifact's author tables.
+"""
+import os
+import pathlib
+import sqlite3
+
+import numpy as np
+
+from . import formatters
+
+SCHEMA = '''
+CREATE TABLE authors (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    commits INTEGER NOT NULL,
+    insertions INTEGER NOT NULL,
+    deletions INTEGER NOT NULL
+);
+CREATE TABLE commits (
+    id INTEGER PRIMARY KEY,
+    sha TEXT NOT NULL UNIQUE,
+    epoch INTEGER NOT NULL,
+    utc_offset INTEGER NOT NULL,
+    author INTEGER NOT NULL REFERENCES authors (id),
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    message TEXT NOT NULL,
+    insertions INTEGER NOT NULL,
+    deletions INTEGER NOT NULL,
+    parents INTEGER NOT NULL
+);
+CREATE TABLE paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    commits INTEGER NOT NULL,
+    insertions INTEGER NOT NULL,
+    deletions INTEGER NOT NULL
+);
+CREATE TABLE changes (
+    commit_id INTEGER NOT NULL REFERENCES commits (id),
+    path INTEGER NOT NULL REFERENCES paths (id),
+    insertions INTEGER NOT NULL,
+    deletions INTEGER NOT NULL
+);
+CREATE TABLE renames (
+    commit_id INTEGER NOT NULL REFERENCES commits (id),
+    old_path TEXT NOT NULL,
+    new_path TEXT NOT NULL
+);
+CREATE INDEX commits_epoch ON commits (epoch);
+CREATE INDEX commits_author ON commits (author, epoch);
+CREATE INDEX commits_email ON commits (email);
+CREATE INDEX commits_name ON commits (name);
+CREATE INDEX changes_path ON changes (path, commit_id);
+CREATE INDEX changes_commit ON changes (commit_id);
+CREATE INDEX renames_new ON renames (new_path);
+CREATE INDEX renames_old ON renames (old_path);
+CREATE INDEX paths_commits ON paths (commits);
+CREATE INDEX authors_commits ON authors (commits);
+'''
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10000
+# commits written at once
+BATCH_SIZE = 10000
+
+
+def dbPath(reponame):
+    return pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(reponame + '.sqlite')
+
+
+def write(path, records, result):
+    """Writes the database of the included commit records (an iterable, read
+    once), as analyzed in result (an analysis.Analysis)"""
+    commits = result.commits
+    author_ids, dense_authors = np.unique(commits.authors, return_inverse=True)
+    commit_ids = {sha.decode('ascii'): i for i, sha in enumerate(commits.shas.tolist())}
+    dense_authors = dense_authors.tolist()
+
+    tmpPath = str(path) + '.tmp'
+    if os.path.exists(tmpPath):
+        os.remove(tmpPath)
+    connection = sqlite3.connect(tmpPath)
+    try:
+        connection.executescript(SCHEMA)
+        path_ids = dict()
+        path_totals = []  # [commits, insertions, deletions] by path id
+        author_totals = [[0, 0, 0] for _ in author_ids]
+        commit_rows, change_rows, rename_rows = [], [], []
+
+        def flush():
+            connection.executemany('INSERT INTO commits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', commit_rows)
+            connection.executemany('INSERT INTO changes VALUES (?, ?, ?, ?)', change_rows)
+            connection.executemany('INSERT INTO renames VALUES (?, ?, ?)', rename_rows)
+            del commit_rows[:], change_rows[:], rename_rows[:]
+
+        for record in records:
+            commit_id = commit_ids.get(record['sha'])
+            if commit_id is None:
+                continue  # a merge
+            author_id = dense_authors[commit_id]
+            commit_rows.append((commit_id, record['sha'], record['epoch'], record['offset'], author_id,
+                                record['name'], record['email'], record['message'],
+                                record['insertions'], record['deletions'], record['parents']))
+            totals = author_totals[author_id]
+            totals[0] += 1
+            totals[1] += record['insertions']
+            totals[2] += record['deletions']
+            for file, insertions, deletions in record['files']:
+                path_id = path_ids.get(file)
+                if path_id is None:
+                    path_id = path_ids[file] = len(path_ids)
+                    path_totals.append([0, 0, 0])
+                change_rows.append((commit_id, path_id, insertions, deletions))
+                totals = path_totals[path_id]
+                totals[0] += 1
+                totals[1] += insertions
+                totals[2] += deletions
+            for old_path, new_path in record.get('renames', []):
+                rename_rows.append((commit_id, old_path, new_path))
+            # the rows are inserted as they come, a batch at a time
+            if len(commit_rows) >= BATCH_SIZE:
+                flush()
+        flush()
+
+        connection.executemany('INSERT INTO authors VALUES (?, ?, ?, ?, ?, ?)', [
+            (i, result.author_names[author_id], result.author_emails[author_id]) + tuple(author_totals[i])
+            for i, author_id in enumerate(author_ids.tolist())])
+        connection.executemany('INSERT INTO paths VALUES (?, ?, ?, ?, ?)',
+                               [(path_id, file) + tuple(path_totals[path_id]) for file, path_id in path_ids.items()])
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmpPath, str(path))
+
+
+def page_bounds(offset, limit):
+    """(offset, limit) of a requested page, limit kept in [1, MAX_LIMIT] and offset from 0"""
+    return max(0, offset), max(1, min(limit, MAX_LIMIT))
+
+
+def page(rows, offset, limit):
+    """(first limit rows, cursor of the next page or None), from limit + 1 rows"""
+    next_cursor = offset + limit if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def commit_description(row):
+    sha, epoch, offset, name, email, message, insertions, deletions = row[:8]
+    return {
+        'sha': sha,
+        'time': formatters.time_string(epoch, offset),
+        'epoch': epoch,
+        'name': name,
+        'email': email,
+        'message': message,
+        'insertions': insertions,
+        'deletions': deletions
+    }
+
+
+COMMIT_COLUMNS = ('commits.sha, commits.epoch, commits.utc_offset, authors.name, authors.email, '
+                  'commits.message')
+
+
+class RepoDB:
+    """Queries of a repo's database, opened read only"""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True, check_same_thread=False)
+
+    def close(self):
+        self.connection.close()
+
+    def earlier_names(self, path):
+        """The paths path was renamed from, most recent first"""
+        names = []
+        seen = {path}
+        while True:
+            row = self.connection.execute('SELECT old_path FROM renames WHERE new_path = ? '
+                                          'ORDER BY commit_id LIMIT 1', (path,)).fetchone()
+            if row is None or row[0] in seen:
+                return names
+            path = row[0]
+            seen.add(path)
+            names.append(path)
+
+    def file_history(self, path, follow=True, offset=0, limit=DEFAULT_LIMIT):
+        """Commits that changed path (and, following renames, its earlier names),
+        latest first, with the lines changed in the file"""
+        offset, limit = page_bounds(offset, limit)
+        paths = [path] + (self.earlier_names(path) if follow else [])
+        # a rename commit changes both names: the row of the later name is kept
+        # (SQLite takes the bare columns from the row of the MIN)
+        position = 'CASE paths.path {} END'.format(' '.join('WHEN ? THEN {}'.format(i) for i in range(len(paths))))
+        rows = self.connection.execute(
+            'SELECT ' + COMMIT_COLUMNS + ', changes.insertions, changes.deletions, paths.path, '
+            'MIN(' + position + ') FROM paths JOIN changes ON changes.path = paths.id '
+            'JOIN commits ON commits.id = changes.commit_id JOIN authors ON authors.id = commits.author '
+            'WHERE paths.path IN ({}) GROUP BY commits.id ORDER BY commits.id '
+            'LIMIT ? OFFSET ?'.format(','.join('?' * len(paths))),
+            paths + paths + [limit + 1, offset]).fetchall()
+        rows, next_cursor = page(rows, offset, limit)
+        commits = []
+        for row in rows:
+            commit = commit_description(row)
+            commit['file'] = row[8]
+            commits.append(commit)
+        return {'path': path, 'paths': paths, 'commits': commits, 'next_cursor': next_cursor}
+
+    def authors_matching(self, email=None, name=None):
+        """Ids of the authors who committed with the email or name (any of their identities)"""
+        column, value = ('email', email) if email is not None else ('name', name)
+        rows = self.connection.execute('SELECT DISTINCT author FROM commits WHERE {} = ? COLLATE NOCASE'.format(column),
+                                       (value,)).fetchall()
+        return [row[0] for row in rows]
+
+    def author_history(self, email=None, name=None, start=None, end=None, offset=0, limit=DEFAULT_LIMIT):
+        """Commits of the author with the email or name, in [start, end), latest first"""
+        offset, limit = page_bounds(offset, limit)
+        ids = self.authors_matching(email, name)
+        if not ids:
+            return None
+        authors = [dict(zip(['name', 'email', 'commits', 'insertions', 'deletions'], row)) for row in
+                   self.connection.execute('SELECT name, email, commits, insertions, deletions FROM authors '
+                                           'WHERE id IN ({})'.format(','.join('?' * len(ids))), ids)]
+        rows = self.connection.execute(
+            'SELECT ' + COMMIT_COLUMNS + ', commits.insertions, commits.deletions '
+            'FROM commits JOIN authors ON authors.id = commits.author '
+            'WHERE commits.author IN ({}) AND commits.epoch >= ? AND commits.epoch < ? '
+            'ORDER BY commits.id LIMIT ? OFFSET ?'.format(','.join('?' * len(ids))),
+            ids + [window_start(start), window_end(end), limit + 1, offset]).fetchall()
+        rows, next_cursor = page(rows, offset, limit)
+        return {'authors': authors, 'commits': [commit_description(row) for row in rows],
+                'next_cursor': next_cursor}
+
+    def top_files(self, count=15, start=None, end=None):
+        """Files with most commits (in [start, end), if given)"""
+        if start is None and end is None:
+            rows = self.connection.execute('SELECT path, commits, insertions, deletions FROM paths '
+                                           'ORDER BY commits DESC, path LIMIT ?', (count,)).fetchall()
+        else:
+            rows = self.connection.execute(
+                'SELECT paths.path, COUNT(*) AS count, SUM(changes.insertions), SUM(changes.deletions) '
+                'FROM commits JOIN changes ON changes.commit_id = commits.id JOIN paths ON paths.id = changes.path '
+                'WHERE commits.epoch >= ? AND commits.epoch < ? '
+                'GROUP BY changes.path ORDER BY count DESC, paths.path LIMIT ?',
+                (window_start(start), window_end(end), count)).fetchall()
+        return [dict(zip(['file', 'commits', 'insertions', 'deletions'], row)) for row in rows]
+
+    def top_authors(self, count=15, start=None, end=None):
+        """Authors with most commits (in [start, end), if given)"""
+        if start is None and end is None:
+            rows = self.connection.execute('SELECT name, email, commits, insertions, deletions FROM authors '
+                                           'ORDER BY commits DESC, name LIMIT ?', (count,)).fetchall()
+        else:
+            rows = self.connection.execute(
+                'SELECT authors.name, authors.email, COUNT(*) AS count, SUM(commits.insertions), '
+                'SUM(commits.deletions) FROM commits JOIN authors ON authors.id = commits.author '
+                'WHERE commits.epoch >= ? AND commits.epoch < ? '
+                'GROUP BY commits.author ORDER BY count DESC, authors.name LIMIT ?',
+                (window_start(start), window_end(end), count)).fetchall()
+        return [dict(zip(['name', 'email', 'commits', 'insertions', 'deletions'], row)) for row in rows]
+
+
+def window_start(start):
+    return start if start is not None else -2**63
+
+
+def window_end(end):
+    return end if end is not None else 2**63 - 1
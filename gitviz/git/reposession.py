@@ -0,0 +1,97 @@
+"""One open repository, shared by everything an import does with it
+
+A RepoSession owns the pygit2 handle of a repo, and caches the commits
+looked up through it, so helpers don't each open the repo again or re-read
+the same commits. Objects are read in process through the handle; the git
+commands still run (e.g. the batched `git log` of filestats) go through the
+session too, with `git -C <path>` and argument lists (no shell, so any path
+is safe).
+
+Helpers that used to take a repo path take a session or a path (see of()).
+The import passes its session; given a path, a helper opens the repo for
+that call only.
+"""
+import subprocess
+from collections import OrderedDict
+
+import pygit2
+
+from . import metrics
+
+# commits kept per session
+CACHE_SIZE = 65536
+
+
+class LRU:
+    """A dict of at most size entries, the least recently used evicted first"""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class RepoSession:
+    def __init__(self, path, cache_size=CACHE_SIZE):
+        self.path = str(path)
+        with metrics.timer('reposession.open'):
+            self.repo = pygit2.Repository(self.path)
+        self.commits = LRU(cache_size)  # (key: sha, value: pygit2.Commit)
+
+    def get(self, sha):
+        """The commit sha (hex), like pygit2.Repository.get, from the cache if read before"""
+        sha = str(sha)
+        commit = self.commits.get(sha)
+        if commit is None:
+            metrics.count('reposession.misses')
+            commit = self.repo.get(sha)
+            if commit is not None:
+                self.commits.put(sha, commit)
+        return commit
+
+    def get_many(self, shas):
+        """The commits of shas, in that order. Each distinct one is looked up once."""
+        return [self.get(sha) for sha in shas]
+
+    def is_first_commit(self, sha):
+        return len(self.get(sha).parents) == 0
+
+    def git(self, *args):
+        """The output of git with args, in the repo"""
+        metrics.count('subprocess.calls')
+        with metrics.timer('subprocess'):
+            return subprocess.check_output(['git', '-C', self.path] + list(args))
+
+    def popen_git(self, *args):
+        """git with args, in the repo, its output streamed from .stdout"""
+        metrics.count('subprocess.calls')
+        return subprocess.Popen(['git', '-C', self.path] + list(args), stdout=subprocess.PIPE)
+
+    def close(self):
+        """Drops the cached commits"""
+        self.commits = LRU(self.commits.size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def of(repo):
+    """The RepoSession of repo, a session or the path of a repo (opened then)"""
+    if isinstance(repo, RepoSession):
+        return repo
+    return RepoSession(repo)
@@ -0,0 +1,70 @@
+"""Aggregates computed at import, so that overview charts never need every commit"""
+import numpy as np
+
+from . import table
+
+HOURS_PER_WEEK = 7 * 24
+SECONDS_PER_WEEK = 7 * table.SECONDS_PER_DAY
+# weeks start on Monday; 1970-01-01 was a Thursday
+WEEK_SHIFT = table.EPOCH_WEEKDAY * table.SECONDS_PER_DAY
+
+
+def bin_starts(epochs, resolution):
+    """Start (seconds since the epoch, UTC) of the day, week or month of each epoch"""
+    if resolution == 'day':
+        return epochs // table.SECONDS_PER_DAY * table.SECONDS_PER_DAY
+    if resolution == 'week':
+        return (epochs + WEEK_SHIFT) // SECONDS_PER_WEEK * SECONDS_PER_WEEK - WEEK_SHIFT
+    if resolution == 'month':
+        months = epochs.astype('datetime64[s]').astype('datetime64[M]')
+        return months.astype('datetime64[s]').astype(np.int64)
+    raise ValueError('unknown resolution: {}'.format(resolution))
+
+
+def histogram(commits, resolution):
+    """Commits and churn per (non empty) day, week or month"""
+    starts, bins = np.unique(bin_starts(commits.epochs, resolution), return_inverse=True)
+    count = len(starts)
+    return {
+        'starts': starts.tolist(),
+        'commits': np.bincount(bins, minlength=count).tolist(),
+        'insertions': np.bincount(bins, weights=commits.insertions, minlength=count).astype(np.int64).tolist(),
+        'deletions': np.bincount(bins, weights=commits.deletions, minlength=count).astype(np.int64).tolist()
+    }
+
+
+def author_rollups(commits, author_names, author_emails):
+    """For each author, latest first: commit count, activity span,
+    and a weekday (Monday first) x hour matrix of commits in local time"""
+    author_ids, authors = np.unique(commits.authors, return_inverse=True)
+    count = len(author_ids)
+    local_times = commits.local_times()
+    weekdays = (local_times // table.SECONDS_PER_DAY + table.EPOCH_WEEKDAY) % 7
+    hours = (local_times // 3600) % 24
+    rhythms = np.bincount(authors * HOURS_PER_WEEK + weekdays * 24 + hours,
+                          minlength=count * HOURS_PER_WEEK).reshape(count, 7, 24)
+    firsts = np.full(count, np.iinfo(np.int64).max, dtype=np.int64)
+    lasts = np.full(count, np.iinfo(np.int64).min, dtype=np.int64)
+    np.minimum.at(firsts, authors, commits.epochs)
+    np.maximum.at(lasts, authors, commits.epochs)
+    commit_counts = np.bincount(authors, minlength=count)
+
+    rollups = [{
+        'name': author_names[author_id],
+        'email': author_emails[author_id],
+        'commits': int(commit_counts[i]),
+        'first': int(firsts[i]),
+        'last': int(lasts[i]),
+        'rhythm': rhythms[i].tolist()
+    } for i, author_id in enumerate(author_ids.tolist())]
+    rollups.sort(key=lambda rollup: rollup['last'], reverse=True)
+    return rollups
+
+
+def rollups(commits, author_names, author_emails):
+    """All the rollups of a table.CommitTable"""
+    return {
+        'histograms': {resolution: histogram(commits, resolution)
+                       for resolution in ['day', 'week', 'month']},
+        'authors': author_rollups(commits, author_names, author_emails)
+    }
@@ -0,0 +1,150 @@
+"""Diff stats of commits, cached on disk and shared by every repo
+
+The stats of a commit only depend on its tree and its first parent's tree,
+so they are keyed by that pair of oids (and the rename options), and forks,
+mirrors & rebased copies of a history share them. Entries are stored in
+gitviz/data/diffstats.sqlite, compressed; once over the size cap the least
+recently used are evicted.
+"""
+import json
+import pathlib
+import sqlite3
+import time
+import zlib
+
+from . import metrics
+
+# bytes of compressed stats kept
+MAX_BYTES = 1024 * 1024 * 1024
+# entries written at once
+FLUSH_SIZE = 1000
+# evicting goes down to this fraction of the cap, so that it doesn't happen on every flush
+EVICT_TO = 0.9
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stats (
+    parent_tree TEXT NOT NULL,
+    tree TEXT NOT NULL,
+    options TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (parent_tree, tree, options)
+);
+CREATE INDEX IF NOT EXISTS stats_used ON stats (used);
+CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL);
+INSERT OR IGNORE INTO totals VALUES (0, 0);
+'''
+
+
+def cachePath():
+    return pathlib.Path.cwd().joinpath('gitviz/data/').joinpath('diffstats.sqlite')
+
+
+def key(commit, rename_options=None):
+    """(parent tree, tree, options) of the commit's stats (see diffstats.commit_file_stats)"""
+    parent_tree = str(commit.parents[0].tree_id) if commit.parents else ''
+    options = ('{}/{}'.format(rename_options.threshold, rename_options.limit)
+               if rename_options is not None else '')
+    return parent_tree, str(commit.tree_id), options
+
+
+def encoded(stats):
+    return zlib.compress(json.dumps(stats, separators=(',', ':')).encode('utf-8'))
+
+
+def decoded(data):
+    ins, dels, files, renames = json.loads(zlib.decompress(data).decode('utf-8'))
+    return ins, dels, files, renames
+
+
+class StatCache:
+    """The cache at path, holding at most max_bytes of stats.
+    New entries & uses are buffered until flush() (or close())."""
+
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.pending = dict()  # (key: key, value: encoded stats)
+        self.used = set()  # keys read since the last flush
+
+    def get(self, key):
+        """The stats stored for key, None if not cached"""
+        data = self.pending.get(key)
+        if data is None:
+            row = self.connection.execute('SELECT data FROM stats WHERE parent_tree = ? AND tree = ? AND options = ?',
+                                          key).fetchone()
+            if row is None:
+                metrics.count('statcache.misses')
+                return None
+            data = row[0]
+            self.used.add(key)
+        metrics.count('statcache.hits')
+        return decoded(data)
+
+    def put(self, key, stats):
+        self.pending[key] = encoded(stats)
+        if len(self.pending) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        now = time.time()
+        with metrics.timer('statcache.flush'):
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                for key, data in self.pending.items():
+                    previous = self.connection.execute(
+                        'SELECT size FROM stats WHERE parent_tree = ? AND tree = ? AND options = ?', key).fetchone()
+                    self.connection.execute('INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?, ?, ?)',
+                                            key + (data, len(data), now))
+                    self.connection.execute('UPDATE totals SET size = size + ?',
+                                            (len(data) - (previous[0] if previous else 0),))
+                self.connection.executemany(
+                    'UPDATE stats SET used = ? WHERE parent_tree = ? AND tree = ? AND options = ?',
+                    [(now,) + key for key in self.used])
+                self.evict()
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+        self.pending.clear()
+        self.used.clear()
+
+    def evict(self):
+        """Removes the least recently used entries while over the cap (in a transaction)"""
+        size = self.size()
+        if size <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TO
+        evicted = 0
+        cursor = self.connection.execute('SELECT parent_tree, tree, options, size FROM stats ORDER BY used')
+        keys = []
+        for parent_tree, tree, options, entry_size in cursor:
+            if size - evicted <= target:
+                break
+            keys.append((parent_tree, tree, options))
+            evicted += entry_size
+        self.connection.executemany('DELETE FROM stats WHERE parent_tree = ? AND tree = ? AND options = ?', keys)
+        self.connection.execute('UPDATE totals SET size = size - ?', (evicted,))
+        metrics.count('statcache.evictions', len(keys))
+
+    def size(self):
+        return self.connection.execute('SELECT size FROM totals').fetchone()[0]
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM stats').fetchone()[0]
+
+    def close(self):
+        if self.pending or self.used:
+            self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,190 @@
+"""Deterministic synthetic repositories, for benchmarks and tests
+
+The same Spec always gives the same repo, down to the commit shas: the
+content, authors and times all come from a random.Random seeded by the spec.
+"""
+import posixpath
+import random
+from collections import defaultdict
+
+import pygit2
+
+START_TIME = 1500000000
+OFFSETS = [-420, -300, 0, 60, 330]
+EXTENSIONS = ['.py', '.js', '.c', '.md']
+
+
+class Spec:
+    """What to generate: commits (not counting the merged side commits),
+    files at the start, authors, a merge every merge_every commits,
+    renames of the `chains` renamed files every rename_every commits"""
+
+    def __init__(self, name, commits, files=50, authors=10, merge_every=20,
+                 rename_every=25, chains=3, seed=0):
+        self.name = name
+        self.commits = commits
+        self.files = files
+        self.authors = authors
+        self.merge_every = merge_every
+        self.rename_every = rename_every
+        self.chains = chains
+        self.seed = seed
+
+    def description(self):
+        return dict(vars(self))
+
+
+class SyntheticRepo:
+    def __init__(self, path, head, midpoint):
+        self.path = path
+        self.head = head  # sha of the last commit
+        self.midpoint = midpoint  # sha of the commit half way, for incremental imports
+
+    def set_head(self, sha):
+        """Points the branch at sha (e.g. the midpoint), as if it were all there was"""
+        repo = pygit2.Repository(self.path)
+        repo.references['refs/heads/master'].set_target(sha)
+
+
+class TreeWriter:
+    """Writes the tree of a set of files, only rewriting the directories that changed"""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.blobs = dict()  # (key: path, value: blob oid)
+        self.children = defaultdict(set)  # (key: directory, value: entry names)
+        self.trees = dict()  # (key: directory, value: tree oid), for unchanged directories
+
+    def set(self, path, data):
+        self.blobs[path] = self.repo.create_blob(data)
+        self.changed(path)
+        while path:
+            directory, name = posixpath.split(path)
+            self.children[directory].add(name)
+            path = directory
+
+    def remove(self, path):
+        del self.blobs[path]
+        self.changed(path)
+        while path:
+            directory, name = posixpath.split(path)
+            self.children[directory].discard(name)
+            if self.children[directory] or not directory:
+                break
+            del self.children[directory]
+            path = directory
+
+    def changed(self, path):
+        directory = posixpath.dirname(path)
+        while True:
+            self.trees.pop(directory, None)
+            if not directory:
+                break
+            directory = posixpath.dirname(directory)
+
+    def write(self, directory=''):
+        if directory in self.trees:
+            return self.trees[directory]
+        builder = self.repo.TreeBuilder()
+        for name in sorted(self.children[directory]):
+            path = posixpath.join(directory, name)
+            if path in self.blobs:
+                builder.insert(name, self.blobs[path], pygit2.GIT_FILEMODE_BLOB)
+            else:
+                builder.insert(name, self.write(path), pygit2.GIT_FILEMODE_TREE)
+        oid = builder.write()
+        self.trees[directory] = oid
+        return oid
+
+
+def content(lines):
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def generate(path, spec):
+    """Creates the repo of spec at path, returns a SyntheticRepo"""
+    rnd = random.Random(spec.seed)
+    repo = pygit2.init_repository(path)
+    writer = TreeWriter(repo)
+    files = dict()  # (key: path, value: list of lines)
+    serial = [0]
+
+    def new_lines(count):
+        serial[0] += 1
+        return ['line {}.{} {}'.format(serial[0], i, rnd.random()) for i in range(count)]
+
+    def set_file(path, lines):
+        files[path] = lines
+        writer.set(path, content(lines))
+
+    def new_path(i):
+        return 'src/mod{}/file{}{}'.format(rnd.randrange(max(1, spec.files // 10)), i,
+                                           EXTENSIONS[i % len(EXTENSIONS)])
+
+    # every 4th author also commits with a second email, that of the same person
+    authors = []
+    for i in range(spec.authors):
+        emails = ['author{}@example.com'.format(i)]
+        if i % 4 == 3:
+            emails.append('a{}@work.example.com'.format(i))
+        authors.append(('Author {}'.format(i), emails, OFFSETS[i % len(OFFSETS)]))
+
+    def signature(time):
+        name, emails, offset = rnd.choice(authors)
+        return pygit2.Signature(name, rnd.choice(emails), time, offset)
+
+    for i in range(spec.files):
+        set_file(new_path(i), new_lines(rnd.randint(5, 40)))
+    chains = sorted(files)[:spec.chains]
+
+    head = None
+    midpoint = None
+    time = START_TIME
+    file_count = spec.files
+    for i in range(spec.commits):
+        time += rnd.randint(60, 6 * 3600)
+        parents = [head] if head else []
+        if head and spec.merge_every and i % spec.merge_every == 0 and repo[head].parents:
+            # a side commit (adding a file) forked from the previous commit, merged back in
+            base = repo[head].parents[0]
+            side_path = 'merge{}.md'.format(i)
+            side_lines = new_lines(5)
+            builder = repo.TreeBuilder(base.tree)
+            builder.insert(side_path, repo.create_blob(content(side_lines)), pygit2.GIT_FILEMODE_BLOB)
+            side_author = signature(time - 30)
+            side = repo.create_commit(None, side_author, side_author,
+                                      'Side {}'.format(i), builder.write(), [base.id])
+            set_file(side_path, side_lines)
+            parents.append(side)
+            message = 'Merge side {}'.format(i)
+        elif i and spec.rename_every and i % spec.rename_every == 0 and chains:
+            # rename a chain file, touching one line so that it stays similar
+            c = rnd.randrange(len(chains))
+            old = chains[c]
+            lines = files.pop(old)
+            writer.remove(old)
+            lines[rnd.randrange(len(lines))] = new_lines(1)[0]
+            stem, extension = posixpath.splitext(old)
+            chains[c] = '{}_r{}{}'.format(stem.split('_r')[0], i, extension)
+            set_file(chains[c], lines)
+            message = 'Rename {} to {}'.format(old, chains[c])
+        else:
+            for file in rnd.sample(sorted(files), min(len(files), rnd.randint(1, 4))):
+                lines = list(files[file])
+                for _ in range(rnd.randint(1, 3)):
+                    position = rnd.randrange(len(lines) + 1)
+                    if rnd.random() < 0.3 and len(lines) > 1:
+                        del lines[min(position, len(lines) - 1)]
+                    else:
+                        lines[position:position] = new_lines(rnd.randint(1, 10))
+                set_file(file, lines)
+            if rnd.random() < 0.05:
+                set_file(new_path(file_count), new_lines(rnd.randint(5, 40)))
+                file_count += 1
+            message = 'Commit {}'.format(i)
+        author = signature(time)
+        head = repo.create_commit('refs/heads/master', author, author, message, writer.write(), parents)
+        if i == spec.commits // 2:
+            midpoint = head
+    repo.set_head('refs/heads/master')
+    return SyntheticRepo(path, str(head), str(midpoint))
@@ -0,0 +1,192 @@
+import array
+import math
+
+import numpy as np
+
+from . import formatters
+
+MINUTES_PER_DAY = 60 * 24
+SECONDS_PER_DAY = 60 * MINUTES_PER_DAY
+# 1970-01-01 was a Thursday (weekday() == 3)
+EPOCH_WEEKDAY = 3
+
+
+class StringTable:
+    """Interned strings: each distinct string is stored once, and referred to by its id"""
+
+    def __init__(self):
+        self.strings = []
+        self.ids = dict()
+
+    def intern(self, string):
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class CommitTable:
+    """The analyzed commits, held as columns (one array per field) in walk order"""
+
+    def __init__(self, shas, epochs, offsets, insertions, deletions, parents, authors, messages, message_table):
+        self.shas = shas  # bytes (hex)
+        self.epochs = epochs  # int64, author time in seconds since the epoch
+        self.offsets = offsets  # int16, author's timezone offset in minutes
+        self.insertions = insertions  # int32
+        self.deletions = deletions  # int32
+        self.parents = parents  # int8, number of parents
+        self.authors = authors  # int32, author id in an author.AuthorIndex
+        self.messages = messages  # int32, id in message_table
+        self.message_table = message_table
+
+    def __len__(self):
+        return len(self.epochs)
+
+    @classmethod
+    def from_records(cls, records, authors):
+        """Table of the included commit records of git.analyze().
+        authors is the author.AuthorIndex the record identities were added to."""
+        builder = CommitTableBuilder()
+        for record in records:
+            if 'epoch' in record:
+                builder.add(record)
+        return builder.build(authors)
+
+    def local_times(self):
+        """Seconds since the epoch, as read on the author's wall clock"""
+        return self.epochs + self.offsets.astype(np.int64) * 60
+
+    def local_day_minutes(self):
+        """Minutes elapsed in the (local) day at commit time"""
+        return (self.local_times() // 60) % MINUTES_PER_DAY
+
+    def local_weekday_minutes(self):
+        """Minutes elapsed in the (local) week, starting on Monday, at commit time"""
+        local_times = self.local_times()
+        weekdays = (local_times // SECONDS_PER_DAY + EPOCH_WEEKDAY) % 7
+        return weekdays * MINUTES_PER_DAY + (local_times // 60) % MINUTES_PER_DAY
+
+    def time_order(self):
+        """Indices of the commits by local time, latest first (stable for equal times)"""
+        return np.argsort(-self.local_times(), kind='mergesort')
+
+    def take(self, indices):
+        """A new table with the commits at indices (e.g. in time_order())"""
+        return CommitTable(self.shas[indices], self.epochs[indices], self.offsets[indices],
+                           self.insertions[indices], self.deletions[indices], self.parents[indices],
+                           self.authors[indices], self.messages[indices], self.message_table)
+
+    def slice(self, start, stop):
+        """A table of the commits in [start, stop), sharing this table's memory"""
+        return CommitTable(self.shas[start:stop], self.epochs[start:stop], self.offsets[start:stop],
+                           self.insertions[start:stop], self.deletions[start:stop], self.parents[start:stop],
+                           self.authors[start:stop], self.messages[start:stop], self.message_table)
+
+    def time_string(self, i):
+        return formatters.time_string(int(self.epochs[i]), int(self.offsets[i]))
+
+    def iter_descriptions(self, author_names, author_emails, chunk_size=4096):
+        """Yields the dict representation of the commits, converting chunk_size at a time"""
+        for start in range(0, len(self), chunk_size):
+            yield from self.slice(start, start + chunk_size).descriptions(author_names, author_emails)
+
+    def iter_time_strings(self, chunk_size=4096):
+        """Yields the time string of each commit, in reverse order (oldest first)"""
+        for stop in range(len(self), 0, -chunk_size):
+            start = max(0, stop - chunk_size)
+            epochs = self.epochs[start:stop].tolist()
+            offsets = self.offsets[start:stop].tolist()
+            for i in reversed(range(len(epochs))):
+                yield formatters.time_string(epochs[i], offsets[i])
+
+    def descriptions(self, author_names, author_emails):
+        """Returns the dict representation of the commits.
+        author_names & author_emails give the main name & email of an author id."""
+        shas = self.shas.tolist()
+        epochs = self.epochs.tolist()
+        offsets = self.offsets.tolist()
+        day_minutes = self.local_day_minutes().tolist()
+        weekday_minutes = self.local_weekday_minutes().tolist()
+        insertions = self.insertions.tolist()
+        deletions = self.deletions.tolist()
+        author_ids = self.authors.tolist()
+        messages = self.messages.tolist()
+        descriptions = []
+        for i in range(len(shas)):
+            descriptions.append({
+                'message': self.message_table[messages[i]],
+                'name': author_names[author_ids[i]],
+                'sha': shas[i].decode('ascii'),
+                'email': author_emails[author_ids[i]],
+                'time': formatters.time_string(epochs[i], offsets[i]),
+                'local_day_minutes': day_minutes[i],
+                'local_weekday_minutes': weekday_minutes[i],
+                'insertions': insertions[i],
+                'deletions': deletions[i]
+            })
+        return descriptions
+
+
+class CommitTableBuilder:
+    """Builds a CommitTable one included commit record at a time, appending
+    each field to its column, so that the records can stream past"""
+
+    def __init__(self):
+        self.shas = bytearray()  # hex shas, end to end
+        self.epochs = array.array('q')
+        self.offsets = array.array('h')
+        self.insertions = array.array('i')
+        self.deletions = array.array('i')
+        self.parents = array.array('b')
+        self.identities = array.array('i')  # id in identity_table
+        self.identity_table = StringTable()  # (name, email) pairs
+        self.messages = array.array('i')
+        self.message_table = StringTable()
+
+    def add(self, record):
+        self.shas.extend(record['sha'].encode('ascii'))
+        self.epochs.append(record['epoch'])
+        self.offsets.append(record['offset'])
+        self.insertions.append(record['insertions'])
+        self.deletions.append(record['deletions'])
+        self.parents.append(record['parents'])
+        self.identities.append(self.identity_table.intern((record['name'], record['email'])))
+        self.messages.append(self.message_table.intern(record['message']))
+
+    def build(self, authors):
+        """The table. authors is the author.AuthorIndex the identities were added to:
+        they are resolved now, as a later commit can merge two authors."""
+        author_ids = np.array([authors.author_id(name, email) for name, email in self.identity_table.strings],
+                              dtype=np.int32)
+        return CommitTable(
+            np.frombuffer(self.shas, dtype='S40').copy(),
+            np.array(self.epochs, dtype=np.int64),
+            np.array(self.offsets, dtype=np.int16),
+            np.array(self.insertions, dtype=np.int32),
+            np.array(self.deletions, dtype=np.int32),
+            np.array(self.parents, dtype=np.int8),
+            author_ids[np.array(self.identities, dtype=np.intp)],
+            np.array(self.messages, dtype=np.int32),
+            self.message_table)
+
+
+def percentile_stat_info(insertions, deletions):
+    """min, max & 99th percentile of the line counts, or None if there are none"""
+    values = np.concatenate([np.asarray(insertions, dtype=np.int64),
+                             np.asarray(deletions, dtype=np.int64)])
+    if len(values) == 0:
+        return None
+    percentile = 0.99
+    percentile_index = math.floor(float(len(values) * percentile))
+    if percentile_index > len(values)-4: percentile_index -= 1
+    # only the percentile's position needs to be sorted
+    percentile_value = np.partition(values, percentile_index)[percentile_index]
+    return {'min': int(values.min()), 'max': int(values.max()), 'percentile_value': int(percentile_value)}
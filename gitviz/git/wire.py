@@ -0,0 +1,108 @@
+"""The get_repo response, schema 2: the same data as schema 1, normalized
+
+Schema 1 (analysis.Analysis.response_items) repeats each commit's author
+name & email and an ISO time in every commit's dict, then every time again
+in 'times', and every author's commit indices in full. Schema 2 sends:
+
+- 'names' & 'emails': a string table of the authors, referred to by author id
+- 'messages': the (interned) commit messages, referred to by message id
+- 'commits': columns rather than dicts, latest commit first. 'epochs' are
+  delta encoded (the first in seconds since the epoch, then each minus the
+  one before it), 'offsets' are the authors' timezone offsets in minutes;
+  local times are derived from both, and 'times' is not sent.
+- authors' 'commits' as ranges: [start, length, start, length, ...] of
+  consecutive commit indices, and an 'author' id instead of name & email.
+
+js/helpers/wire.js decodes it back into schema 1 for the views.
+"""
+import numpy as np
+
+from . import analysis
+
+SCHEMA = 2
+# schemas get_repo can be asked for, the first being the default
+SCHEMAS = [1, SCHEMA]
+
+
+def ranges(indices):
+    """[start, length, ...] of the runs of consecutive integers in indices"""
+    encoded = []
+    for index in indices:
+        if encoded and encoded[-2] + encoded[-1] == index:
+            encoded[-1] += 1
+        else:
+            encoded.extend([index, 1])
+    return encoded
+
+
+def expand(encoded):
+    """The indices of ranges()"""
+    return [start + i for start, length in zip(encoded[::2], encoded[1::2]) for i in range(length)]
+
+
+def deltas(values):
+    """The first of values, then the difference of each with the one before"""
+    values = np.asarray(values, dtype=np.int64)
+    # np.diff(prepend=) needs NumPy 1.16, requirements.txt has 1.13
+    return np.concatenate([values[:1], np.diff(values)])
+
+
+class AuthorIds:
+    """The dense author ids of an analysis.Analysis, and its authors' string tables"""
+
+    def __init__(self, result):
+        author_ids, self.dense = np.unique(result.commits.authors, return_inverse=True)
+        self.names = [result.author_names[i] for i in author_ids.tolist()]
+        self.emails = [result.author_emails[i] for i in author_ids.tolist()]
+        self.ids = {(name, email): i for i, (name, email) in enumerate(zip(self.names, self.emails))}
+
+    def author(self, description):
+        """A schema 1 author description, with an author id for its name & email
+        (kept as is if the author has no commit in the table)"""
+        author_id = self.ids.get((description['name'], description['email']))
+        if author_id is None:
+            return description
+        normalized = {key: value for key, value in description.items() if key not in ('name', 'email')}
+        normalized['author'] = author_id
+        if 'commits' in normalized:
+            normalized['commits'] = ranges(normalized['commits'])
+        return normalized
+
+
+def response_items(result):
+    """(key, value) pairs of the schema 2 response for the analysis.Analysis result"""
+    commits = result.commits
+    authors = AuthorIds(result)
+    summary = result.summary
+    files = [dict(file, authors=[authors.author(author) for author in file['authors']])
+             for file in summary['files_with_max_commits']]
+    return [
+        ('schema', SCHEMA),
+        ('names', authors.names),
+        ('emails', authors.emails),
+        ('messages', analysis.Stream(commits.message_table[i] for i in range(len(commits.message_table)))),
+        # each column is encoded in one go, which json does much faster than commit by commit
+        ('commits', analysis.Object([
+            ('sha', [sha.decode('ascii') for sha in commits.shas.tolist()]),
+            ('author', authors.dense.tolist()),
+            ('message', commits.messages.tolist()),
+            ('epochs', deltas(commits.epochs).tolist()),
+            ('offsets', commits.offsets.tolist()),
+            ('insertions', commits.insertions.tolist()),
+            ('deletions', commits.deletions.tolist())
+        ])),
+        ('authors', [authors.author(author) for author in summary['authors']]),
+        ('low_commit_authors', [authors.author(author) for author in summary['low_commit_authors']]),
+        ('time_extent', summary['time_extent']),
+        ('line_stats', summary['line_stats']),
+        ('filestats_line_stats', summary['filestats_line_stats']),
+        ('files_with_max_commits', files)
+    ]
+
+
+def iter_json(result, indent=None, envelope=None):
+    """Yields the JSON of the schema 2 response in pieces, like analysis.Analysis.iter_json"""
+    response = analysis.Object(response_items(result))
+    if envelope is not None:
+        response = analysis.Object([(envelope, response)])
+    return analysis.iterencode(response, indent, 0)
@@ -1,9 +1,10 @@
 import * as d3 from 'd3'
 import * as setup from './helpers/setup.js'
+import * as wire from './helpers/wire.js'
 
 // -- Begin
-d3.json('/repoexplorer?get_repo=true', (response) => {
-    const data = response.data
+d3.json(`/repoexplorer?get_repo=true&schema=${wire.SCHEMA}`, (response) => {
+    const data = wire.decode(response.data)
     // setup.showReloadTime(response)
     setup.showViz(data)
 })
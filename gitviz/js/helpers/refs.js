@@ -0,0 +1,55 @@
+import * as d3 from 'd3'
+
+/**
+ * For repos imported with several refs: a choice of ref, filtering the
+ * commits (and files' commits) to those it reaches, without another import.
+ * /repoexplorer/refs gives which commits each ref reaches, as base64 bits.
+ */
+export function setupRefFilter(data, onChange) {
+    d3.json('/repoexplorer/refs', (response) => {
+        if (!response || !response.refs || !response.refs.length) {return}
+        const refsDiv = d3.select('#refs').style('display', 'block')
+        const select = refsDiv.select('select')
+        select.selectAll('option').remove()
+        select.append('option').attr('value', '').text(`All ${response.refs.length} refs`)
+        response.refs.forEach((ref, i) => {
+            select.append('option')
+                .attr('value', i)
+                .text(`${shortName(ref.name)} (${ref.commits} commits)`)
+        })
+        select.on('change', function() {
+            const ref = this.value === '' ? null : response.refs[+this.value]
+            onChange(filterByRef(data, ref))
+        })
+    })
+}
+
+function shortName(name) {
+    return name.replace(/^refs\/(heads|tags|remotes)\//, '')
+}
+
+/**
+ * data restricted to the commits ref reaches (all of data if ref is null).
+ * all_commits keeps every commit, as files' commit_index refers to them.
+ */
+export function filterByRef(data, ref) {
+    if (!ref) {return data}
+    const bits = atob(ref.commits_bits)
+    const reaches = (index) => ((bits.charCodeAt(index >> 3) >> (7 - (index & 7))) & 1) === 1
+    const commits = data.commits.filter((commit, index) => reaches(index))
+    const authors = data.authors.map((author) => {
+        const emails = author.emails || [author.email]
+        return Object.assign({}, author, {
+            commits: commits.filter(commit => emails.indexOf(commit.email) !== -1)
+        })
+    })
+    const files = data.files_with_max_commits.map((file) => Object.assign({}, file, {
+        commits: file.commits.filter(info => reaches(info.commit_index))
+    }))
+    return Object.assign({}, data, {
+        commits: commits,
+        authors: authors,
+        files_with_max_commits: files,
+        all_commits: data.commits
+    })
+}
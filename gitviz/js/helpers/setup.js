@@ -5,16 +5,31 @@ const d3 = Object.assign({},
                          require('d3-array'), require('d3-jetpack'))
 import * as commits from '../viz/commits/commits_setup.js'
 import * as files from '../viz/files/files_setup.js'
+import * as refs from './refs.js'
 
 export let hourOfDayType = 'hourOfDay'
 export let dayOfWeekType = 'dayOfWeek'
 
+let shown // the data shown, filtered by ref
+
 export function showViz(data) {
-    setupVizNav(data)
+    shown = data
+    setupVizNav()
 
     // show commits viz by default
     commits.setupCommitsViz(data)
     commits.renderCommitsViz(data)
+
+    refs.setupRefFilter(data, (filtered) => {
+        shown = filtered
+        if (currentViz() === 'commits') {
+            commits.transitionFromCommitsViz()
+            commits.renderCommitsViz(shown)
+        } else if (currentViz() === 'files') {
+            files.transitionFromFilesViz()
+            files.renderFilesViz(shown)
+        }
+    })
 }
 
 export function showReloadTime(response) {
@@ -33,7 +48,7 @@ function currentViz() {
         .select('a').attr('name')
 }
 
-function setupVizNav(data) {
+function setupVizNav() {
     d3.selectAll('#top-nav a')
         .on('click', function() {
             const previousSelection = d3.select('#selected-viz')
@@ -49,12 +64,12 @@ function setupVizNav(data) {
                 if (previous === 'files') {
                     files.transitionFromFilesViz()
                 }
-                commits.renderCommitsViz(data)
+                commits.renderCommitsViz(shown)
             } else if (selection === 'files') {
                 if (previous === 'commits') {
                     commits.transitionFromCommitsViz()
                 }
-                files.renderFilesViz(data)
+                files.renderFilesViz(shown)
             }
         })
 }
@@ -0,0 +1,77 @@
+/**
+ * Decodes the get_repo response of schema 2 (see git/wire.py) into the
+ * schema 1 data the views use. Data without a schema is schema 1 already.
+ */
+const MINUTES_PER_DAY = 60 * 24
+const SECONDS_PER_DAY = 60 * MINUTES_PER_DAY
+// 1970-01-01 was a Thursday
+const EPOCH_WEEKDAY = 3
+
+export const SCHEMA = 2
+
+export function decode(data) {
+    if (data.schema !== SCHEMA) {return data}
+    const author = (description) => {
+        if (description.author === undefined) {return description}
+        const decoded = Object.assign({}, description, {
+            name: data.names[description.author],
+            email: data.emails[description.author]
+        })
+        delete decoded.author
+        if (description.commits) {
+            decoded.commits = expand(description.commits)
+        }
+        return decoded
+    }
+    return {
+        commits: decodeCommits(data),
+        authors: data.authors.map(author),
+        low_commit_authors: data.low_commit_authors.map(author),
+        time_extent: data.time_extent,
+        line_stats: data.line_stats,
+        filestats_line_stats: data.filestats_line_stats,
+        files_with_max_commits: data.files_with_max_commits.map(file => Object.assign({}, file, {
+            authors: file.authors.map(author)
+        }))
+    }
+}
+
+/** The indices of [start, length, start, length, ...] ranges */
+export function expand(ranges) {
+    const indices = []
+    for (let i = 0; i < ranges.length; i += 2) {
+        for (let j = 0; j < ranges[i + 1]; j++) {
+            indices.push(ranges[i] + j)
+        }
+    }
+    return indices
+}
+
+function modulo(value, divisor) {
+    return ((value % divisor) + divisor) % divisor
+}
+
+function decodeCommits(data) {
+    const columns = data.commits
+    const commits = new Array(columns.sha.length)
+    let epoch = 0
+    for (let i = 0; i < commits.length; i++) {
+        epoch += columns.epochs[i]
+        // seconds since the epoch on the author's wall clock
+        const local = epoch + columns.offsets[i] * 60
+        const dayMinutes = modulo(Math.floor(local / 60), MINUTES_PER_DAY)
+        const weekday = modulo(Math.floor(local / SECONDS_PER_DAY) + EPOCH_WEEKDAY, 7)
+        commits[i] = {
+            message: data.messages[columns.message[i]],
+            name: data.names[columns.author[i]],
+            sha: columns.sha[i],
+            email: data.emails[columns.author[i]],
+            time: new Date(epoch * 1000),
+            local_day_minutes: dayMinutes,
+            local_weekday_minutes: weekday * MINUTES_PER_DAY + dayMinutes,
+            insertions: columns.insertions[i],
+            deletions: columns.deletions[i]
+        }
+    }
+    return commits
+}
@@ -68,7 +68,8 @@ export function setupCommitsViz(data) {
 export function renderCommitsViz(data) {
     const authors = data.authors
     const commits = data.commits
-    const timeExtent = data.time_extent.map(d => new Date(d))
+    // null when the import kept no commit
+    const timeExtent = (data.time_extent || []).map(d => new Date(d))
     const lineStats = data.line_stats
 
     // show timeline first, by default
@@ -18,7 +18,8 @@ export function renderFilesViz(data) {
     transitionToFilesViz()
     const filesWithMaxCommits = data.files_with_max_commits
     const lineStats = data.filestats_line_stats
-    const allCommits = data.commits
+    // files' commit_index refers to every commit, even when filtered by ref
+    const allCommits = data.all_commits || data.commits
 
     timeline.render(filesWithMaxCommits, allCommits, lineStats)
 }
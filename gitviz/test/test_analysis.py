@@ -0,0 +1,29 @@
+import json
+import unittest
+import git.analysis as analysis
+
+class StreamingJsonTests(unittest.TestCase):
+    def encoded(self, value, indent):
+        return ''.join(analysis.iterencode(value, indent, 0))
+
+    def testMatchesJsonDumps(self):
+        commits = [{'sha': 'a', 'time': 'x\ny'}, {'sha': 'b', 'time': 'é'}]
+        summary = {'authors': [['Jane', [1, 2]]], 'line_stats': None, 'empty': []}
+        expected = dict(commits=commits, **summary)
+        for indent in [None, 2]:
+            response = analysis.Object([('commits', analysis.Stream(iter(commits)))] + list(summary.items()))
+            self.assertEqual(self.encoded(response, indent), json.dumps(expected, indent=indent))
+
+    def testEmptyStream(self):
+        for indent in [None, 2]:
+            response = analysis.Object([('commits', analysis.Stream(iter([])))])
+            self.assertEqual(self.encoded(response, indent), json.dumps({'commits': []}, indent=indent))
+
+    def testEnvelope(self):
+        for indent in [None, 2]:
+            response = analysis.Object([('data', analysis.Object([('times', analysis.Stream(iter(['t1', 't2'])))]))])
+            self.assertEqual(self.encoded(response, indent),
+                             json.dumps({'data': {'times': ['t1', 't2']}}, indent=indent))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+import git.analysis as analysis
+import git.artifact as artifact
+import git.author as author
+import git.dirtree as dirtree
+import git.query as query
+import git.table as table
+from test.test_table import record
+
+class ArtifactTests(unittest.TestCase):
+    def setUp(self):
+        records = [record('c' * 40, 1497640533, 120, name='Zoë'),
+                   record('b' * 40, 1497630000, 0, name='David'),
+                   record('a' * 40, 1497621577, -420, name='Zoë', parents=0)]
+        authors = author.AuthorIndex()
+        for count, r in enumerate(records, start=1):
+            authors.add(r['name'], r['email'], count)
+        commits = table.CommitTable.from_records(records, authors)
+        self.result = analysis.Analysis(commits.take(commits.time_order()),
+                                        [info.name() for info in authors.infos],
+                                        [info.email() for info in authors.infos],
+                                        {'authors': [], 'low_commit_authors': [], 'time_extent': ['a', 'b'],
+                                         'line_stats': {}, 'filestats_line_stats': {},
+                                         'files_with_max_commits': []})
+        handle, self.path = tempfile.mkstemp(suffix='.gvz')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def testRoundTrip(self):
+        artifact.write(self.path, self.result)
+        stored = artifact.Artifact(self.path)
+        self.assertEqual(stored.count, 3)
+        self.assertEqual(stored.response_dict(), self.result.response_dict())
+        self.assertEqual(stored.analysis().commit_descriptions(1, 2), self.result.commit_descriptions(1, 2))
+
+    def testDirTree(self):
+        artifact.write(self.path, self.result)
+        self.assertIsNone(artifact.Artifact(self.path).dirtree())
+        shas = [sha.decode('ascii') for sha in self.result.commits.shas.tolist()]
+        records = [{'sha': sha, 'files': [['dir{}/sub/f.py'.format(i % 2), i, 1]]} for i, sha in enumerate(shas)]
+        tree = dirtree.DirTree.from_analysis(records, self.result)
+        artifact.write(self.path, self.result, dirs=tree)
+        stored = artifact.Artifact(self.path)
+        names, emails = stored.string_table('author_names'), stored.string_table('author_emails')
+        for prefix in ['', 'dir1', 'dir0/sub']:
+            self.assertEqual(stored.dirtree().query(prefix, names, emails), tree.query(prefix, names, emails))
+
+    def testTimeWindow(self):
+        artifact.write(self.path, self.result)
+        stored = artifact.Artifact(self.path)
+        # the 3 commits, oldest first: 1497621577, 1497630000, 1497640533
+        page = query.commits_in_window(stored, 1497621578, 1497640534, limit=1)
+        self.assertEqual(page['total'], 2)
+        self.assertEqual([c['sha'] for c in page['commits']], ['b' * 40])
+        self.assertEqual(page['commits'][0]['index'], 1)
+        self.assertEqual(page['authors'], [{'name': 'David', 'email': 'David@x.org', 'commits': 1}])
+        page = query.commits_in_window(stored, 1497621578, 1497640534, cursor=page['next_cursor'])
+        self.assertEqual([c['sha'] for c in page['commits']], ['c' * 40])
+        self.assertIsNone(page['next_cursor'])
+
+    def testTimeWindowLimits(self):
+        artifact.write(self.path, self.result)
+        stored = artifact.Artifact(self.path)
+        for limit in [0, -5]:
+            page = query.commits_in_window(stored, 0, 2**40, limit=limit)
+            self.assertEqual([c['sha'] for c in page['commits']], ['a' * 40])
+            self.assertEqual(page['next_cursor'], 1)
+
+    def testRollups(self):
+        artifact.write(self.path, self.result)
+        stored = artifact.Artifact(self.path).rollups()
+        days = stored['histograms']['day']
+        self.assertEqual(days['starts'], [1497571200])  # 2017-06-16
+        self.assertEqual(days['commits'], [3])
+        self.assertEqual(stored['histograms']['week']['starts'], [1497225600])  # Monday 2017-06-12
+        self.assertEqual(stored['histograms']['month']['starts'], [1496275200])
+        zoe = [a for a in stored['authors'] if a['name'] == 'Zoë'][0]
+        self.assertEqual((zoe['commits'], zoe['first'], zoe['last']), (2, 1497621577, 1497640533))
+        self.assertEqual(zoe['rhythm'][4][21], 1)  # Friday 21:15, +02:00
+        self.assertEqual(zoe['rhythm'][4][6], 1)  # Friday 06:59, -07:00
+
+if __name__ == '__main__':
+    unittest.main()
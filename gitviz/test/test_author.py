@@ -0,0 +1,38 @@
+import unittest
+import git.author as author
+
+class AuthorIndexTests(unittest.TestCase):
+    def testMergesByNameOrEmail(self):
+        index = author.AuthorIndex()
+        index.add('Jane Doe', 'jane@home.org', 1)
+        info = index.add('jane  doe', 'jane@work.com', 2)
+        self.assertEqual(info.names, ['Jane Doe'])
+        self.assertEqual(info.emails, ['jane@home.org', 'jane@work.com'])
+        self.assertEqual(info.commit_indices, [1, 2])
+
+    def testMergesTransitively(self):
+        index = author.AuthorIndex()
+        index.add('Jane', 'jane@home.org', 1)
+        index.add('J. Doe', 'jd@work.com', 2)
+        # shares a name with the first identity and an email with the second
+        index.add('Jane', 'JD@work.com', 3)
+        self.assertEqual(len(index.authors()), 1)
+        info = index.lookup('J. Doe', 'other@example.com')
+        self.assertEqual(info.name(), 'Jane')
+        self.assertEqual(info.commit_indices, [1, 2, 3])
+
+    def testMailmap(self):
+        mailmap = author.Mailmap.from_text('\n'.join([
+            '# comment',
+            'Jane Doe <jane@home.org> <jane@old.org>',
+            'Jane Doe <jane@home.org> jd <shared@ci.org>'
+        ]))
+        index = author.AuthorIndex(mailmap)
+        index.add('Jane', 'jane@old.org', 1)
+        index.add('jd', 'shared@ci.org', 2)
+        index.add('Bot', 'shared@ci.org', 3)
+        self.assertEqual([a.name() for a in index.authors()], ['Jane Doe', 'Bot'])
+        self.assertEqual(index.lookup('Jane', 'jane@old.org').commit_indices, [1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import os
+import pathlib
+import tempfile
+import unittest
+import git.batch as batch
+
+class RepoPathsTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.dir.name)
+        self.root.joinpath('working', '.git').mkdir(parents=True)
+        self.root.joinpath('mirror.git', 'objects').mkdir(parents=True)
+        self.root.joinpath('mirror.git', 'HEAD').write_text('ref: refs/heads/master\n')
+        self.root.joinpath('notes').mkdir()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def testDiscoversWorkingCopiesAndBareRepos(self):
+        self.assertEqual(batch.discover(self.root),
+                         [str(self.root.joinpath('mirror.git')), str(self.root.joinpath('working'))])
+        self.assertEqual(batch.discover(self.root.joinpath('working')), [str(self.root.joinpath('working'))])
+
+    def testManifest(self):
+        manifest = self.root.joinpath('repos.txt')
+        manifest.write_text('# mirrors\nworking\n\n{}  # again\n'.format(self.root.joinpath('working')))
+        paths = batch.repo_paths([self.root], manifest)
+        self.assertEqual(paths, [os.path.abspath(str(self.root.joinpath(name)))
+                                 for name in ['mirror.git', 'working']])
+
+if __name__ == '__main__':
+    unittest.main()
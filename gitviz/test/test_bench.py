@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+import pygit2
+import git.bench as bench
+import git.synthetic as synthetic
+
+class SyntheticRepoTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.spec = synthetic.Spec('test', commits=60, files=12, authors=4, merge_every=10, rename_every=5)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def testDeterministic(self):
+        first = synthetic.generate(os.path.join(self.dir.name, 'a'), self.spec)
+        second = synthetic.generate(os.path.join(self.dir.name, 'b'), self.spec)
+        self.assertEqual(first.head, second.head)
+        repo = pygit2.Repository(first.path)
+        merges = [c for c in repo.walk(repo.head.target) if len(c.parents) > 1]
+        self.assertEqual(len(merges), 5)
+
+    def testEquivalenceChecks(self):
+        repo = synthetic.generate(os.path.join(self.dir.name, 'repo'), self.spec)
+        self.assertEqual(bench.check_equivalence(repo), [])
+
+class RegressionTests(unittest.TestCase):
+    def testThreshold(self):
+        baseline = {'scales': {'small': {'timings': {'analyze': 1.0, 'maxfilestats': 0.01}}}}
+        results = {'scales': {'small': {'timings': {'analyze': 1.3, 'maxfilestats': 0.04}},
+                              'large': {'timings': {'analyze': 9.0}}}}
+        self.assertEqual(bench.regressions(results, baseline), [('small', 'analyze', 1.0, 1.3)])
+        self.assertEqual(bench.regressions(results, baseline, threshold=0.5), [])
+
+if __name__ == '__main__':
+    unittest.main()
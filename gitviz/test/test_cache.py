@@ -0,0 +1,67 @@
+import os
+import pathlib
+import tempfile
+import unittest
+import cache
+
+class RepoCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.dirPath = pathlib.Path(self.dir.name)
+        self.builds = []
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, text):
+        path = self.dirPath.joinpath(name)
+        path.write_text(text)
+        return path
+
+    def build(self, path):
+        self.builds.append(path.name)
+        return path.read_bytes()
+
+    def testHitsUntilFileChanges(self):
+        responses = cache.RepoCache(1024)
+        path = self.write('flask.json', 'one')
+        self.assertEqual(responses.get('flask', path, self.build), b'one')
+        self.assertEqual(responses.get('flask', path, self.build), b'one')
+        os.replace(str(self.write('tmp', 'two!')), str(path))
+        self.assertEqual(responses.get('flask', path, self.build), b'two!')
+        self.assertEqual(self.builds, ['flask.json', 'flask.json'])
+        self.assertEqual((responses.stats()['hits'], responses.stats()['misses']), (1, 2))
+
+    def testEvictsLeastRecentlyUsed(self):
+        responses = cache.RepoCache(10)
+        paths = [self.write(name + '.json', 'xxxx') for name in 'abc']
+        responses.get('a', paths[0], self.build)
+        responses.get('b', paths[1], self.build)
+        responses.get('a', paths[0], self.build)
+        responses.get('c', paths[2], self.build)  # over budget: b goes
+        self.assertEqual(list(responses.entries), ['a', 'c'])
+        self.assertEqual(responses.stats()['bytes'], 8)
+
+    def testCatalogPrefersFirstSuffix(self):
+        self.write('flask.json', '{}')
+        self.write('flask.gvz', '')
+        self.write('react.json', '{}')
+        catalog = cache.RepoCatalog(self.dirPath, ['.gvz', '.json'])
+        self.assertEqual(catalog.names(), ['flask', 'react'])
+        self.assertEqual(catalog.path('flask').suffix, '.gvz')
+        catalog.names()
+        self.assertEqual(catalog.stats()['hits'], 2)
+
+    def testReopenedFilesCloseTheReplacedOnes(self):
+        closed = []
+        files = cache.OpenFiles(self.build, close=closed.append)
+        path = self.write('flask.sqlite', 'one')
+        self.assertEqual(files.get('flask', path), b'one')
+        self.assertEqual(files.get('flask', path), b'one')
+        self.assertEqual(closed, [])
+        os.replace(str(self.write('tmp', 'two!')), str(path))
+        self.assertEqual(files.get('flask', path), b'two!')
+        self.assertEqual(closed, [b'one'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import git.dirtree as dirtree
+
+class DirTreeTests(unittest.TestCase):
+    def setUp(self):
+        self.records = [{'sha': 'c', 'files': [['src/app/main.py', 3, 1], ['src/app/util.py', 1, 0]]},
+                        {'sha': 'b', 'files': [['src/lib/x.c', 10, 2], ['README', 1, 1]]},
+                        {'sha': 'm', 'files': []},  # a merge
+                        {'sha': 'a', 'files': [['src/app/main.py', 5, 0]]}]
+        self.tree = dirtree.DirTree.build(self.records, {'c': 0, 'b': 1, 'a': 0})
+        self.names = ['Zoë', 'David']
+        self.emails = ['zoe@x.org', 'david@x.org']
+
+    def testRollups(self):
+        root = self.tree.query('', self.names, self.emails)
+        self.assertEqual((root['commits'], root['insertions'], root['deletions']), (3, 20, 4))
+        self.assertEqual([d['name'] for d in root['directories']], ['src'])
+        src = self.tree.query('/src/', self.names, self.emails)
+        self.assertEqual(src['path'], 'src')
+        self.assertEqual([(d['name'], d['commits']) for d in src['directories']], [('app', 2), ('lib', 1)])
+        self.assertEqual([(a['name'], a['commits']) for a in src['authors']], [('Zoë', 2), ('David', 1)])
+        app = self.tree.query('src/app', self.names, self.emails, authors=1)
+        self.assertEqual((app['commits'], app['insertions'], app['deletions']), (2, 9, 1))
+        self.assertEqual((app['author_count'], len(app['authors'])), (1, 1))
+
+    def testUnknownPrefix(self):
+        self.assertIsNone(self.tree.query('src/ap', self.names, self.emails))
+        self.assertIsNone(self.tree.query('docs', self.names, self.emails))
+
+if __name__ == '__main__':
+    unittest.main()
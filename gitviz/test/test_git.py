@@ -1,43 +1,201 @@
+import os
+import subprocess
+import tempfile
 import unittest
 import pygit2
 import git.filestats as fs
+import git.git as g
+import git.importstate as importstate
+import git.modes as modes
+import git.fileindex as fileindex
+import git.renamegraph as renamegraph
+import git.synthetic as synthetic
 
-reponame = "/Users/raheel/Downloads/etc/fixture_repo/"
-
-class MaxFileTests(unittest.TestCase):
-    def testMaxCommits(self):
-        result = fs.maxfilestats(reponame, 2)
-        cCount = len(result['c.txt'])
-        mCount = len(result['m.txt'])
-        # for m in result['c.txt']:
-        #     print(m['commit'].message)
-
-        self.assertEqual(cCount, 12)
-        self.assertEqual(mCount, 9)
-
-    def testFileRenamingTo(self):
-        repo = pygit2.Repository(reponame)
-        commit = repo.get("e2e0ee1")
-        renamed_to = fs.fileRenamedToAnother('a.txt', commit, reponame)
-        self.assertEqual(renamed_to, "b.txt", 'a.txt should have been renamed to b.txt')
-        # another
-        commit = repo.get("024fc5e")
-        renamed_to = fs.fileRenamedToAnother('b.txt', commit, reponame)
-        self.assertEqual(renamed_to, 'c.txt', 'b.txt should have been renamed to c.txt')
-    def testFileRenamingFrom(self):
-        repo = pygit2.Repository(reponame)
-        commit = repo.get("e2e0ee1")
-        renamed_from = fs.fileRenamedFromAnother('b.txt', commit, reponame)
-        self.assertEqual(renamed_from, 'a.txt', 'b.txt should have been renamed from a.txt')
+class SyntheticRepoTestCase(unittest.TestCase):
+    """Tests on a synthetic.SyntheticRepo generated in a temporary directory,
+    with merges and chains of renames"""
+    spec = synthetic.Spec('test', commits=40, files=10, authors=4, merge_every=10, rename_every=5, chains=2)
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.repo = synthetic.generate(os.path.join(self.dir.name, 'repo'), self.spec)
+        self.path = self.repo.path
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def renames(self):
+        """(sha, old path, new path) of each rename, from the generated commit messages"""
+        repo = pygit2.Repository(self.path)
+        found = []
+        for commit in repo.walk(repo.head.target, pygit2.GIT_SORT_TIME | pygit2.GIT_SORT_REVERSE):
+            if commit.message.startswith('Rename '):
+                old, new = commit.message[len('Rename '):].split(' to ')
+                found.append((str(commit.id), old, new))
+        return found
+
+class MaxFileTests(SyntheticRepoTestCase):
+    def log(self, *args):
+        output = subprocess.check_output(['git', '-C', self.path, 'log', '--no-merges', '--format=%H'] + list(args))
+        return output.decode('ascii').split()
+
+    def testMaxCommitsFollowRenames(self):
+        later = {old: new for _, old, new in self.renames()}
+        result = fs.maxfilestats(self.path, 10)
+        # files found to be earlier or later names of another are merged into it
+        self.assertTrue(0 < len(result) <= 10)
+        followed = 0
+        for file, details in result.items():
+            latest = file
+            while latest in later:
+                latest = later[latest]
+                followed += 1
+            self.assertEqual([str(d['commit'].id) for d in details], self.log('--follow', '--', latest))
+        self.assertGreater(followed, 1, 'a file renamed more than once should be among the top files')
+
+    def testFileRenaming(self):
+        repo = pygit2.Repository(self.path)
+        for sha, old, new in self.renames():
+            commit = repo.get(sha)
+            self.assertEqual(fs.fileRenamedToAnother(old, commit, self.path), new)
+            self.assertEqual(fs.fileRenamedFromAnother(new, commit, self.path), old)
+            self.assertIsNone(fs.fileRenamedToAnother(new, commit, self.path))
 
     def testIsFirstCommit(self):
-        self.assertTrue(fs.isFirstCommit("7f12948", reponame), 'should be the 1st commit')
+        shas = self.log('--all')
+        self.assertTrue(fs.isFirstCommit(shas[-1], self.path), 'should be the 1st commit')
+        self.assertFalse(fs.isFirstCommit(shas[0], self.path))
 
     def testCommitsForDeletedFile(self):
-        commits = fs.commits_for_filestat('a.txt', reponame)
-        self.assertEqual(len(commits), 3, 'should have found correct # of commits for deleted file')
-        commits = fs.commits_for_filestat('b.txt', reponame)
-        self.assertEqual(len(commits), 3, 'should have found correct # of commits for deleted file')
+        # a name renamed away no longer exists, but its commits are still found
+        _, old, _ = self.renames()[0]
+        commits = fs.commits_for_filestat(old, self.path)
+        self.assertEqual([str(d['commit'].id) for d in commits], self.log('--all', '--full-history', '--', old))
+
+class BatchedFileStatTests(SyntheticRepoTestCase):
+    def testBatchMatchesLog(self):
+        files = fileindex.build(pygit2.Repository(self.path)).top_files(12)
+        batched = fs.commits_for_filestats(files, self.path, batchSize=5)
+        for file in files:
+            # a plain log of the file, one at a time
+            logged = subprocess.check_output(['git', '-C', self.path, 'log', '--all', '--full-history',
+                                              '--no-merges', '--format=%H', '--', file]).decode('ascii').split()
+            self.assertTrue(logged)
+            self.assertEqual([d['sha'] for d in batched[file]], logged)
+
+    def testParseNumstat(self):
+        output = b'1111\x00\n2\t0\ta.txt\x00-\t-\tb.bin\x00' + b'2222\x00\n1\t3\ta b.txt\x00'
+        chunks = [output[i:i + 5] for i in range(0, len(output), 5)]
+        self.assertEqual(list(fs.parse_numstat(chunks)),
+                         [('1111', 'a.txt', 2, 0), ('1111', 'b.bin', 0, 0), ('2222', 'a b.txt', 1, 3)])
+
+class FileIndexTests(SyntheticRepoTestCase):
+    def testIndexMatchesLog(self):
+        repo = pygit2.Repository(self.path)
+        index = fileindex.build(repo)
+        files = index.top_files(8)
+        self.assertEqual(len(files), 8)
+        for file in files:
+            indexed = [d['commit'].id for d in index.details(repo, file)]
+            logged = [d['commit'].id for d in fs.commits_for_filestat(file, self.path)]
+            self.assertEqual(indexed, logged)
+
+    def testTopFiles(self):
+        index = fileindex.FileChangeIndex()
+        index.add('1', [['x.py', 1, 0], ['y.py', 2, 0]])
+        index.add('2', [['y.py', 0, 1], ['z.bin', 3, 3]])
+        index.add('3', [['z.bin', 1, 1]])
+        self.assertEqual(index.top_files(1), ['y.py'])
+        self.assertEqual(index.top_files(2, include=fs.shouldIncludePath), ['y.py', 'x.py'])
+
+class RenameGraphTests(SyntheticRepoTestCase):
+    def testRenames(self):
+        repo = pygit2.Repository(self.path)
+        graph = renamegraph.RenameGraph()
+        fileindex.build(repo, graph)
+        renames = self.renames()
+        self.assertTrue(renames)
+        for sha, old, new in renames:
+            self.assertEqual(graph.renamed_to_in(old, sha), new)
+            self.assertEqual(graph.renamed_from_in(new, sha), old)
+
+    def testRenameChains(self):
+        graph = renamegraph.RenameGraph()
+        fileindex.build(pygit2.Repository(self.path), graph)
+        later = {old: new for _, old, new in self.renames()}
+        chains = []
+        for first in set(later) - set(later.values()):
+            chain = [first]
+            while chain[-1] in later:
+                chain.append(later[chain[-1]])
+            chains.append(chain)
+        self.assertTrue(any(len(chain) > 2 for chain in chains), 'some file should be renamed more than once')
+        for chain in chains:
+            self.assertEqual(graph.later_names(chain[0]), chain[1:])
+            self.assertEqual(graph.earlier_names(chain[-1]), list(reversed(chain[:-1])))
+
+class IncrementalImportTests(SyntheticRepoTestCase):
+    def testIncrementalMatchesFull(self):
+        full = g.analyze(self.path)
+        state = importstate.ImportState()
+        self.repo.set_head(self.repo.midpoint)
+        try:
+            g.analyze(self.path, state)
+        finally:
+            self.repo.set_head(self.repo.head)
+        self.assertEqual(state.head, self.repo.midpoint)
+        self.assertEqual(g.analyze(self.path, state), full, 'importing the new commits should give the full JSON')
+        self.assertEqual(state.head, self.repo.head)
+
+    def testSkewedClocksMatchFull(self):
+        state = importstate.ImportState()
+        g.analyze(self.path, state)
+        # a commit, then a child whose clock is behind most of the history
+        repo = pygit2.Repository(self.path)
+        parent = repo[repo.head.target]
+        midpoint = repo[self.repo.midpoint]
+        def commit(time, parents):
+            signature = pygit2.Signature('Skewed', 'skewed@example.com', time, 0)
+            return repo.create_commit(None, signature, signature, 'Skewed', parent.tree.id, parents)
+        ahead = commit(parent.commit_time + 100, [parent.id])
+        behind = commit(midpoint.commit_time - 1, [ahead])
+        self.assertTrue(g.mergeable(repo, state, ahead, state.head))
+        self.assertFalse(g.mergeable(repo, state, behind, state.head))
+        self.repo.set_head(behind)
+        self.assertEqual(g.analyze(self.path, state), g.analyze(self.path),
+                         'commits out of time order should give the full JSON')
+
+    def testReimportWithoutNewCommits(self):
+        state = importstate.ImportState()
+        full = g.analyze(self.path, state)
+        self.assertEqual(g.analyze(self.path, state), full, 'unchanged repo should re-emit the same JSON')
+
+    def testRewrittenHistoryRebuilds(self):
+        state = importstate.ImportState()
+        full = g.analyze(self.path, state)
+        state.head = '0' * 40  # not an ancestor of HEAD
+        self.assertEqual(g.analyze(self.path, state), full, 'should fall back to a full rebuild')
+
+class ParallelDiffStatsTests(SyntheticRepoTestCase):
+    def testSameOutputAsSerial(self):
+        self.assertEqual(g.analyze(self.path, workers=3), g.analyze(self.path))
+
+class BoundedImportTests(SyntheticRepoTestCase):
+    def testNoCommitInWindow(self):
+        result = g.analyze_repo(self.path, mode=modes.ImportMode(since=2000000000))
+        self.assertEqual(len(result.commits), 0)
+        self.assertIsNone(result.summary['time_extent'])
+        self.assertIsNone(result.summary['line_stats'])
+        self.assertIsNone(result.summary['filestats_line_stats'])
+
+    def testSingleCommit(self):
+        result = g.analyze_repo(self.path, mode=modes.ImportMode(max_commits=1))
+        self.assertEqual(len(result.commits), 1)
+        self.assertEqual(result.summary['time_extent'][0], result.summary['time_extent'][1])
+        # the latest commit is index 0 of the files' commits
+        indices = [c['commit_index'] for f in result.summary['files_with_max_commits'] for c in f['commits']]
+        self.assertIn(0, indices)
+        self.assertIsNotNone(result.summary['filestats_line_stats'])
 
 if __name__ == '__main__':
     unittest.main()
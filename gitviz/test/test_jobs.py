@@ -0,0 +1,122 @@
+import os
+import pathlib
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import unittest.mock
+import git.jobs as jobs
+
+class JobTableTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.table = jobs.JobTable(pathlib.Path(self.dir.name).joinpath('jobs.sqlite'))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def testDedupesActiveJobs(self):
+        job, created = self.table.enqueue('/repos/gitviz')
+        self.assertTrue(created)
+        self.assertEqual(job['repo'], 'gitviz')
+        self.assertEqual(job['status'], jobs.QUEUED)
+        again, created = self.table.enqueue('/repos/gitviz/')
+        self.assertFalse(created)
+        self.assertEqual(again['id'], job['id'])
+        # another repo of the same name
+        other, created = self.table.enqueue('/elsewhere/gitviz')
+        self.assertTrue(created)
+        self.table.cancel(other['id'])
+        self.table.start(job['id'])
+        self.table.finish(job['id'], jobs.DONE)
+        _, created = self.table.enqueue('/repos/gitviz')
+        self.assertTrue(created)
+
+    def testCancelQueued(self):
+        job, _ = self.table.enqueue('/repos/gitviz')
+        self.assertEqual(self.table.cancel(job['id'])['status'], jobs.CANCELLED)
+        self.assertFalse(self.table.start(job['id']))
+        self.assertIsNone(self.table.cancel(job['id'] + 1))
+
+    def testCancelRunning(self):
+        job, _ = self.table.enqueue('/repos/gitviz')
+        self.assertTrue(self.table.start(job['id']))
+        self.table.progress(job['id'], 'walking', 100, 400)
+        self.assertEqual(self.table.cancel(job['id'])['status'], jobs.CANCELLING)
+        with self.assertRaises(jobs.Cancelled):
+            self.table.progress(job['id'], 'walking', 200, None)
+        job = self.table.get(job['id'])
+        self.assertEqual((job['walked'], job['total']), (200, 400))
+
+    def testEta(self):
+        job, _ = self.table.enqueue('/repos/gitviz')
+        self.table.start(job['id'])
+        self.table.progress(job['id'], 'walking', 100, 400)
+        job = self.table.get(job['id'])
+        self.assertIsNotNone(job['eta'])
+        row = [job[column] for column in jobs.COLUMNS]
+        self.assertAlmostEqual(jobs.description(row, now=job['started'] + 10)['eta'], 30)
+
+    def age(self, job_id):
+        with self.table.connect() as connection:
+            connection.execute('UPDATE jobs SET updated = ? WHERE id = ?',
+                               (time.time() - jobs.STALE_SECONDS - 1, job_id))
+
+    def testQueuedJobsWait(self):
+        job, _ = self.table.enqueue('/repos/gitviz')
+        self.age(job['id'])
+        _, created = self.table.enqueue('/repos/gitviz')
+        self.assertFalse(created)
+        self.assertTrue(self.table.start(job['id']))
+
+    def testRunningJobsAreLostWithTheirWorker(self):
+        job, _ = self.table.enqueue('/repos/gitviz')
+        self.table.start(job['id'])
+        self.assertEqual(self.table.get(job['id'])['pid'], os.getpid())
+        # no progress for long, but its worker (this process) is alive
+        self.age(job['id'])
+        _, created = self.table.enqueue('/repos/gitviz')
+        self.assertFalse(created)
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        with self.table.connect() as connection:
+            connection.execute('UPDATE jobs SET pid = ?', (exited.pid,))
+        _, created = self.table.enqueue('/repos/gitviz')
+        self.assertTrue(created)
+        self.assertEqual(self.table.get(job['id'])['status'], jobs.FAILED)
+
+    def testCancellingWaitsForWrites(self):
+        job, _ = self.table.enqueue('/repos/gitviz')
+        self.table.start(job['id'])
+        self.table.cancel(job['id'])
+        self.table.progress(job['id'], 'writing', None, None)
+        self.assertEqual(self.table.get(job['id'])['status'], jobs.CANCELLING)
+
+    def testAddsPidToOldTables(self):
+        path = pathlib.Path(self.dir.name).joinpath('old.sqlite')
+        with sqlite3.connect(str(path)) as connection:
+            connection.executescript(jobs.SCHEMA.replace(',\n    pid INTEGER,\n    owner TEXT', ''))
+        table = jobs.JobTable(path)
+        job, _ = table.enqueue('/repos/gitviz')
+        self.assertEqual(table.get(job['id'])['owner'], jobs.owner())
+        table.start(job['id'])
+        self.assertEqual(table.get(job['id'])['pid'], os.getpid())
+
+    def testQueuedJobsAreLostWithTheirOwner(self):
+        job, _ = self.table.enqueue('/repos/gitviz')
+        # the server restarts (with the same pid, as in a container) before running it
+        restarted = jobs.PROCESS_TOKEN + '-restarted'
+        with unittest.mock.patch.object(jobs, 'PROCESS_TOKEN', restarted):
+            again, created = self.table.enqueue('/repos/gitviz')
+        self.assertTrue(created)
+        self.assertEqual(self.table.get(job['id'])['status'], jobs.FAILED)
+        self.assertEqual(self.table.get(job['id'])['error'], 'lost')
+        # the new job is owned by the restarted server, not by this process
+        _, created = self.table.enqueue('/repos/gitviz')
+        self.assertTrue(created)
+        self.assertEqual(self.table.get(again['id'])['status'], jobs.FAILED)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import pathlib
+import tempfile
+import unittest
+import git.metrics as metrics
+
+class RegistryTests(unittest.TestCase):
+    def testDifference(self):
+        registry = metrics.Registry()
+        registry.record('walk', 1.0)
+        registry.count('commits', 3)
+        before = registry.snapshot()
+        registry.record('walk', 0.5)
+        registry.record('diff', 0.25)
+        registry.count('commits', 2)
+        seconds, counters = metrics.difference(before, registry.snapshot())
+        self.assertEqual(seconds, {'walk': 0.5, 'diff': 0.25})
+        self.assertEqual(counters, {'commits': 2})
+        self.assertEqual(registry.snapshot()['timers']['walk'], {'count': 2, 'total': 1.5, 'max': 1.0})
+
+class ImportRunTests(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.TemporaryDirectory()
+        os.chdir(self.dir.name)
+        pathlib.Path('gitviz/data').mkdir(parents=True)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def testLogsStages(self):
+        with metrics.ImportRun('repo', profile=True):
+            metrics.registry.record('import.walk', 2.0)
+            metrics.count('import.commits', 100)
+        with self.assertRaises(KeyError):
+            with metrics.ImportRun('other'):
+                raise KeyError('x')
+        latest, first = metrics.recent_imports()
+        self.assertEqual(first['stages'], {'import.walk': 2.0})
+        self.assertEqual(first['commits_per_second'], 50)
+        self.assertTrue(os.path.exists(first['profile']))
+        self.assertEqual((latest['repo'], latest['status']), ('other', 'failed'))
+
+if __name__ == '__main__':
+    unittest.main()
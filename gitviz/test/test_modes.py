@@ -0,0 +1,94 @@
+import unittest
+import git.formatters as formatters
+import git.modes as modes
+
+DAY = modes.DAY
+# 2017-06-16 00:00 UTC
+HEAD_TIME = 1497571200
+
+class Commit:
+    def __init__(self, commit_time, parents=1):
+        self.commit_time = commit_time
+        self.parents = [None] * parents
+
+def history(count, spacing=DAY):
+    """count commits a spacing apart, latest (HEAD) first, every 5th a merge"""
+    return [Commit(HEAD_TIME - i * spacing, parents=2 if i % 5 == 4 else 1) for i in range(count)]
+
+class Walk:
+    """Iterates (commit, None) pairs, remembering how many were read"""
+    def __init__(self, commits):
+        self.commits = commits
+        self.read = 0
+
+    def __iter__(self):
+        for commit in self.commits:
+            self.read += 1
+            yield commit, None
+
+def selected(mode, commits):
+    return [commit for commit, _ in mode.select(Walk(commits), HEAD_TIME)]
+
+class ImportModeTests(unittest.TestCase):
+    def testFullKeepsEverything(self):
+        commits = history(20)
+        self.assertEqual(selected(modes.ImportMode(), commits), commits)
+        self.assertEqual(modes.ImportMode().description(), {'kind': 'full'})
+
+    def testWindowStopsTheWalk(self):
+        commits = history(100)
+        walk = Walk(commits)
+        mode = modes.ImportMode(since=HEAD_TIME - 20 * DAY, until=HEAD_TIME - 9 * DAY)
+        self.assertEqual([commit for commit, _ in mode.select(walk, HEAD_TIME)], commits[10:21])
+        self.assertEqual(walk.read, 22)
+        self.assertEqual(mode.kind(), modes.BOUNDED)
+
+    def testWindowOfUnsortedWalk(self):
+        # a topological walk of several refs: another ref's recent commits after old ones
+        commits = history(30)[20:] + history(5)
+        walk = Walk(commits)
+        mode = modes.ImportMode(last_days=7)
+        self.assertEqual([commit for commit, _ in mode.select(walk, HEAD_TIME, time_sorted=False)], commits[10:])
+        self.assertEqual(walk.read, 15)
+        self.assertEqual(selected(mode, commits), [])
+
+    def testLastDays(self):
+        commits = history(100)
+        self.assertEqual(selected(modes.ImportMode(last_days=7), commits), commits[:8])
+
+    def testMaxCommitsCountsNonMerges(self):
+        commits = history(100)
+        walk = Walk(commits)
+        kept = [commit for commit, _ in modes.ImportMode(max_commits=8).select(walk, HEAD_TIME)]
+        self.assertEqual(kept, commits[:9])
+        self.assertEqual(walk.read, 9)
+
+    def testSampleIsStratifiedByMonth(self):
+        commits = history(24 * 60, spacing=DAY // 24)  # hourly, from mid-May
+        kept = selected(modes.ImportMode(sample=0.25), commits)
+        self.assertFalse(any(len(commit.parents) > 1 for commit in kept))
+        months = {modes.stratum(commit.commit_time) for commit in commits}
+        self.assertEqual({modes.stratum(commit.commit_time) for commit in kept}, months)
+        non_merges = sum(1 for commit in commits if len(commit.parents) == 1)
+        self.assertAlmostEqual(len(kept) / non_merges, 0.25, delta=0.01)
+
+    def testDescriptionRoundTrip(self):
+        mode = modes.ImportMode(since=formatters.parse_time('2017-01-01'), max_commits=500, sample=0.5)
+        self.assertEqual(mode.description(), {'kind': 'sampled', 'since': 1483228800, 'max_commits': 500,
+                                              'sample': 0.5})
+        self.assertEqual(modes.ImportMode.from_description(mode.description()).description(), mode.description())
+        self.assertEqual(formatters.parse_time('2017-01-01T02:00:00+02:00'), 1483228800)
+        self.assertEqual(formatters.parse_time('1483228800'), 1483228800)
+
+    def testRefsAreNotIncremental(self):
+        mode = modes.ImportMode(refs=['refs/heads/*'])
+        self.assertTrue(mode.is_full())
+        self.assertFalse(mode.is_incremental())
+        self.assertEqual(mode.description(), {'kind': 'full', 'refs': ['refs/heads/*']})
+
+    def testInvalid(self):
+        self.assertRaises(ValueError, modes.ImportMode, sample=0)
+        self.assertRaises(ValueError, modes.ImportMode, max_commits=0)
+
+if __name__ == '__main__':
+    unittest.main()
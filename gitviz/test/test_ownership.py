@@ -0,0 +1,45 @@
+import unittest
+import git.ownership as ownership
+
+class Graph:
+    """renamegraph.RenameGraph's lookups, for one rename of 'old.py' to 'new.py' in commit 'b'"""
+    def renamed_to_in(self, path, sha):
+        return 'new.py' if (path, sha) == ('old.py', 'b') else None
+
+    def earlier_names(self, path):
+        return ['old.py'] if path == 'new.py' else []
+
+class OwnershipTests(unittest.TestCase):
+    def testInsertions(self):
+        runs = [[5, 'a']]
+        # 2 lines added after line 3
+        runs = ownership.apply(runs, [(3, 0, [('+', 2)])], 'b')
+        self.assertEqual(runs, [[3, 'a'], [2, 'b'], [2, 'a']])
+        # 1 line added before the first
+        self.assertEqual(ownership.apply(runs, [(0, 0, [('+', 1)])], 'c'), [[1, 'c'], [3, 'a'], [2, 'b'], [2, 'a']])
+
+    def testChangesAndDeletions(self):
+        runs = [[3, 'a'], [2, 'b'], [2, 'a']]
+        # line 2 replaced, lines 4-5 deleted, with context
+        hunks = [(1, 3, [(' ', 1), ('-', 1), ('+', 1), (' ', 1)]),
+                 (4, 3, [('-', 2), (' ', 1)])]
+        self.assertEqual(ownership.apply(runs, hunks, 'c'), [[1, 'a'], [1, 'c'], [3, 'a']])
+        self.assertEqual(ownership.owners([[1, 'a'], [1, 'c'], [3, 'a']]), {'a': 4, 'c': 1})
+
+    def testLineCount(self):
+        self.assertEqual(ownership.line_count(b''), 0)
+        self.assertEqual(ownership.line_count(b'a\nb\n'), 2)
+        self.assertEqual(ownership.line_count(b'a\nb'), 2)
+
+    def testHistoryFollowsRenames(self):
+        details = [{'sha': 'c'}, {'sha': 'b'}, {'sha': 'b'}, {'sha': 'a'}]
+        history = ownership.FileHistory.from_filestats('new.py', details, Graph())
+        self.assertEqual(history.versions, [('a', 'old.py'), ('b', 'new.py'), ('c', 'new.py')])
+        self.assertEqual(history.names, ['new.py', 'old.py'])
+
+    def testAuthorLines(self):
+        owned = {'a': 4, 'b': 1, 'c': 6, 'gone': 3}
+        self.assertEqual(ownership.author_lines(owned, {'a': 0, 'b': 1, 'c': 1}), [[1, 7], [0, 4]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+import git.fileindex as fileindex
+import git.importstate as importstate
+import git.recordstore as recordstore
+from test.test_table import record
+
+class RecordStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.records = [record('d' * 40, 1497650000, 0, name='Zoë', insertions=1, deletions=1),
+                        {'sha': 'c' * 40, 'parents': 2, 'commit_time': 1497640533},  # a merge
+                        record('b' * 40, 1497630000, 0, name='David'),
+                        record('a' * 40, 1497621577, -420, name='Zoë', insertions=9, parents=0)]
+        self.records[0].update(files=[['a.py', 0, 5], ['b.py', 1, 0]], renames=[['a.py', 'b.py']])
+        self.records[2].update(files=[])
+        self.records[3].update(files=[['a.py', 9, 1]], refs=3)
+        for r in self.records:
+            r.setdefault('commit_time', r.get('epoch'))
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'repo.records.sqlite')
+        self.store = recordstore.RecordStore.create(self.path)
+        self.store.write(self.records, 'head')
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def testRecordsAsWritten(self):
+        self.assertEqual(list(self.store.records()), self.records)
+        self.assertEqual(len(self.store), 4)
+        self.assertEqual(self.store.head, 'head')
+        self.assertTrue(self.store.in_time_order())
+        skewed = recordstore.RecordStore.create()
+        skewed.write(reversed(self.records), 'head')
+        self.assertFalse(skewed.in_time_order())
+        skewed.close()
+
+    def testRecordsWithoutFiles(self):
+        records = list(self.store.records(files=False))
+        self.assertTrue(all('files' not in r for r in records))
+        self.assertEqual(records[0]['renames'], [['a.py', 'b.py']])
+
+    def testFileIndexQueries(self):
+        index = fileindex.FileChangeIndex.from_records(self.records)
+        self.assertEqual(self.store.top_files(2), index.top_files(2))
+        self.assertEqual(self.store.top_files(1, include=lambda path: path != 'a.py'), ['b.py'])
+        repo = {sha * 40: sha for sha in 'abcd'}
+        self.assertEqual(self.store.details(repo, 'a.py'), index.details(repo, 'a.py'))
+
+    def testTemporaryStoreIsRemoved(self):
+        store = recordstore.RecordStore.create()
+        store.write(self.records, 'head')
+        self.assertTrue(os.path.exists(store.path))
+        store.close()
+        self.assertFalse(os.path.exists(store.path))
+
+    def testStateOfAnotherHeadIsEmpty(self):
+        state = importstate.ImportState('head', self.store, {})
+        loaded = importstate.ImportState.from_description(state.description(), recordstore.RecordStore(self.path))
+        self.assertEqual(list(loaded.iter_records()), self.records)
+        loaded.close()
+        state.head = 'other'
+        self.assertTrue(importstate.ImportState.from_description(
+            state.description(), recordstore.RecordStore(self.path)).is_empty())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import base64
+import unittest
+import numpy as np
+import git.refs as refs
+
+class Commit:
+    def __init__(self, sha, parents=()):
+        self.id = sha
+        self.parent_ids = list(parents)
+
+class RefsTests(unittest.TestCase):
+    def setUp(self):
+        # e - d (master)    f (feature, from b)
+        #      \           /
+        #       c - b --- a
+        self.commits = [Commit('f', ['b']), Commit('e', ['d']), Commit('d', ['c']),
+                        Commit('c', ['b']), Commit('b', ['a']), Commit('a')]
+        self.tips = [('refs/heads/master', 'e'), ('refs/heads/feature', 'f'), ('refs/tags/v1', 'c')]
+
+    def testMemberships(self):
+        bits = {commit.id: bits for commit, bits in refs.memberships(iter(self.commits), self.tips)}
+        self.assertEqual(bits, {'f': 0b010, 'e': 0b001, 'd': 0b001, 'c': 0b101, 'b': 0b111, 'a': 0b111})
+
+    def testPackedColumns(self):
+        records = [{'sha': commit.id, 'refs': bits} for commit, bits in refs.memberships(iter(self.commits), self.tips)]
+        packed = refs.packed(records, ['e', 'f', 'c', 'a'], len(self.tips))
+        self.assertEqual(packed.shape, (4, 1))
+        self.assertEqual(refs.ref_column(packed, 1).tolist(), [False, True, False, True])
+        described = refs.descriptions([name for name, _ in self.tips], packed)
+        self.assertEqual([ref['commits'] for ref in described], [3, 2, 2])
+        tag_bits = np.unpackbits(np.frombuffer(base64.b64decode(described[2]['commits_bits']), dtype=np.uint8))
+        self.assertEqual(tag_bits[:4].tolist(), [0, 0, 1, 1])
+
+    def testWideBitsets(self):
+        records = [{'sha': 'x', 'refs': 1 << 9}]
+        packed = refs.packed(records, ['x'], 10)
+        self.assertEqual(packed.shape, (1, 2))
+        self.assertTrue(refs.ref_column(packed, 9)[0])
+        self.assertFalse(refs.ref_column(packed, 1)[0])
+
+    def testPatterns(self):
+        self.assertTrue(refs.matches('refs/heads/main', 'refs/heads/*'))
+        self.assertTrue(refs.matches('refs/heads/main', 'main'))
+        self.assertTrue(refs.matches('refs/tags/v1.2', 'v*'))
+        self.assertFalse(refs.matches('refs/heads/v-next', 'refs/tags/v*'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+import git.analysis as analysis
+import git.author as author
+import git.repodb as repodb
+import git.table as table
+from test.test_table import record
+
+class RepoDBTests(unittest.TestCase):
+    def setUp(self):
+        self.records = [record('d' * 40, 1497650000, 0, name='Zoë', insertions=1, deletions=1),
+                        {'sha': 'c' * 40, 'parents': 2, 'commit_time': 1497640533},  # a merge
+                        record('b' * 40, 1497630000, 0, name='David', insertions=5),
+                        record('a' * 40, 1497621577, -420, name='Zoë', insertions=9, parents=0)]
+        self.records[0].update(files=[['a.py', 0, 5], ['b.py', 1, 0]], renames=[['a.py', 'b.py']])
+        self.records[2].update(files=[['z.md', 5, 0]])
+        self.records[3].update(files=[['a.py', 9, 1]])
+        authors = author.AuthorIndex()
+        for count, r in enumerate(self.records, start=1):
+            if 'epoch' in r:
+                authors.add(r['name'], r['email'], count)
+        commits = table.CommitTable.from_records(self.records, authors)
+        result = analysis.Analysis(commits.take(commits.time_order()),
+                                   [info.name() if info else None for info in authors.infos],
+                                   [info.email() if info else None for info in authors.infos], {})
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'repo.sqlite')
+        repodb.write(self.path, self.records, result)
+        self.db = repodb.RepoDB(self.path)
+
+    def tearDown(self):
+        self.db.connection.close()
+        self.dir.cleanup()
+
+    def testFileHistoryFollowsRenames(self):
+        history = self.db.file_history('b.py')
+        self.assertEqual(history['paths'], ['b.py', 'a.py'])
+        self.assertEqual([(c['sha'][0], c['file']) for c in history['commits']], [('d', 'b.py'), ('a', 'a.py')])
+        self.assertEqual(len(self.db.file_history('b.py', follow=False)['commits']), 1)
+        first = self.db.file_history('b.py', limit=1)
+        self.assertEqual(first['next_cursor'], 1)
+        self.assertEqual(self.db.file_history('b.py', offset=1)['commits'][0]['sha'], 'a' * 40)
+
+    def testPageLimits(self):
+        for limit in [0, -1]:
+            history = self.db.file_history('b.py', limit=limit)
+            self.assertEqual([c['sha'][0] for c in history['commits']], ['d'])
+            self.assertEqual(history['next_cursor'], 1)
+            history = self.db.author_history(name='Zoë', offset=-5, limit=limit)
+            self.assertEqual([c['sha'][0] for c in history['commits']], ['d'])
+            self.assertEqual(history['next_cursor'], 1)
+
+    def testAuthorHistory(self):
+        history = self.db.author_history(email='zoë@x.org')
+        self.assertEqual(history['authors'][0]['commits'], 2)
+        self.assertEqual([c['sha'][0] for c in history['commits']], ['d', 'a'])
+        history = self.db.author_history(name='Zoë', start=1497630000)
+        self.assertEqual([c['sha'][0] for c in history['commits']], ['d'])
+        self.assertIsNone(self.db.author_history(email='nobody@x.org'))
+
+    def testTop(self):
+        self.assertEqual([f['file'] for f in self.db.top_files(1)], ['a.py'])
+        self.assertEqual(self.db.top_files(3, start=1497630000)[0], {'file': 'a.py', 'commits': 1,
+                                                                     'insertions': 0, 'deletions': 5})
+        self.assertEqual(self.db.top_authors(1)[0]['name'], 'Zoë')
+        self.assertEqual(self.db.top_authors(1, end=1497640000)[0]['name'], 'David')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import tempfile
+import unittest
+import git.metrics as metrics
+import git.reposession as reposession
+
+def git(path, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='A', GIT_AUTHOR_EMAIL='a@x.org',
+               GIT_COMMITTER_NAME='A', GIT_COMMITTER_EMAIL='a@x.org')
+    return subprocess.check_output(['git', '-C', path] + list(args), env=env).decode('ascii').strip()
+
+class RepoSessionTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        # a path a shell would split
+        self.path = os.path.join(self.dir.name, 'my repo')
+        os.mkdir(self.path)
+        git(self.path, 'init', '-q')
+        for i, text in enumerate(['one\n', 'two\n']):
+            with open(os.path.join(self.path, 'a.txt'), 'w') as f:
+                f.write(text)
+            git(self.path, 'add', 'a.txt')
+            git(self.path, 'commit', '-q', '-m', 'commit {}'.format(i))
+        self.shas = git(self.path, 'log', '--format=%H').split()
+        self.session = reposession.RepoSession(self.path)
+
+    def tearDown(self):
+        self.session.close()
+        self.dir.cleanup()
+
+    def testCommitsAreLookedUpOnce(self):
+        before = metrics.registry.snapshot()
+        commits = self.session.get_many(self.shas + self.shas)
+        self.assertEqual([str(commit.id) for commit in commits], self.shas + self.shas)
+        self.session.get(self.shas[0])
+        _, counters = metrics.difference(before, metrics.registry.snapshot())
+        self.assertEqual(counters['reposession.misses'], 2)
+        self.assertTrue(self.session.is_first_commit(self.shas[1]))
+        self.assertFalse(self.session.is_first_commit(self.shas[0]))
+
+    def testGit(self):
+        self.assertEqual(self.session.git('rev-parse', 'HEAD').decode('ascii').strip(), self.shas[0])
+
+    def testOf(self):
+        self.assertIs(reposession.of(self.session), self.session)
+        self.assertEqual(reposession.of(self.path).path, self.path)
+
+    def testLRU(self):
+        lru = reposession.LRU(2)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        lru.get('a')
+        lru.put('c', 3)
+        self.assertEqual(list(lru.entries), ['a', 'c'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import tempfile
+import time
+import unittest
+import git.statcache as statcache
+
+def stats(n):
+    return n, n + 1, [['file{}.py'.format(i), i, 0] for i in range(n)], []
+
+class StatCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'diffstats.sqlite')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def testPersists(self):
+        with statcache.StatCache(self.path) as cache:
+            cache.put(('', 'a', ''), stats(2))
+            self.assertEqual(cache.get(('', 'a', '')), (2, 3, [['file0.py', 0, 0], ['file1.py', 1, 0]], []))
+        with statcache.StatCache(self.path) as cache:
+            self.assertEqual(cache.get(('', 'a', '')), (2, 3, [['file0.py', 0, 0], ['file1.py', 1, 0]], []))
+            self.assertIsNone(cache.get(('', 'a', '50/1000')))
+            self.assertEqual(cache.size(), len(statcache.encoded(stats(2))))
+
+    def testEvictsLeastRecentlyUsed(self):
+        size = len(statcache.encoded(stats(20)))
+        with statcache.StatCache(self.path, max_bytes=size * 3) as cache:
+            for name in ['a', 'b', 'c']:
+                cache.put(('p', name, ''), stats(20))
+                cache.flush()
+                time.sleep(0.01)
+            cache.get(('p', 'a', ''))  # a is now more recent than b & c
+            cache.flush()
+            cache.put(('p', 'd', ''), stats(20))
+            cache.flush()
+            self.assertEqual(cache.count(), 2)
+            self.assertLessEqual(cache.size(), size * 3 * statcache.EVICT_TO)
+            self.assertIsNotNone(cache.get(('p', 'a', '')))
+            self.assertIsNotNone(cache.get(('p', 'd', '')))
+            self.assertIsNone(cache.get(('p', 'b', '')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from datetime import datetime, timezone, timedelta
+import git.author as author
+import git.table as table
+
+def record(sha, epoch, offset, name='Jane', insertions=1, deletions=0, parents=1):
+    return {'sha': sha, 'parents': parents, 'message': 'm', 'name': name, 'email': name + '@x.org',
+            'epoch': epoch, 'offset': offset, 'insertions': insertions, 'deletions': deletions}
+
+class CommitTableTests(unittest.TestCase):
+    def setUp(self):
+        self.records = [record('c' * 40, 1497640533, 120),
+                        {'sha': 'b' * 40, 'parents': 2},  # a merge, excluded
+                        record('a' * 40, 1497621577, -420, name='David', parents=0)]
+        self.authors = author.AuthorIndex()
+        for count, r in enumerate(self.records, start=1):
+            if 'epoch' in r:
+                self.authors.add(r['name'], r['email'], count)
+        self.commits = table.CommitTable.from_records(self.records, self.authors)
+
+    def testLocalMinutes(self):
+        for i, r in enumerate(r for r in self.records if 'epoch' in r):
+            local = datetime.fromtimestamp(r['epoch'], timezone(timedelta(minutes=r['offset'])))
+            day_minutes = local.hour * 60 + local.minute
+            self.assertEqual(self.commits.local_day_minutes()[i], day_minutes)
+            self.assertEqual(self.commits.local_weekday_minutes()[i], local.weekday() * 24 * 60 + day_minutes)
+
+    def testDescriptions(self):
+        names = [info.name() if info else None for info in self.authors.infos]
+        emails = [info.email() if info else None for info in self.authors.infos]
+        descriptions = self.commits.take(self.commits.time_order()).descriptions(names, emails)
+        self.assertEqual([d['sha'] for d in descriptions], ['c' * 40, 'a' * 40])
+        self.assertEqual(descriptions[1]['name'], 'David')
+        self.assertEqual(descriptions[0]['time'], '2017-06-16T21:15:33+02:00')
+
+    def testPercentileStatInfo(self):
+        info = table.percentile_stat_info(list(range(100)), list(range(100, 200)))
+        self.assertEqual(info, {'min': 0, 'max': 199, 'percentile_value': 197})
+        self.assertIsNone(table.percentile_stat_info([], []))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import json
+import unittest
+from dateutil import parser as dateparser
+import git.analysis as analysis
+import git.author as author
+import git.table as table
+import git.wire as wire
+
+def record(sha, epoch, offset, name='Jane', message='m'):
+    return {'sha': sha, 'parents': 1, 'message': message, 'name': name, 'email': name + '@x.org',
+            'epoch': epoch, 'offset': offset, 'insertions': 2, 'deletions': 1}
+
+class WireTests(unittest.TestCase):
+    def setUp(self):
+        records = [record('c' * 40, 1497640533, 120),
+                   record('b' * 40, 1497630000, 0, name='David', message='fix'),
+                   record('a' * 40, 1497621577, -420)]
+        authors = author.AuthorIndex()
+        for count, r in enumerate(records):
+            authors.add(r['name'], r['email'], count)
+        commits = table.CommitTable.from_records(records, authors)
+        names = [info.name() for info in authors.infos]
+        emails = [info.email() for info in authors.infos]
+        descriptions = [info.description() for info in authors.infos]
+        self.result = analysis.Analysis(commits, names, emails, {
+            'authors': descriptions,
+            'low_commit_authors': [],
+            'time_extent': [commits.time_string(2), commits.time_string(0)],
+            'line_stats': None,
+            'filestats_line_stats': None,
+            'files_with_max_commits': [{'file': 'a.py', 'commits': [{'commit_index': 1}], 'authors': descriptions[1:]}]
+        })
+
+    def testRanges(self):
+        self.assertEqual(wire.ranges([0, 1, 2, 5, 7, 8]), [0, 3, 5, 1, 7, 2])
+        self.assertEqual(wire.expand(wire.ranges([0, 1, 2, 5, 7, 8])), [0, 1, 2, 5, 7, 8])
+        self.assertEqual(wire.ranges([]), [])
+
+    def testDeltas(self):
+        self.assertEqual(wire.deltas([30, 20, 25]).tolist(), [30, -10, 5])
+
+    def testSameDataAsSchema1(self):
+        v1 = self.result.response_dict()
+        v2 = json.loads(''.join(wire.iter_json(self.result)))
+        self.assertEqual(v2['schema'], 2)
+        self.assertNotIn('times', v2)
+        columns = v2['commits']
+        epoch = 0
+        for i, commit in enumerate(v1['commits']):
+            epoch += columns['epochs'][i]
+            self.assertEqual(dateparser.parse(commit['time']).timestamp(), epoch)
+            self.assertEqual(v2['names'][columns['author'][i]], commit['name'])
+            self.assertEqual(v2['emails'][columns['author'][i]], commit['email'])
+            self.assertEqual(v2['messages'][columns['message'][i]], commit['message'])
+            self.assertEqual(columns['sha'][i], commit['sha'])
+        for original, normalized in zip(v1['authors'], v2['authors']):
+            self.assertEqual(v2['emails'][normalized['author']], original['email'])
+            self.assertEqual(wire.expand(normalized['commits']), original['commits'])
+        self.assertEqual(v2['names'][v2['files_with_max_commits'][0]['authors'][0]['author']], 'David')
+        self.assertEqual(v2['time_extent'], v1['time_extent'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,110 @@
-from flask import render_template, request, session
+from flask import g, render_template, request, send_file, session
 
 import pathlib
 import datetime
 import json
 import glob
+import os
+import time
 
-from gitviz.git import git
+from gitviz.git import artifact
+from gitviz.git import formatters
+from gitviz.git import jobs
+from gitviz.git import metrics
+from gitviz.git import payload
+from gitviz.git import query
+from gitviz.git import refs
+from gitviz.git import repodb
+from gitviz.git import wire
 from gitviz import app
+from gitviz import cache
+
+
+def dataDirPath():
+    return pathlib.Path.cwd().joinpath('gitviz/data/')
+
+
+# imported repos have a binary artifact, older ones may only have JSON
+catalog = cache.RepoCatalog(dataDirPath(), ['.gvz', '.json'])
+_responseCache = None
+artifacts = cache.OpenFiles(artifact.Artifact)
+databases = cache.OpenFiles(repodb.RepoDB, close=repodb.RepoDB.close)
+_jobQueue = None
+
+
+def responseCache():
+    """The cache of get_repo responses, sized by config's REPO_CACHE_BYTES"""
+    global _responseCache
+    if _responseCache is None:
+        _responseCache = cache.RepoCache(app.config.get('REPO_CACHE_BYTES', 256 * 1024 * 1024))
+    return _responseCache
+
+
+def jobQueue():
+    """The queue of background imports, run by config's IMPORT_WORKERS processes"""
+    global _jobQueue
+    if _jobQueue is None:
+        _jobQueue = jobs.JobQueue(jobs.JobTable(jobs.jobsPath()), app.config.get('IMPORT_WORKERS', 1))
+    return _jobQueue
 
 
 def allRepoNames():
-    jsonsDirPath = pathlib.Path.cwd().joinpath('gitviz/data/')
-    names = [jsonFile.stem for jsonFile in sorted(jsonsDirPath.glob("*.json"))]
-    return names
+    return catalog.names()
+
+
+def repoJsonPath(name):
+    """Path to the repo's JSON, generated from its artifact if needed"""
+    jsonPath = dataDirPath().joinpath(name + '.json')
+    artifactPath = dataDirPath().joinpath(name + '.gvz')
+    if artifactPath.exists() and (not jsonPath.exists() or
+                                  jsonPath.stat().st_mtime < artifactPath.stat().st_mtime):
+        artifact.write_json(artifactPath, jsonPath)
+    return jsonPath
+
+
+def repoData(path):
+    """The repo's data, from its memory mapped artifact or its JSON"""
+    if path.suffix == '.gvz':
+        return artifact.Artifact(path).response_dict()
+    return json.loads(path.read_text())
+
+
+def repoResponse(path):
+    """The serialized get_repo response for the repo's data file at path"""
+    return json.dumps({
+        'data': repoData(path)
+    }).encode('utf-8')
+
+
+def compactRepoResponse(path):
+    """The serialized get_repo response in schema 2 (see wire.py). Repos that
+    only have JSON get schema 1, which clients tell by the missing 'schema'."""
+    if path.suffix != '.gvz':
+        return repoResponse(path)
+    return ''.join(wire.iter_json(artifact.Artifact(path).analysis(), envelope='data')).encode('utf-8')
+
+
+def precompressedResponse(name, schema=1):
+    """Sends the response file written at import, in the best encoding the
+    client accepts; answers conditional requests with a 304.
+    None if there is no such file, or it is older than the repo's data."""
+    envelopePath = payload.envelopePath(name, schema=schema)
+    try:
+        if envelopePath.stat().st_mtime < catalog.path(name).stat().st_mtime:
+            return None
+    except FileNotFoundError:
+        return None
+    path, contentEncoding = envelopePath, None
+    for encoding, _ in payload.ENCODINGS:
+        encodedPath = payload.envelopePath(name, encoding, schema)
+        if request.accept_encodings[encoding] and encodedPath.exists():
+            path, contentEncoding = encodedPath, encoding
+            break
+    response = send_file(str(path), mimetype='application/json', conditional=True)
+    if contentEncoding:
+        response.headers['Content-Encoding'] = contentEncoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 
 def reponame():
@@ -36,6 +128,19 @@ def set_repo(new_repo):
     else:
         print('ERR: no such repo: {}'.format(new_repo))
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_timing(response):
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        metrics.registry.record('request.{}'.format(request.endpoint), time.perf_counter() - start)
+        metrics.count('response.{}'.format(response.status_code))
+    return response
+
 @app.errorhandler(404)
 def page_not_found(e):
     print(dir(request))
@@ -47,11 +152,18 @@ def index():
     # (accessed via D3 code, after the intial HTML render)
     repoToGet = request.args.get('get_repo')
     if repoToGet:
-        dataPath = pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(repo() + '.json')
-        repoJson = dataPath.read_text()
-        return json.dumps({
-            'data': json.loads(repoJson)
-        })
+        name = repo()
+        schema = request.args.get('schema', wire.SCHEMAS[0], type=int)
+        if schema not in wire.SCHEMAS:
+            return json.dumps({'error': 'no schema {}, only {}'.format(schema, wire.SCHEMAS)}), 400
+        response = precompressedResponse(name, schema)
+        if response is not None:
+            return response
+        if schema == 1:
+            body = responseCache().get(name, catalog.path(name), repoResponse)
+        else:
+            body = responseCache().get('{}?schema={}'.format(name, schema), catalog.path(name), compactRepoResponse)
+        return app.response_class(body, mimetype='application/json')
 
     # if we are asked to return the initial HTML page
     repoToSet = request.args.get('set_repo')
@@ -64,11 +176,263 @@ def index():
                            repo_name=reponame(),
                            repos=repos)
 
+def timeArg(name):
+    """Seconds since the epoch, from a query argument in seconds or as an ISO date"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return formatters.parse_time(value)
+
+
+@app.route('/repoexplorer/commits')
+def commits():
+    """Commits in the [start, end) time window, paginated with cursor"""
+    name = request.args.get('repo') or repo()
+    if name not in allRepoNames() or catalog.path(name).suffix != '.gvz':
+        return json.dumps({'error': 'no imported artifact for {}'.format(name)}), 404
+    try:
+        start = timeArg('start')
+        end = timeArg('end')
+        cursor = request.args.get('cursor', type=int)
+        limit = request.args.get('limit', query.DEFAULT_LIMIT, type=int)
+    except (ValueError, OverflowError) as err:
+        return json.dumps({'error': str(err)}), 400
+    start = start if start is not None else -2**63
+    end = end if end is not None else 2**63 - 1
+    stored = artifacts.get(name, catalog.path(name))
+    result = query.commits_in_window(stored, start, end, cursor=cursor, limit=limit)
+    return app.response_class(json.dumps(result), mimetype='application/json')
+
+
+@app.route('/repoexplorer/summary')
+def summary():
+    """Overview of the repo without its commits: pre-aggregated histograms,
+    author rhythms & activity spans, time extent and line stats, and the
+    mode (full, bounded or sampled, see git/modes.py) it was imported with"""
+    name = request.args.get('repo') or repo()
+    if name not in allRepoNames() or catalog.path(name).suffix != '.gvz':
+        return json.dumps({'error': 'no imported artifact for {}'.format(name)}), 404
+    body = responseCache().get(name + '?summary', catalog.path(name), summaryResponse)
+    return app.response_class(body, mimetype='application/json')
+
+
+def summaryResponse(path):
+    stored = artifact.Artifact(path)
+    repoSummary = stored.summary()
+    return json.dumps({
+        'commit_count': stored.count,
+        'time_extent': repoSummary['time_extent'],
+        'line_stats': repoSummary['line_stats'],
+        'rollups': stored.rollups(),
+        'mode': stored.meta().get('mode', {'kind': 'full'})
+    }).encode('utf-8')
+
+
+def repoDB(name):
+    """The repo's database, None if it was imported without one"""
+    path = repodb.dbPath(name)
+    if name not in allRepoNames() or not path.exists():
+        return None
+    return databases.get(name, path)
+
+
+def noDatabase(name):
+    return json.dumps({'error': 'no imported database for {}'.format(name)}), 404
+
+
+def pageArgs():
+    return (request.args.get('cursor', 0, type=int),
+            request.args.get('limit', repodb.DEFAULT_LIMIT, type=int))
+
+
+@app.route('/repoexplorer/files/history')
+def file_history():
+    """Commits that changed 'path', latest first, following renames unless follow=0"""
+    name = request.args.get('repo') or repo()
+    db = repoDB(name)
+    if db is None:
+        return noDatabase(name)
+    path = request.args.get('path')
+    if not path:
+        return json.dumps({'error': 'path is required'}), 400
+    cursor, limit = pageArgs()
+    result = db.file_history(path, follow=request.args.get('follow') != '0', offset=cursor, limit=limit)
+    return app.response_class(json.dumps(result), mimetype='application/json')
+
+
+@app.route('/repoexplorer/authors/history')
+def author_history():
+    """Commits of the author with 'email' (or 'name'), in the [start, end) window"""
+    name = request.args.get('repo') or repo()
+    db = repoDB(name)
+    if db is None:
+        return noDatabase(name)
+    email, authorName = request.args.get('email'), request.args.get('name')
+    if email is None and authorName is None:
+        return json.dumps({'error': 'email or name is required'}), 400
+    try:
+        start, end = timeArg('start'), timeArg('end')
+    except (ValueError, OverflowError) as err:
+        return json.dumps({'error': str(err)}), 400
+    cursor, limit = pageArgs()
+    result = db.author_history(email, authorName, start, end, offset=cursor, limit=limit)
+    if result is None:
+        return json.dumps({'error': 'no such author'}), 404
+    return app.response_class(json.dumps(result), mimetype='application/json')
+
+
+@app.route('/repoexplorer/top')
+def top():
+    """The top 'count' files or authors (kind=files|authors), in the [start, end) window"""
+    name = request.args.get('repo') or repo()
+    db = repoDB(name)
+    if db is None:
+        return noDatabase(name)
+    kind = request.args.get('kind', 'files')
+    if kind not in ['files', 'authors']:
+        return json.dumps({'error': 'kind is files or authors'}), 400
+    try:
+        start, end = timeArg('start'), timeArg('end')
+    except (ValueError, OverflowError) as err:
+        return json.dumps({'error': str(err)}), 400
+    count = min(request.args.get('count', 15, type=int), repodb.MAX_LIMIT)
+    top = db.top_files if kind == 'files' else db.top_authors
+    return app.response_class(json.dumps({kind: top(count, start, end)}), mimetype='application/json')
+
+
+@app.route('/repoexplorer/directories')
+def directories():
+    """Commits, churn & top authors of the directory at 'prefix' (the root by
+    default), and of each of its subdirectories"""
+    name = request.args.get('repo') or repo()
+    if name not in allRepoNames() or catalog.path(name).suffix != '.gvz':
+        return json.dumps({'error': 'no imported artifact for {}'.format(name)}), 404
+    stored = artifacts.get(name, catalog.path(name))
+    dirs = stored.dirtree()
+    if dirs is None:
+        return json.dumps({'error': '{} was imported without directories, import it again'.format(name)}), 404
+    prefix = request.args.get('prefix', '')
+    authors = min(request.args.get('authors', 10, type=int), repodb.MAX_LIMIT)
+    result = dirs.query(prefix, stored.string_table('author_names'), stored.string_table('author_emails'), authors)
+    if result is None:
+        return json.dumps({'error': 'no directory {} in {}'.format(prefix, name)}), 404
+    return app.response_class(json.dumps(result), mimetype='application/json')
+
+
+@app.route('/repoexplorer/ownership')
+def file_ownership():
+    """Who owns the lines of 'file' (one of the files with most commits), now
+    and at checkpoints of its history; without a file, each file's lines and
+    top owner"""
+    name = request.args.get('repo') or repo()
+    if name not in allRepoNames() or catalog.path(name).suffix != '.gvz':
+        return json.dumps({'error': 'no imported artifact for {}'.format(name)}), 404
+    stored = artifacts.get(name, catalog.path(name))
+    owned = stored.ownership()
+    if owned is None:
+        return json.dumps({'error': '{} was imported without ownership, import it again'.format(name)}), 404
+    names, emails = stored.string_table('author_names'), stored.string_table('author_emails')
+
+    def authors(author_lines):
+        return [{'name': names[author_id], 'email': emails[author_id], 'lines': lines}
+                for author_id, lines in author_lines]
+
+    file = request.args.get('file')
+    if file is None:
+        files = [{'file': file, 'lines': info['lines'], 'owner': (authors(info['authors'][:1]) or [None])[0]}
+                 for file, info in sorted(owned.items(), key=lambda item: -item[1]['lines'])]
+        return app.response_class(json.dumps({'files': files}), mimetype='application/json')
+    if file not in owned:
+        return json.dumps({'error': 'no ownership of {} in {}'.format(file, name)}), 404
+    info = owned[file]
+    result = {
+        'file': file,
+        'lines': info['lines'],
+        'authors': authors(info['authors']),
+        'checkpoints': [{'commit_index': checkpoint['commit_index'], 'authors': authors(checkpoint['authors'])}
+                        for checkpoint in info['checkpoints']]
+    }
+    return app.response_class(json.dumps(result), mimetype='application/json')
+
+
+@app.route('/repoexplorer/refs')
+def repo_refs():
+    """The refs of a multi-ref import (none otherwise), each with which of the
+    get_repo commits it reaches, for filtering them by branch"""
+    name = request.args.get('repo') or repo()
+    if name not in allRepoNames() or catalog.path(name).suffix != '.gvz':
+        return json.dumps({'error': 'no imported artifact for {}'.format(name)}), 404
+    body = responseCache().get(name + '?refs', catalog.path(name), refsResponse)
+    return app.response_class(body, mimetype='application/json')
+
+
+def refsResponse(path):
+    membership = artifact.Artifact(path).refs()
+    if membership is None:
+        return json.dumps({'refs': []}).encode('utf-8')
+    names, bits = membership
+    return json.dumps({'refs': refs.descriptions(names.strings, bits)}).encode('utf-8')
+
+
+@app.route('/repoexplorer/cache')
+def cache_stats():
+    return json.dumps({
+        'responses': responseCache().stats(),
+        'catalog': catalog.stats()
+    })
+
+@app.route('/repoexplorer/imports', methods=['POST'])
+def enqueue_import():
+    """Imports the repo at the local 'path' in the background. Answers with the job,
+    the one already importing that repo if any ('created' is then false)."""
+    path = request.form.get('path') or (request.get_json(silent=True) or {}).get('path')
+    if not path or not os.path.isdir(path):
+        return json.dumps({'error': 'no repository at {}'.format(path)}), 400
+    job, created = jobQueue().submit(path)
+    return json.dumps({'job': job, 'created': created}), 202
+
+
+@app.route('/repoexplorer/imports', methods=['GET'])
+def import_jobs():
+    return json.dumps({'jobs': jobQueue().table.recent()})
+
+
+@app.route('/repoexplorer/imports/<int:job_id>', methods=['GET'])
+def import_job(job_id):
+    """The job's status, stage, commits walked (out of total) and ETA in seconds"""
+    job = jobQueue().table.get(job_id)
+    if job is None:
+        return json.dumps({'error': 'no such job: {}'.format(job_id)}), 404
+    return json.dumps({'job': job})
+
+
+@app.route('/repoexplorer/imports/<int:job_id>', methods=['DELETE'])
+def cancel_import(job_id):
+    job = jobQueue().table.cancel(job_id)
+    if job is None:
+        return json.dumps({'error': 'no such job: {}'.format(job_id)}), 404
+    return json.dumps({'job': job})
+
+@app.route('/metrics')
+def metrics_stats():
+    """Request & (in process) import timers and counters, cache stats,
+    and the latest entries of the import log"""
+    snapshot = metrics.registry.snapshot()
+    return app.response_class(json.dumps({
+        'timers': snapshot['timers'],
+        'counters': snapshot['counters'],
+        'cache': {
+            'responses': responseCache().stats(),
+            'catalog': catalog.stats()
+        },
+        'imports': metrics.recent_imports()
+    }), mimetype='application/json')
+
 # --------- UNUSED ---------
 
 @app.route('/vizdata')
 def vizdata():
-    dataPath = pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(reponame() + '.json')
+    dataPath = repoJsonPath(reponame())
     accesstime = dataPath.stat().st_mtime
     date = datetime.datetime.fromtimestamp(accesstime)
     repoJson = dataPath.read_text()
@@ -82,7 +446,7 @@ def vizdata():
 @app.route('/data')
 def data():
     # whether explicitly asked to reload from repo instead of cache
-    cachedPath = pathlib.Path.cwd().joinpath('gitviz/data/').joinpath(reponame()+ '.json')
+    cachedPath = repoJsonPath(reponame())
     if cachedPath.exists():
         accesstime = cachedPath.stat().st_mtime
         date = datetime.datetime.fromtimestamp(accesstime)
@@ -93,10 +457,9 @@ def data():
             'data': json.loads(repoJson)
         })
     else:
-        repoJson = git.analyze(repo())
-        print('-- loaded from repo {}'.format(repo()))
-        cachedPath.write_text(repoJson)
+        # analyzing can take minutes: import in the background, to be polled
+        job, _ = jobQueue().submit(repo())
         return json.dumps({
-            'source': 'repo',
-            'data': json.loads(repoJson)
-        })
+            'source': 'import',
+            'job': job
+        }), 202